@@ -0,0 +1,290 @@
+"""Scalability benchmarks, run against synthetic test corpora.
+
+Usage:
+
+    PYTHONPATH=. python benchmarks/bench.py --sizes 1000 10000 --output bench.json
+
+Each benchmark is timed on each corpus; the results are written as JSON.
+Passing --compare with an earlier results file reports any benchmark
+that has become slower.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from benchmarks import corpus
+from libs.history import HistoryStore
+from libs.model import TestMethod, UnittestProject
+from libs.runner import Runner
+
+
+class StreamProject(UnittestProject):
+    """A project whose executor replays recorded output, rather than running tests.
+
+    This isolates the cost of parsing results from the cost of the tests.
+    """
+
+    def __init__(self, stream):
+        super(StreamProject, self).__init__()
+        self.stream = stream
+
+    def execute_commandline(self, labels, testdir=None, **options):
+        return [
+            sys.executable,
+            "-c",
+            "import shutil, sys; "
+            "shutil.copyfileobj(open(sys.argv[1], 'rb'), sys.stdout.buffer)",
+            self.stream,
+        ]
+
+
+def timed(function, repeat=1):
+    "Return the best time, in seconds, of calling a function `repeat` times."
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_model(testdir, test_list):
+    "Time the operations on the project model."
+    results = {}
+
+    project = UnittestProject()
+    tracemalloc.start()
+    results["refresh_cold"] = timed(lambda: project.refresh(test_list))
+    results["refresh_cold_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    results["refresh_warm"] = timed(lambda: project.refresh(test_list), repeat=3)
+
+    results["find_tests_all"] = timed(lambda: project.find_tests(True), repeat=5)
+    results["test_paths"] = timed(lambda: project.test_paths(), repeat=3)
+
+    # Deactivating one test forces a full walk of the tree.
+    testMethod = project.get_node(test_list[0])
+    testMethod.set_active(False)
+    results["find_tests_partial"] = timed(lambda: project.find_tests(True), repeat=3)
+    testMethod.set_active(True)
+
+    def toggle_all():
+        for testModule in list(project.values()):
+            testModule.set_active(False)
+            testModule.set_active(True)
+
+    results["toggle_all"] = timed(toggle_all, repeat=3)
+    return results, project
+
+
+def bench_poll(testdir, test_list, kind, history=None):
+    "Time parsing the executor's output for every test, and recording the results."
+    stream = os.path.join(testdir, "stream-%s.txt" % kind)
+    corpus.write_stream(stream, test_list, kind)
+
+    project = StreamProject(stream)
+    project.refresh(test_list)
+    runner = Runner(project, len(test_list), [], testdir, history=history)
+
+    start = time.perf_counter()
+    while runner.poll():
+        time.sleep(0.01)
+    elapsed = time.perf_counter() - start
+    if history:
+        history.flush()
+        elapsed = time.perf_counter() - start
+
+    results = {
+        "poll_seconds": elapsed,
+        "poll_tests_per_second": runner.completed_count / elapsed if elapsed else None,
+        "poll_completed": runner.completed_count,
+        "find_tests_failed": timed(
+            lambda: project.find_tests(True, set(TestMethod.FAILING_STATES)), repeat=3
+        ),
+    }
+    return results, project
+
+
+def bench_view(project):
+    """Time populating the GUI tree with a project.
+
+    Needs a display; without one, the benchmark is skipped.
+    """
+    try:
+        from tkinter import TclError, Tk
+
+        from libs.view import MainWindow
+    except ImportError as e:
+        return {"view_skipped": str(e)}
+
+    try:
+        root = Tk()
+    except TclError as e:
+        return {"view_skipped": str(e)}
+
+    try:
+        root.withdraw()
+        view = MainWindow(root)
+
+        def populate():
+            view.project = project
+            root.update()
+
+        return {"view_populate": timed(populate)}
+    finally:
+        root.destroy()
+
+
+def run_benchmarks(sizes, kinds, workdir, view=True, history=True):
+    "Run every benchmark on a corpus of each size and kind, returning the results."
+    results = []
+    for kind in kinds:
+        for size in sizes:
+            testdir = os.path.join(workdir, "%s-%d" % (kind, size))
+            os.makedirs(testdir)
+            sys.stderr.write("Benchmarking %s corpus of %d tests...\n" % (kind, size))
+
+            generated = corpus.generate(testdir, size, kind)
+            entry = {"kind": kind, "size": size}
+
+            project = UnittestProject()
+            start = time.perf_counter()
+            test_list, errors = project.discover(testdir)
+            entry["discover"] = time.perf_counter() - start
+            entry["discovered"] = len(test_list)
+            if len(test_list) != len(generated):
+                entry["discover_errors"] = errors[:20]
+
+            model_results, project = bench_model(testdir, test_list)
+            entry.update(model_results)
+
+            poll_results, project = bench_poll(testdir, test_list, kind)
+            entry.update(poll_results)
+
+            if history:
+                store = HistoryStore(os.path.join(testdir, "history.sqlite3"))
+                try:
+                    poll_results, _ = bench_poll(testdir, test_list, kind, store)
+                finally:
+                    store.close()
+                entry["poll_history_seconds"] = poll_results["poll_seconds"]
+
+            if view:
+                entry.update(bench_view(project))
+
+            results.append(entry)
+    return results
+
+
+# Timings shorter than this are too noisy to compare.
+MIN_SECONDS = 0.001
+
+
+def compare(results, baseline, threshold):
+    "Return a description of every timing that is slower than in the baseline."
+    previous = {(entry["kind"], entry["size"]): entry for entry in baseline["results"]}
+    regressions = []
+    for entry in results:
+        old = previous.get((entry["kind"], entry["size"]))
+        if old is None:
+            continue
+        for name, value in sorted(entry.items()):
+            if not isinstance(value, float) or not isinstance(old.get(name), float):
+                continue
+            # Throughput is better when higher; everything else when lower.
+            if name.endswith("_per_second"):
+                ratio = old[name] / value if value else float("inf")
+            elif max(value, old[name]) < MIN_SECONDS:
+                continue
+            else:
+                ratio = value / old[name] if old[name] else float("inf")
+            if ratio > 1 + threshold:
+                regressions.append(
+                    "%s/%d %s: %0.4g -> %0.4g (%0.0f%% worse)"
+                    % (
+                        entry["kind"],
+                        entry["size"],
+                        name,
+                        old[name],
+                        value,
+                        (ratio - 1) * 100,
+                    )
+                )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run scalability benchmarks.")
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[1000, 10000, 100000],
+        help="Number of tests in each corpus.",
+    )
+    parser.add_argument(
+        "--kinds",
+        nargs="+",
+        choices=corpus.KINDS,
+        default=list(corpus.KINDS),
+        help="Kinds of corpus to generate.",
+    )
+    parser.add_argument("--output", help="File to write the JSON results to.")
+    parser.add_argument(
+        "--compare", help="An earlier results file to check for regressions."
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="Fraction slower than the baseline that counts as a regression.",
+    )
+    parser.add_argument("--no-view", dest="view", action="store_false")
+    parser.add_argument("--no-history", dest="history", action="store_false")
+    parser.add_argument(
+        "--keep", action="store_true", help="Keep the generated corpora."
+    )
+    options = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="pytest-gui-bench-")
+    try:
+        results = run_benchmarks(
+            options.sizes, options.kinds, workdir, options.view, options.history
+        )
+    finally:
+        if options.keep:
+            sys.stderr.write("Corpora kept in %s\n" % workdir)
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if options.output:
+        with open(options.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if options.compare:
+        with open(options.compare) as f:
+            regressions = compare(results, json.load(f), options.threshold)
+        for regression in regressions:
+            sys.stderr.write("REGRESSION: %s\n" % regression)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
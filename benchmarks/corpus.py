@@ -0,0 +1,140 @@
+import json
+import os
+import time
+
+from libs import pipes
+
+# The shapes of corpus that can be generated.
+KINDS = ("flat", "deep", "subtests", "output")
+
+# The number of nested packages above each module in a "deep" corpus.
+DEEP_PACKAGE_DEPTH = 6
+
+# The number of subtests in each test of a "subtests" corpus.
+SUBTEST_COUNT = 10
+
+# The size of the output printed by each test of an "output" corpus.
+OUTPUT_SIZE = 10000
+
+METHODS_PER_CLASS = 50
+CLASSES_PER_MODULE = 10
+
+
+def _module_dirs(root, index, kind):
+    "Return the directory, and the dotted package, holding a module."
+    if kind != "deep":
+        return root, ""
+    # Spread modules over a tree of packages, 4 wide at each level.
+    packages = []
+    for level in range(DEEP_PACKAGE_DEPTH):
+        packages.append("pkg%d_%d" % (level, (index >> (2 * level)) % 4))
+    return os.path.join(root, *packages), ".".join(packages) + "."
+
+
+def _method_source(kind, name):
+    if kind == "subtests":
+        return (
+            "    def %s(self):\n"
+            "        for i in range(%d):\n"
+            "            with self.subTest(i=i):\n"
+            "                pass\n" % (name, SUBTEST_COUNT)
+        )
+    if kind == "output":
+        return "    def %s(self):\n        sys.stdout.write(OUTPUT)\n" % name
+    return "    def %s(self):\n        pass\n" % name
+
+
+def generate(root, count, kind="flat"):
+    """Write a corpus of `count` unittest tests, of the given kind, under root.
+
+    Returns the dotted path of every test in the corpus.
+    """
+    if kind not in KINDS:
+        raise ValueError("Unknown corpus kind: %s" % kind)
+
+    per_module = METHODS_PER_CLASS * CLASSES_PER_MODULE
+    paths = []
+    module_index = 0
+    remaining = count
+    while remaining > 0:
+        directory, package = _module_dirs(root, module_index, kind)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        # Every directory on the way down must be a package.
+        parent = directory
+        while os.path.abspath(parent) != os.path.abspath(root):
+            init = os.path.join(parent, "__init__.py")
+            if not os.path.exists(init):
+                open(init, "w").close()
+            parent = os.path.dirname(parent)
+
+        module = "test_module%d" % module_index
+        source = ["import sys\nimport unittest\n\n"]
+        if kind == "output":
+            source.append("OUTPUT = %r\n\n" % ("x" * (OUTPUT_SIZE - 1) + "\n"))
+
+        in_module = min(remaining, per_module)
+        for method_index in range(in_module):
+            class_index, name_index = divmod(method_index, METHODS_PER_CLASS)
+            if name_index == 0:
+                source.append("\nclass TestCase%d(unittest.TestCase):\n" % class_index)
+            name = "test_%d" % name_index
+            source.append(_method_source(kind, name))
+            paths.append(
+                "%s%s.TestCase%d.%s" % (package, module, class_index, name)
+            )
+
+        with open(os.path.join(directory, module + ".py"), "w") as f:
+            f.write("".join(source))
+
+        remaining = remaining - in_module
+        module_index = module_index + 1
+
+    return paths
+
+
+def write_stream(filename, paths, kind="flat", failure_rate=0.01):
+    """Write the output the executor would produce running a corpus.
+
+    A fraction of the tests, given by failure_rate, are reported as failures.
+    """
+    every = int(1 / failure_rate) if failure_rate else 0
+    output = "x" * (OUTPUT_SIZE - 1) + "\n" if kind == "output" else ""
+    error = (
+        'Traceback (most recent call last):\n  File "test.py", line 1, in test\n'
+        "AssertionError\n"
+    )
+    with open(filename, "w") as f:
+        f.write("Running %d tests\n" % len(paths))
+        now = time.time()
+        for index, path in enumerate(paths):
+            f.write(
+                pipes.PipedTestRunner.START_TEST_RESULTS
+                if index == 0
+                else pipes.PipedTestResult.RESULT_SEPARATOR
+            )
+            f.write("\n%s\n" % json.dumps({"path": path, "start_time": now}))
+            failed = every and index % every == every - 1
+            post = {
+                "status": "F" if failed else "OK",
+                "end_time": now + 0.001,
+                "description": "No description",
+                "output": output,
+            }
+            if kind == "subtests":
+                # Each subtest is reported on a line of its own; the
+                # error of a failed test belongs to its last subtest.
+                for number in range(SUBTEST_COUNT):
+                    subtest = {
+                        "name": "(i=%d)" % number,
+                        "status": "OK",
+                        "duration": 0.0001,
+                    }
+                    if failed and number == SUBTEST_COUNT - 1:
+                        subtest["status"] = "F"
+                        subtest["error"] = error
+                    f.write(json.dumps({"subtest": subtest}) + "\n")
+            elif failed:
+                post["error"] = error
+            f.write(json.dumps(post) + "\n")
+        f.write(pipes.PipedTestRunner.END_TEST_RESULTS + "\n")
@@ -0,0 +1,197 @@
+import json
+import os
+import time
+
+from libs.events import EventSource
+from libs.model import TestMethod
+
+
+class Checkpoint(object):
+    """An append-only journal of the results of a run, so it can be resumed.
+
+    The journal is a file of JSON lines: a header naming every test in
+    the run, then a line for each result as it arrives, and a last line
+    once the run has finished. If the run is cut short (the GUI crashes,
+    or the machine reboots), the journal holds every result up to that
+    point, and the run can be resumed from there.
+
+    Each line is written out as soon as the result arrives, but the journal
+    is only synced to disk (with fsync) every SYNC_INTERVAL seconds, or
+    every SYNC_RESULTS results, whichever comes first; a crash of the
+    machine itself loses, at most, the results since the last sync.
+    """
+
+    SYNC_INTERVAL = 1.0
+
+    SYNC_RESULTS = 200
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+        # The results written since the journal was last synced, and when that was.
+        self._unsynced = 0
+        self._synced = time.monotonic()
+
+    def start(self, testdir, paths):
+        "Start the journal of a new run of the given tests, replacing any other."
+        self._file = open(self.path, "w")
+        self._write(
+            {
+                "run": {
+                    "testdir": os.path.abspath(testdir),
+                    "started": time.time(),
+                    "paths": paths,
+                }
+            }
+        )
+        self.sync(force=True)
+
+    def resume(self):
+        "Reopen the journal of an unfinished run, to add the results of the rest of it."
+        self._file = open(self.path, "a+")
+        # A line cut off part way through is left on a line of its own.
+        if self._file.tell():
+            self._file.seek(self._file.tell() - 1)
+            if self._file.read(1) != "\n":
+                self._file.write("\n")
+        self._write({"resumed": time.time()})
+        self.sync(force=True)
+
+    def _write(self, entry):
+        self._file.write(json.dumps(entry, separators=(",", ":")) + "\n")
+
+    def record(self, path, status, duration, output=None, error=None, **details):
+        "Record the final result of a test."
+        if self._file is None:
+            return
+        result = {
+            "path": path,
+            "status": status,
+            "duration": duration,
+            "output": output,
+            "error": error,
+        }
+        result.update(details)
+        self._write({"result": result})
+        # Flushing hands the line to the OS, so only a crash of the
+        # machine (not of the GUI) can lose it before it is synced.
+        self._file.flush()
+        self._unsynced = self._unsynced + 1
+        self.sync()
+
+    def sync(self, force=False):
+        "Sync the journal to disk, if enough time has passed, or results arrived."
+        if self._file is None or not (force or self._unsynced):
+            return
+        if (
+            force
+            or self._unsynced >= self.SYNC_RESULTS
+            or time.monotonic() - self._synced >= self.SYNC_INTERVAL
+        ):
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._unsynced = 0
+            self._synced = time.monotonic()
+
+    def finish(self):
+        "Record that the run finished, so there is nothing left to resume, and close."
+        if self._file is None:
+            return
+        self._write({"finished": time.time()})
+        self.close()
+
+    def close(self):
+        "Sync and close the journal."
+        if self._file is None:
+            return
+        self.sync(force=True)
+        self._file.close()
+        self._file = None
+
+
+class SavedRun(object):
+    "The tests and results of a run, read back from its journal."
+
+    def __init__(self, testdir, started, paths):
+        self.testdir = testdir
+        self.started = started
+        self.paths = paths
+
+        # The last result recorded for each test, keyed by test path.
+        self.results = {}
+        self.finished = False
+
+    @classmethod
+    def load(cls, path):
+        """Read the journal of a run, or return None if there isn't one.
+
+        A line that was only partly written when the run was cut short is ignored.
+        """
+        try:
+            journal = open(path)
+        except (IOError, OSError):
+            return None
+
+        saved = None
+        with journal:
+            for line in journal:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if "run" in entry:
+                    header = entry["run"]
+                    saved = cls(header["testdir"], header["started"], header["paths"])
+                elif saved is None:
+                    continue
+                elif "result" in entry:
+                    saved.results[entry["result"]["path"]] = entry["result"]
+                elif "finished" in entry:
+                    saved.finished = True
+        return saved
+
+    def ran_in(self, testdir):
+        """Return True if the run was of the tests in a directory.
+
+        A journal copied or moved along with its test directory still
+        names the directory it was written in; it can't be resumed in
+        another one.
+        """
+        return os.path.realpath(self.testdir) == os.path.realpath(testdir)
+
+    @property
+    def completed(self):
+        "The paths of the tests that have a result that needn't be run again."
+        return {
+            path
+            for path, result in self.results.items()
+            if result["status"] != TestMethod.STATUS_INTERRUPTED
+        }
+
+    def remaining(self, project):
+        "Return the paths of the tests still to run, that are still in the project."
+        completed = self.completed
+        return [
+            path
+            for path in self.paths
+            if path not in completed and project.has_node(path)
+        ]
+
+    def restore(self, project):
+        """Load the completed results of the run into a project.
+
+        Results for tests that are no longer in the project are ignored.
+        Returns the number of results restored.
+        """
+        count = 0
+        with EventSource.batched():
+            for path in self.completed:
+                testMethod = project.find_node(path)
+                if not isinstance(testMethod, TestMethod):
+                    continue
+                details = dict(self.results[path])
+                del details["path"]
+                testMethod.set_result(**details)
+                count = count + 1
+        return count
@@ -0,0 +1,427 @@
+import argparse
+import os
+import sqlite3
+import sys
+import time
+
+from libs.checkpoint import Checkpoint, SavedRun
+from libs.constants import CHECKPOINT_FILENAME, DEFAULT_TEST_DIR, HISTORY_FILENAME
+from libs.history import HistoryStore
+from libs.junit import JUnitXMLWriter
+from libs.model import ModelLoadError, TestMethod, UnittestProject
+from libs.ordering import ORDER_DISCOVERY, ORDERINGS
+from libs.regression import describe
+from libs.runner import Runner
+
+# Exit status codes
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_ERROR = 2
+EXIT_INTERRUPTED = 130
+
+# Short labels used when reporting individual results
+RESULT_LABELS = {
+    TestMethod.STATUS_FAIL: "FAIL",
+    TestMethod.STATUS_ERROR: "ERROR",
+    TestMethod.STATUS_UNEXPECTED_SUCCESS: "UNEXPECTED SUCCESS",
+}
+
+
+def terminal_width(stream, default=80):
+    "Return the width of the terminal attached to a stream."
+    try:
+        return os.get_terminal_size(stream.fileno()).columns
+    except (AttributeError, ValueError, OSError):
+        return default
+
+
+class ConsoleReporter(object):
+    """Report the progress and results of a run on the console.
+
+    When the stream is a terminal, progress is shown as a single line that
+    is redrawn in place, at most once per REFRESH_INTERVAL, so reporting
+    costs next to nothing per test. Otherwise, only failures and the final
+    summary are written, which suits CI logs.
+    """
+
+    REFRESH_INTERVAL = 0.1
+
+    def __init__(self, runner, stream=sys.stderr, output=sys.stdout):
+        self.runner = runner
+        self.stream = stream
+        self.output = output
+        self.interactive = stream.isatty()
+        self.width = terminal_width(stream) - 1
+
+        self.current_test = ""
+        self.remaining_time = ""
+        self.failures = []
+        self.flaky = []
+        self.error = None
+        self.suite_error = None
+        self.start_time = time.time()
+
+        # The time, and length, of the last progress line drawn.
+        self._drawn_at = 0.0
+        self._drawn_length = 0
+
+        Runner.bind("test_start", self.on_test_start)
+        Runner.bind("test_end", self.on_test_end)
+        Runner.bind("suite_end", self.on_suite_end)
+        Runner.bind("suite_error", self.on_suite_error)
+
+    def on_test_start(self, runner, test_path):
+        "Event handler: the runner has started running a test"
+        if runner is self.runner:
+            self.current_test = test_path
+            self.draw()
+
+    def on_test_end(self, runner, test_path, result, remaining_time):
+        "Event handler: the runner has finished running a test"
+        if runner is not self.runner:
+            return
+        self.remaining_time = remaining_time
+        if result == TestMethod.STATUS_FLAKY:
+            self.flaky.append(test_path)
+        if result in TestMethod.FAILING_STATES:
+            self.failures.append(test_path)
+            self.clear()
+            self.stream.write("%s: %s\n" % (RESULT_LABELS[result], test_path))
+        self.draw()
+
+    def on_suite_end(self, runner, error=None):
+        "Event handler: the runner has finished"
+        if runner is self.runner:
+            self.error = error
+
+    def on_suite_error(self, runner, error):
+        "Event handler: the runner stopped before finishing"
+        if runner is self.runner:
+            self.suite_error = error
+
+    def draw(self, force=False):
+        "Redraw the progress line, if it hasn't been drawn too recently."
+        if not self.interactive:
+            return
+        now = time.time()
+        if not force and now - self._drawn_at < self.REFRESH_INTERVAL:
+            return
+        self._drawn_at = now
+
+        line = "[%d/%d] %d failed, %s left  %s" % (
+            self.runner.completed_count,
+            self.runner.total_count,
+            self.runner.any_failed,
+            self.remaining_time or "?",
+            self.current_test,
+        )
+        line = line[: self.width]
+        self.stream.write("\r" + line.ljust(self._drawn_length))
+        self.stream.flush()
+        self._drawn_length = len(line)
+
+    def clear(self):
+        "Remove the progress line, so other output can be written."
+        if self.interactive and self._drawn_length:
+            self.stream.write("\r" + " " * self._drawn_length + "\r")
+            self._drawn_length = 0
+
+    def summary(self):
+        "Write the errors of every failing test, and the final counts."
+        self.clear()
+        # In a stress run, a test can fail many times, or fail and then
+        # pass; each is reported once, as it ended up.
+        reported = []
+        for test_path in dict.fromkeys(self.failures):
+            testMethod = self.runner.project.get_node(test_path)
+            label = RESULT_LABELS.get(testMethod.status, "FLAKY")
+            self.output.write("=" * 70 + "\n")
+            self.output.write("%s: %s\n" % (label, test_path))
+            self.output.write("-" * 70 + "\n")
+            self.output.write((testMethod.error or "").rstrip() + "\n")
+            reported.append(test_path)
+        if reported:
+            self.output.write("=" * 70 + "\n")
+
+        flaky = [path for path in self.flaky if path not in reported]
+        if flaky:
+            self.output.write("Flaky tests (passed on a retry):\n")
+            for test_path in flaky:
+                testMethod = self.runner.project.get_node(test_path)
+                self.output.write(
+                    "  %s (%d attempts)\n" % (test_path, testMethod.attempts or 0)
+                )
+
+        if self.runner.repeats:
+            self.output.write("Runs of each test:\n")
+            for test_path, stats in sorted(self.runner.repeats.items()):
+                self.output.write("  %s: %s\n" % (test_path, stats.describe()))
+
+        if self.error:
+            self.output.write("Errors reported by the test suite:\n")
+            self.output.write(self.error.rstrip() + "\n")
+        if self.suite_error:
+            self.output.write("Error running test suite:\n")
+            self.output.write(self.suite_error.rstrip() + "\n")
+
+        regressions = self.runner.regressions.top()
+        if regressions:
+            self.output.write("Tests slower than usual:\n")
+            for test_path, regression in regressions:
+                self.output.write("  %s\n" % describe(test_path, regression))
+
+        message = ", ".join(
+            "%d %s" % (count, TestMethod.STATUS_LABELS[state])
+            for state, count in sorted(self.runner.result_count.items())
+        )
+        if self.runner.stopped_early:
+            self.output.write(
+                "Stopped at the failure limit (%d).\n" % self.runner.max_failures
+            )
+        if self.runner.profile_dir:
+            self.output.write("Profiles saved in %s\n" % self.runner.profile_dir)
+        self.output.write(
+            "Ran %d of %d %s in %0.2fs: %s\n"
+            % (
+                self.runner.completed_count,
+                self.runner.total_count,
+                "test runs" if self.runner.repeat > 1 else "tests",
+                time.time() - self.start_time,
+                message or "no results",
+            )
+        )
+        self.output.flush()
+
+
+def open_history(testdir):
+    "Return the run history store for a test directory, or None if it can't be opened."
+    try:
+        return HistoryStore(os.path.join(testdir, HISTORY_FILENAME))
+    except sqlite3.Error as e:
+        sys.stderr.write("Unable to open the run history: %s\n" % e)
+        return None
+
+
+def main(argv=None):
+    "Run tests without a GUI, reporting progress on the console."
+    parser = argparse.ArgumentParser(description="Run tests without a GUI.")
+    parser.add_argument(
+        "--testdir",
+        dest="testdir",
+        default=DEFAULT_TEST_DIR,
+        help="Directory to search for test cases.",
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        dest="workers",
+        type=int,
+        default=1,
+        help="Number of subprocesses to run tests in parallel.",
+    )
+    parser.add_argument(
+        "--rerun-failed",
+        dest="rerun_failed",
+        action="store_true",
+        help="Only run the tests that failed in the most recent recorded run.",
+    )
+    parser.add_argument(
+        "--resume",
+        dest="resume",
+        action="store_true",
+        help="Resume the last run, if it was cut short: restore its results, and "
+        "only run the tests that hadn't finished.",
+    )
+    parser.add_argument(
+        "--max-failures",
+        dest="max_failures",
+        type=int,
+        metavar="N",
+        help="Stop the run once N tests have failed.",
+    )
+    parser.add_argument(
+        "-x",
+        "--failfast",
+        dest="max_failures",
+        action="store_const",
+        const=1,
+        help="Stop the run at the first failure.",
+    )
+    parser.add_argument(
+        "--timeout",
+        dest="timeout",
+        type=float,
+        metavar="SECONDS",
+        help="Fail any test that runs for longer than this, unless it sets its "
+        "own __timeout__.",
+    )
+    parser.add_argument(
+        "--retries",
+        dest="retries",
+        type=int,
+        default=0,
+        metavar="K",
+        help="Run a failing test up to K more times; it is flaky if any retry passes.",
+    )
+    parser.add_argument(
+        "--repeat",
+        dest="repeat",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Run every test N times (a stress run), across the workers, and report "
+        "the pass rate and spread of durations of each.",
+    )
+    parser.add_argument(
+        "--order",
+        dest="order",
+        choices=ORDERINGS,
+        default=ORDER_DISCOVERY,
+        help="The order to run tests in; failed-first runs the tests that failed "
+        "last time first, then tests in recently modified files, then tests "
+        "that fail often.",
+    )
+    parser.add_argument(
+        "--profile",
+        dest="profile",
+        action="store_true",
+        help="Run each test under a profiler, saving its stats.",
+    )
+    parser.add_argument(
+        "--trace-allocations",
+        dest="trace_allocations",
+        action="store_true",
+        help="Trace the memory allocated by each test.",
+    )
+    parser.add_argument(
+        "--junit-xml",
+        dest="junit_xml",
+        help="Stream the results to a JUnit XML file as the tests finish.",
+    )
+    parser.add_argument(
+        "--no-history",
+        dest="history",
+        action="store_false",
+        help="Don't record the run in the run history.",
+    )
+    parser.add_argument("labels", nargs="*", help="Test labels to run.")
+    options = parser.parse_args(argv)
+
+    if options.rerun_failed and not options.history:
+        parser.error("--rerun-failed needs the run history")
+    if options.resume and (options.rerun_failed or options.labels):
+        parser.error("--resume runs the rest of the last run; it takes no labels")
+
+    project = UnittestProject()
+    try:
+        project.refresh(*project.discover(options.testdir))
+    except ModelLoadError as e:
+        sys.stderr.write(e.trace + "\n")
+        return EXIT_ERROR
+    for error in project.errors:
+        sys.stderr.write(error + "\n")
+
+    labels = set(options.labels) or None
+    if labels:
+        unknown = sorted(label for label in labels if not project.has_node(label))
+        if unknown:
+            parser.error("unknown test labels: %s" % ", ".join(unknown))
+
+    history = open_history(options.testdir) if options.history else None
+    checkpoint_path = os.path.join(options.testdir, CHECKPOINT_FILENAME)
+    try:
+        status = None
+        restored_failures = 0
+        if options.resume:
+            saved = SavedRun.load(checkpoint_path)
+            if saved is None or saved.finished:
+                sys.stdout.write("There is no unfinished run to resume.\n")
+                return EXIT_OK
+            if not saved.ran_in(options.testdir):
+                sys.stderr.write(
+                    "The unfinished run was of the tests in %s, not %s.\n"
+                    % (saved.testdir, options.testdir)
+                )
+                return EXIT_ERROR
+            restored = saved.restore(project)
+            restored_failures = sum(
+                project.status_count.get(state, 0)
+                for state in TestMethod.FAILING_STATES
+            )
+            labels = set(saved.remaining(project))
+            sys.stdout.write(
+                "Restored %d results from the last run (%d failed); "
+                "%d tests left to run.\n" % (restored, restored_failures, len(labels))
+            )
+            if not labels:
+                return EXIT_FAILED if restored_failures else EXIT_OK
+
+        if options.rerun_failed:
+            if history is None:
+                return EXIT_ERROR
+            runs = history.runs(1)
+            if runs:
+                history.load_run(project, runs[0][0])
+            status = set(TestMethod.FAILING_STATES)
+
+        count, labels = project.find_tests(not options.resume, status, labels)
+        if not count:
+            sys.stdout.write("No tests to run.\n")
+            return EXIT_OK
+
+        runner = Runner(
+            project,
+            count,
+            labels,
+            options.testdir,
+            history=history,
+            workers=options.workers,
+            profile=options.profile,
+            trace_allocations=options.trace_allocations,
+            order=options.order,
+            max_failures=options.max_failures,
+            timeout=options.timeout,
+            retries=options.retries,
+            repeat=options.repeat,
+            checkpoint=Checkpoint(checkpoint_path),
+            resume=options.resume,
+        )
+        reporter = ConsoleReporter(runner)
+        writer = None
+        if options.junit_xml:
+            writer = JUnitXMLWriter(options.junit_xml)
+            writer.attach(runner)
+
+        try:
+            while runner.poll():
+                time.sleep(0.05)
+        except KeyboardInterrupt:
+            # Let the workers report the tests they were running; a second
+            # interrupt kills them straight away.
+            reporter.clear()
+            sys.stderr.write("Stopping (interrupt again to kill the tests)...\n")
+            runner.stop()
+            try:
+                while runner.poll():
+                    time.sleep(0.05)
+            except KeyboardInterrupt:
+                runner.kill()
+                while runner.poll():
+                    time.sleep(0.05)
+            reporter.summary()
+            return EXIT_INTERRUPTED
+        finally:
+            if writer:
+                writer.close()
+
+        reporter.summary()
+        if reporter.suite_error:
+            return EXIT_ERROR
+        return EXIT_FAILED if runner.any_failed or restored_failures else EXIT_OK
+    finally:
+        if history:
+            history.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
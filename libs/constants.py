@@ -2,3 +2,12 @@
 
 DEFAULT_TEST_DIR = 'tests'
 """Default directory for test files."""
+
+HISTORY_FILENAME = '.pytest-gui-history.sqlite3'
+"""Name of the run history database, stored in the test directory."""
+
+CHECKPOINT_FILENAME = '.pytest-gui-checkpoint.jsonl'
+"""Name of the journal of the last run's results, stored in the test directory."""
+
+PROFILE_DIRNAME = '.pytest-gui-profiles'
+"""Directory of the last profiled run's stats, stored in the test directory."""
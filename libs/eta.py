@@ -0,0 +1,181 @@
+import math
+
+
+def median(values):
+    "Return the median of a non-empty list of numbers."
+    values = sorted(values)
+    middle = len(values) // 2
+    if len(values) % 2:
+        return values[middle]
+    return (values[middle - 1] + values[middle]) / 2.0
+
+
+def format_duration(seconds):
+    "Format a duration in seconds for display, e.g. '45s', '12 min', '2 hr 5 min'."
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return "%ss" % seconds
+    minutes = seconds // 60
+    if minutes < 60:
+        return "%s min" % minutes
+    hours, minutes = divmod(minutes, 60)
+    if minutes:
+        return "%s hr %s min" % (hours, minutes)
+    return "%s hr" % hours
+
+
+class ETAEstimator(object):
+    """Predict how long the remainder of a run will take.
+
+    Each test's duration is predicted from the median of its own most
+    recent recorded durations. Tests with no history are predicted from the other tests
+    in their TestCase, or failing that their module; anything still
+    unknown is predicted from the mean duration of the tests completed
+    so far in this run.
+
+    As tests complete, the predictions are calibrated by how far off they
+    were, and the spread of those errors gives a confidence band, which
+    narrows as more tests complete. When tests are split between parallel
+    workers, the run ends when the slowest worker's share is done.
+    """
+
+    # The confidence band, as a factor either side of the estimate,
+    # before there is any evidence of how good the predictions are.
+    PRIOR_SPREAD = 0.5
+
+    # The factor either side of the estimate used for tests with no
+    # prediction of their own.
+    UNKNOWN_SPREAD = 1.0
+
+    def __init__(self, shares, history=None, runs=5):
+        # The last `runs` durations recorded for each test, newest first.
+        recorded = history.recent_durations(runs) if history else {}
+
+        self._predicted = {}
+        self._by_case = {}
+        self._by_module = {}
+        for path, durations in recorded.items():
+            predicted = median(durations)
+            self._predicted[path] = predicted
+            case = path.rpartition(".")[0]
+            self._by_case.setdefault(case, []).append(predicted)
+            self._by_module.setdefault(case.rpartition(".")[0], []).append(predicted)
+        self._by_case = {path: median(values) for path, values in self._by_case.items()}
+        self._by_module = {
+            path: median(values) for path, values in self._by_module.items()
+        }
+
+        # For each worker's share of the tests: the sum of the predicted
+        # durations of the tests that haven't completed, and the number
+        # of those tests with no prediction.
+        self.pending_known = [0.0] * len(shares)
+        self.pending_unknown = [0] * len(shares)
+
+        # The share, and prediction, of each test that hasn't completed;
+        # a test repeated in a run is pending once for each repetition.
+        self._pending = {}
+        for index, share in enumerate(shares):
+            for path in share:
+                predicted = self.predict(path)
+                self._pending.setdefault(path, []).append((index, predicted))
+                if predicted is None:
+                    self.pending_unknown[index] += 1
+                else:
+                    self.pending_known[index] += predicted
+
+        # Running totals of the durations completed in this run.
+        self.completed_count = 0
+        self.completed_duration = 0.0
+
+        # Running statistics (Welford's method) of the log of the ratio
+        # between actual and predicted durations.
+        self._error_count = 0
+        self._error_mean = 0.0
+        self._error_m2 = 0.0
+
+    def predict(self, path):
+        "Return the predicted duration of a test, or None if there is no basis for one."
+        if path in self._predicted:
+            return self._predicted[path]
+        case = path.rpartition(".")[0]
+        if case in self._by_case:
+            return self._by_case[case]
+        return self._by_module.get(case.rpartition(".")[0])
+
+    def test_end(self, path, duration):
+        "Record that a test has completed, taking the given duration."
+        self.completed_count = self.completed_count + 1
+        self.completed_duration = self.completed_duration + duration
+
+        pending = self._pending.get(path)
+        if not pending:
+            # Not a test that was expected in this run.
+            return
+        index, predicted = pending.pop(0)
+        if not pending:
+            del self._pending[path]
+
+        if predicted is None:
+            self.pending_unknown[index] -= 1
+            return
+        self.pending_known[index] -= predicted
+
+        # Tests too quick to time reliably say nothing about the predictions.
+        if predicted > 0.001 and duration > 0.001:
+            error = math.log(duration / predicted)
+            self._error_count = self._error_count + 1
+            delta = error - self._error_mean
+            self._error_mean = self._error_mean + delta / self._error_count
+            self._error_m2 = self._error_m2 + delta * (error - self._error_mean)
+
+    @property
+    def calibration(self):
+        "The factor by which the predictions have been out, so far in this run."
+        return math.exp(self._error_mean)
+
+    @property
+    def spread(self):
+        "The log-scale half-width of the confidence band for predicted tests."
+        if self._error_count < 2:
+            return self.PRIOR_SPREAD
+        deviation = math.sqrt(self._error_m2 / (self._error_count - 1))
+        # Approximately 95% confidence in the calibrated mean.
+        return min(self.PRIOR_SPREAD, 1.96 * deviation / math.sqrt(self._error_count))
+
+    def estimate(self):
+        """Return the (low, expected, high) number of seconds remaining.
+
+        Returns None if there is no basis for an estimate yet.
+        """
+        if self.completed_count:
+            unknown = self.completed_duration / self.completed_count
+        elif self._predicted:
+            unknown = median(self._predicted.values())
+        else:
+            return None
+
+        calibration = self.calibration
+        spread = math.exp(self.spread)
+        unknown_spread = 1.0 + self.UNKNOWN_SPREAD
+
+        low = expected = high = 0.0
+        for known, count in zip(self.pending_known, self.pending_unknown):
+            known = max(known, 0.0) * calibration
+            low = max(low, known / spread + count * unknown / unknown_spread)
+            expected = max(expected, known + count * unknown)
+            high = max(high, known * spread + count * unknown * unknown_spread)
+        return low, expected, high
+
+    def describe(self):
+        "Describe the remaining time for display, e.g. '12 min (10 min-15 min)'."
+        estimate = self.estimate()
+        if estimate is None:
+            return "?"
+        low, expected, high = estimate
+        if format_duration(low) == format_duration(high):
+            return format_duration(expected)
+        return "%s (%s-%s)" % (
+            format_duration(expected),
+            format_duration(low),
+            format_duration(high),
+        )
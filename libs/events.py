@@ -1,22 +1,109 @@
+import weakref
+from contextlib import contextmanager
+
+
 class EventSource:
     """Generate and handle GUI events."""
 
+    # Handlers registered for each event source class, keyed by class and
+    # then by event name. Each handler is stored as a (reference, batch) pair.
     _events = {}
 
+    # Events emitted while a batch is open, in emission order.
+    # None when events are being dispatched immediately.
+    _pending = None
+
+    @staticmethod
+    def _reference(handler, callback):
+        """Return a callable that resolves to the handler.
+
+        Bound methods are held weakly, so that binding a handler doesn't
+        keep the object that owns it alive; the callback is invoked when
+        the owner is garbage collected. Any other callable is held strongly.
+        """
+        if hasattr(handler, "__self__") and hasattr(handler, "__func__"):
+            return weakref.WeakMethod(handler, callback)
+        return lambda: handler
+
     @classmethod
-    def bind(cls, event: str, handler):
+    def bind(cls, event: str, handler, batch=False):
         """
         Bind an event to a handler function.
 
+        Binding the same handler to the same event more than once has no effect.
+
         Args:
             event (str): The name of the event.
             handler (callable): The function to call when the event is emitted.
+            batch (bool): If True, the handler is called with a list of senders
+                and a list of their event data, rather than once per sender.
+        """
+        handlers = cls._events.setdefault(cls, {}).setdefault(event, [])
+        for reference, is_batch in handlers:
+            if reference() == handler:
+                return
+
+        def discard(reference):
+            # The owner of the handler has gone away; forget the handler.
+            handlers[:] = [entry for entry in handlers if entry[0] is not reference]
+
+        handlers.append((cls._reference(handler, discard), batch))
+
+    @classmethod
+    def unbind(cls, event: str, handler):
         """
-        if cls not in cls._events:
-            cls._events[cls] = {}
-        if event not in cls._events[cls]:
-            cls._events[cls][event] = []
-        cls._events[cls][event].append(handler)
+        Remove a handler previously bound to an event.
+
+        Args:
+            event (str): The name of the event.
+            handler (callable): The handler to remove.
+        """
+        handlers = cls._events.get(cls, {}).get(event)
+        if handlers:
+            handlers[:] = [entry for entry in handlers if entry[0]() != handler]
+
+    @staticmethod
+    @contextmanager
+    def batched():
+        """
+        Defer all events emitted inside the block until the block exits.
+
+        On exit, ordinary handlers are called once per emitted event, in
+        emission order; batch handlers are called once per event name, with
+        every sender of that event. Nested batches are folded into the
+        outermost one.
+        """
+        if EventSource._pending is not None:
+            yield
+            return
+
+        EventSource._pending = pending = []
+        try:
+            yield
+        finally:
+            EventSource._pending = None
+            EventSource._dispatch(pending)
+
+    @classmethod
+    def _dispatch(cls, emitted):
+        "Invoke the handlers for a list of (source class, event, sender, data) tuples."
+        batches = {}
+        for source_class, event, sender, data in emitted:
+            handlers = cls._events.get(source_class, {}).get(event, [])
+            # Iterate over a copy; handlers may bind or unbind as a side effect.
+            for reference, batch in list(handlers):
+                handler = reference()
+                if handler is None:
+                    continue
+                if batch:
+                    senders, payloads = batches.setdefault((event, handler), ([], []))
+                    senders.append(sender)
+                    payloads.append(data)
+                else:
+                    handler(sender, **data)
+
+        for (event, handler), (senders, payloads) in batches.items():
+            handler(senders, payloads)
 
     def emit(self, event: str, **data):
         """
@@ -26,6 +113,8 @@ class EventSource:
             event (str): The name of the event to emit.
             **data: Additional data to pass to the handler functions.
         """
-        handlers = self._events.get(self.__class__, {}).get(event, [])
-        for handler in handlers:
-            handler(self, **data)
+        emitted = (self.__class__, event, self, data)
+        if EventSource._pending is not None:
+            EventSource._pending.append(emitted)
+        else:
+            self._dispatch([emitted])
@@ -0,0 +1,351 @@
+import sqlite3
+import sys
+import time
+from threading import Thread
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue  # python 3.x
+
+from libs.events import EventSource
+from libs.model import TestMethod
+from libs.pipes import CLASS_FIXTURES, MODULE_FIXTURES
+from libs.results import error_signature
+
+
+class HistoryStore(object):
+    """A persistent record of test runs, stored in a local SQLite database.
+
+    Reads happen on the calling thread. Writes are queued, and applied in
+    batches by a background thread, so recording results never blocks
+    the GUI.
+    """
+
+    # Schema migrations. The database's user_version records how many
+    # of these have been applied.
+    MIGRATIONS = [
+        """
+        CREATE TABLE runs (
+            id INTEGER PRIMARY KEY,
+            started REAL NOT NULL,
+            finished REAL,
+            testdir TEXT
+        );
+        CREATE TABLE results (
+            run_id INTEGER NOT NULL REFERENCES runs (id),
+            path TEXT NOT NULL,
+            status INTEGER NOT NULL,
+            duration REAL,
+            error_signature TEXT,
+            timestamp REAL NOT NULL
+        );
+        CREATE INDEX results_path ON results (path, run_id);
+        CREATE INDEX results_run ON results (run_id, status);
+        """,
+        """
+        CREATE TABLE phases (
+            run_id INTEGER NOT NULL REFERENCES runs (id),
+            path TEXT NOT NULL,
+            phase TEXT NOT NULL,
+            duration REAL NOT NULL
+        );
+        CREATE INDEX phases_run ON phases (run_id, path);
+        CREATE INDEX phases_path ON phases (path, phase);
+        """,
+    ]
+
+    # The largest number of queued writes applied in a single transaction.
+    BATCH_SIZE = 500
+
+    def __init__(self, path):
+        self.path = path
+
+        self._conn = self._connect()
+        self._migrate()
+
+        # Queued writes: (sql, params, reply) tuples, or None to stop.
+        self._writes = Queue()
+        self._writer = Thread(target=self._write_loop)
+        self._writer.daemon = True
+        self._writer.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _migrate(self):
+        "Bring the database schema up to date."
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, script in enumerate(self.MIGRATIONS[version:], version + 1):
+            self._conn.executescript(script)
+            self._conn.execute("PRAGMA user_version = %d" % number)
+            self._conn.commit()
+
+    def _write_loop(self):
+        "The body of the writer thread: apply queued writes in batches."
+        conn = self._connect()
+        running = True
+        while running:
+            batch = [self._writes.get()]
+            while len(batch) < self.BATCH_SIZE and not self._writes.empty():
+                batch.append(self._writes.get())
+
+            # Stop after this batch, even if one of its writes fails.
+            if None in batch:
+                running = False
+
+            try:
+                with conn:
+                    for item in batch:
+                        if item is None:
+                            continue
+                        sql, params, reply = item
+                        cursor = conn.execute(sql, params)
+                        if reply is not None:
+                            reply.put(cursor.lastrowid)
+            except sqlite3.Error as e:
+                sys.stderr.write("Unable to record test history: %s\n" % e)
+                # Don't leave anyone waiting on a write that failed.
+                for item in batch:
+                    if item is not None and item[2] is not None:
+                        item[2].put(None)
+            finally:
+                for item in batch:
+                    self._writes.task_done()
+        conn.close()
+
+    def _write(self, sql, params, wait=False):
+        "Queue a write. If wait is True, block until it has been applied."
+        reply = Queue() if wait else None
+        self._writes.put((sql, params, reply))
+        if wait:
+            return reply.get()
+
+    def start_run(self, testdir=None):
+        "Record the start of a new run, returning its id."
+        return self._write(
+            "INSERT INTO runs (started, testdir) VALUES (?, ?)",
+            (time.time(), testdir),
+            wait=True,
+        )
+
+    def finish_run(self, run_id):
+        "Record the end of a run."
+        self._write("UPDATE runs SET finished = ? WHERE id = ?", (time.time(), run_id))
+
+    def record(self, run_id, path, status, duration, error=None, timestamp=None):
+        "Record the result of a single test in a run."
+        self._write(
+            "INSERT INTO results "
+            "(run_id, path, status, duration, error_signature, timestamp) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                run_id,
+                path,
+                status,
+                duration,
+                error_signature(error),
+                timestamp if timestamp is not None else time.time(),
+            ),
+        )
+
+    def record_phase(self, run_id, path, phase, duration):
+        """Record the time taken by one phase of a run.
+
+        The path is a test, for its setUp, test and tearDown phases, or a
+        test class or module, for its fixtures.
+        """
+        self._write(
+            "INSERT INTO phases (run_id, path, phase, duration) VALUES (?, ?, ?, ?)",
+            (run_id, path, phase, duration),
+        )
+
+    def flush(self):
+        "Block until all queued writes have been applied."
+        self._writes.join()
+
+    def close(self):
+        "Apply any queued writes, and close the database."
+        self._writes.put(None)
+        self._writer.join()
+        self._conn.close()
+
+    def runs(self, limit=50):
+        """Return the most recent runs, newest first.
+
+        Each run is a tuple of (id, started, finished, test count, failure count).
+        """
+        failing = ", ".join(str(state) for state in TestMethod.FAILING_STATES)
+        return self._conn.execute(
+            "SELECT runs.id, runs.started, runs.finished, COUNT(results.path), "
+            "COALESCE(SUM(results.status IN (%s)), 0) "
+            "FROM runs LEFT JOIN results ON results.run_id = runs.id "
+            "GROUP BY runs.id ORDER BY runs.id DESC LIMIT ?" % failing,
+            (limit,),
+        ).fetchall()
+
+    def run_results(self, run_id):
+        "Return (path, status, duration, error signature) for every test in a run."
+        return self._conn.execute(
+            "SELECT path, status, duration, error_signature FROM results "
+            "WHERE run_id = ?",
+            (run_id,),
+        ).fetchall()
+
+    def run_phases(self, run_id):
+        "Return (path, phase, duration) for every phase timed in a run."
+        return self._conn.execute(
+            "SELECT path, phase, duration FROM phases WHERE run_id = ?", (run_id,)
+        ).fetchall()
+
+    def load_run(self, project, run_id):
+        """Load the results of a recorded run into a project.
+
+        Only the error signature of each failure is recorded, so it stands
+        in for the full error. Results for tests that are no longer in the
+        project are ignored. Returns the number of results loaded.
+        """
+        phases = {}
+        for path, phase, duration in self.run_phases(run_id):
+            phases.setdefault(path, {})[phase] = duration
+
+        count = 0
+        with EventSource.batched():
+            for path, status, duration, signature in self.run_results(run_id):
+                try:
+                    testMethod = project.get_node(path)
+                except KeyError:
+                    # The test no longer exists in the project.
+                    continue
+                details = {}
+                if path in phases:
+                    details["phases"] = phases[path]
+                testMethod.set_result(
+                    status=status,
+                    output=None,
+                    error=signature,
+                    duration=duration,
+                    **details
+                )
+                count = count + 1
+
+        # The fixtures of test classes and modules.
+        for path, fixtures in phases.items():
+            node = project.find_node(path)
+            if node is not None and hasattr(node, "fixtures"):
+                node.fixtures.update(fixtures)
+        return count
+
+    def last_durations(self, path, count=10):
+        "Return the durations of the most recent executions of a test, newest first."
+        return [
+            duration
+            for (duration,) in self._conn.execute(
+                "SELECT duration FROM results "
+                "WHERE path = ? AND duration IS NOT NULL "
+                "ORDER BY run_id DESC LIMIT ?",
+                (path, count),
+            )
+        ]
+
+    def recent_durations(self, count=5):
+        """Return the durations of the most recent executions of every test.
+
+        Each test keeps its own count most recent durations, however long
+        ago they were recorded, so runs of a few tests don't push every
+        other test out of the window. Returns a dictionary mapping each
+        test path to a list of its durations, newest first.
+        """
+        durations = {}
+        for path, duration in self._conn.execute(
+            "SELECT path, duration FROM ("
+            "SELECT path, duration, run_id, ROW_NUMBER() OVER "
+            "(PARTITION BY path ORDER BY run_id DESC) AS number "
+            "FROM results WHERE duration IS NOT NULL"
+            ") WHERE number <= ? ORDER BY path, run_id DESC",
+            (count,),
+        ):
+            durations.setdefault(path, []).append(duration)
+        return durations
+
+    def failed_in_last_runs(self, runs=10):
+        "Return the set of tests that failed in any of the most recent runs."
+        states = TestMethod.FAILING_STATES
+        return {
+            path
+            for (path,) in self._conn.execute(
+                "SELECT DISTINCT path FROM results "
+                "WHERE run_id IN (SELECT id FROM runs ORDER BY id DESC LIMIT ?) "
+                "AND status IN (%s)" % ", ".join("?" * len(states)),
+                (runs,) + tuple(states),
+            )
+        }
+
+    def failure_rates(self, runs=50):
+        """Return how often each test failed in the most recent runs.
+
+        Returns a dictionary mapping the path of each test that failed at
+        least once to the fraction of its recorded results that failed.
+        """
+        failing = ", ".join(str(state) for state in TestMethod.FAILING_STATES)
+        return {
+            path: rate
+            for path, rate in self._conn.execute(
+                "SELECT path, AVG(status IN (%s)) FROM results "
+                "WHERE run_id IN (SELECT id FROM runs ORDER BY id DESC LIMIT ?) "
+                "GROUP BY path HAVING SUM(status IN (%s)) > 0" % (failing, failing),
+                (runs,),
+            )
+        }
+
+    def recent_fixture_durations(self, count=5):
+        """Return the time taken by the fixtures of every class and module.
+
+        Returns a dictionary mapping the path of each class and module with
+        a fixture to a list of the total time its fixtures took in each of
+        its count most recent runs, newest first. A fixture that ran more
+        than once in a run (e.g., in several workers) counts its average time.
+        """
+        fixtures = CLASS_FIXTURES + MODULE_FIXTURES
+        durations = {}
+        totals = {}
+        for run_id, path, duration in self._conn.execute(
+            "SELECT run_id, path, AVG(duration) FROM ("
+            "SELECT run_id, path, phase, duration, DENSE_RANK() OVER "
+            "(PARTITION BY path ORDER BY run_id DESC) AS number "
+            "FROM phases WHERE phase IN (%s)"
+            ") WHERE number <= ? GROUP BY run_id, path, phase "
+            "ORDER BY run_id DESC" % ", ".join("?" * len(fixtures)),
+            fixtures + (count,),
+        ):
+            key = (run_id, path)
+            if key not in totals:
+                totals[key] = len(durations.setdefault(path, []))
+                durations[path].append(0.0)
+            durations[path][totals[key]] += duration
+        return durations
+
+    def duration_percentiles(self, path, percentiles=(50, 90, 99), count=None):
+        """Return the given percentiles of a test's recorded durations.
+
+        If count is provided, only the most recent executions are considered.
+        Returns a dictionary keyed by percentile, or None if the test has
+        no recorded durations.
+        """
+        durations = sorted(self.last_durations(path, count if count else -1))
+        if not durations:
+            return None
+
+        result = {}
+        for percentile in percentiles:
+            # Linear interpolation between the closest ranks.
+            rank = (len(durations) - 1) * percentile / 100.0
+            lower = int(rank)
+            upper = min(lower + 1, len(durations) - 1)
+            result[percentile] = durations[lower] + (
+                durations[upper] - durations[lower]
+            ) * (rank - lower)
+        return result
@@ -0,0 +1,361 @@
+import re
+import time
+import xml.etree.ElementTree as ElementTree
+from xml.parsers import expat
+from xml.sax.saxutils import escape, quoteattr
+
+from libs.events import EventSource
+from libs.model import ModelLoadError, TestMethod
+from libs.runner import Runner
+
+# Characters that are not allowed anywhere in an XML 1.0 document.
+ILLEGAL_XML_CHARS = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+
+def _text(value):
+    "Escape a value for use as XML character data"
+    return escape(ILLEGAL_XML_CHARS.sub("", value or ""))
+
+
+def _attr(value):
+    "Escape and quote a value for use as an XML attribute"
+    return quoteattr(ILLEGAL_XML_CHARS.sub("", value or ""))
+
+
+# The class given to test cases whose classname names no class, e.g.
+# module-level test functions reported as classname="test_module".
+MODULE_CASE = "(module)"
+
+
+def testcase_path(classname, name):
+    """Return the path of a JUnit test case in the project.
+
+    A path needs a module, a class and a test; a classname without a dot
+    is taken to be a module, and its tests are put in MODULE_CASE.
+    """
+    parts = [part for part in (classname or "").split(".") if part]
+    if len(parts) == 1:
+        parts.append(MODULE_CASE)
+    if name:
+        parts.append(name)
+    return ".".join(parts)
+
+
+def _message(error):
+    "The last non-blank line of an error report; usually the exception and message"
+    lines = [line.strip() for line in (error or "").splitlines() if line.strip()]
+    return lines[-1][:500] if lines else ""
+
+
+class JUnitXMLWriter(object):
+    """Write test results to a JUnit XML file, as they arrive.
+
+    Each result is written straight to disk, so memory use doesn't grow
+    with the size of the run. After every result, the closing tag is
+    rewritten and the counts in the opening tag are updated in place,
+    so the file is a complete, valid document even if the run is
+    stopped midway.
+    """
+
+    # The opening of the document is padded to this many bytes, so it
+    # can be rewritten in place as the counts change.
+    HEADER_SIZE = 512
+
+    FOOTER = b"</testsuite>\n"
+
+    def __init__(self, filename, name="pytest-gui"):
+        self.filename = filename
+        self.name = name
+
+        self.tests = 0
+        self.failures = 0
+        self.errors = 0
+        self.skipped = 0
+        self.time = 0.0
+        self.timestamp = time.strftime("%Y-%m-%dT%H:%M:%S")
+
+        self.runner = None
+
+        self.file = open(filename, "w+b")
+        self._write_header()
+        self._end = self.HEADER_SIZE
+        self.file.write(self.FOOTER)
+        self.file.flush()
+
+    def _write_header(self):
+        header = (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            "<testsuite name=%s tests=\"%d\" failures=\"%d\" errors=\"%d\" "
+            'skipped="%d" time="%0.3f" timestamp="%s"'
+            % (
+                _attr(self.name),
+                self.tests,
+                self.failures,
+                self.errors,
+                self.skipped,
+                self.time,
+                self.timestamp,
+            )
+        ).encode("utf-8")
+        # Pad with whitespace inside the tag, which XML ignores.
+        self.file.seek(0)
+        self.file.write(header.ljust(self.HEADER_SIZE - 2) + b">\n")
+
+    def add(self, path, status, duration, output=None, error=None):
+        "Append the result of a single test to the file."
+        classname, _, name = path.rpartition(".")
+        module, _, case = classname.rpartition(".")
+        if case == MODULE_CASE:
+            classname = module
+        duration = duration or 0.0
+
+        element = [
+            '  <testcase classname=%s name=%s time="%0.3f"'
+            % (_attr(classname), _attr(name), duration)
+        ]
+        if status == TestMethod.STATUS_SKIP:
+            element.append(
+                ">\n    <skipped message=%s />\n" % _attr(_message(error))
+            )
+            self.skipped += 1
+        elif status == TestMethod.STATUS_INTERRUPTED:
+            element.append(">\n    <skipped message=%s />\n" % _attr("interrupted"))
+            self.skipped += 1
+        elif status == TestMethod.STATUS_EXPECTED_FAIL:
+            element.append(
+                ">\n    <skipped message=%s>%s</skipped>\n"
+                % (_attr("expected failure"), _text(error))
+            )
+            self.skipped += 1
+        elif status == TestMethod.STATUS_ERROR:
+            element.append(
+                ">\n    <error message=%s>%s</error>\n"
+                % (_attr(_message(error)), _text(error))
+            )
+            self.errors += 1
+        elif status in TestMethod.FAILING_STATES:
+            if status == TestMethod.STATUS_UNEXPECTED_SUCCESS:
+                error = error or "Unexpected success"
+            element.append(
+                ">\n    <failure message=%s>%s</failure>\n"
+                % (_attr(_message(error)), _text(error))
+            )
+            self.failures += 1
+        else:
+            element.append(">\n")
+
+        if output:
+            element.append("    <system-out>%s</system-out>\n" % _text(output))
+        element.append("  </testcase>\n")
+
+        self.tests += 1
+        self.time += duration
+
+        # Overwrite the closing tag with the new test case, then restore it.
+        self.file.seek(self._end)
+        self.file.write("".join(element).encode("utf-8"))
+        self._end = self.file.tell()
+        self.file.write(self.FOOTER)
+        self._write_header()
+        self.file.flush()
+
+    def close(self):
+        "Close the file; it already holds a complete document."
+        if not self.file.closed:
+            self.file.close()
+
+    def attach(self, runner):
+        "Write the results of a runner as its tests finish."
+        self.runner = runner
+        Runner.bind("test_end", self.on_test_end)
+        Runner.bind("suite_end", self.on_suite_end)
+        Runner.bind("suite_error", self.on_suite_end)
+
+    def on_test_end(self, runner, test_path, result, **data):
+        "Event handler: the runner has finished running a test"
+        if runner is not self.runner:
+            return
+        testMethod = runner.project.get_node(test_path)
+        self.add(
+            test_path,
+            result,
+            testMethod.duration,
+            testMethod.output,
+            testMethod.error,
+        )
+
+    def on_suite_end(self, runner, **data):
+        "Event handler: the runner has finished"
+        if runner is self.runner:
+            self.close()
+
+
+class LazyText(object):
+    """The text of an element in an XML file, read from disk when required.
+
+    Only the byte offsets of the element are kept in memory; the content
+    is read and unescaped each time read() is called.
+    """
+
+    def __init__(self, filename, tag, start, end, encoding="utf-8"):
+        self.filename = filename
+        self.tag = tag
+        self.start = start
+        self.end = end
+        self.encoding = encoding
+
+    def __repr__(self):
+        return "<LazyText %s bytes %d-%d>" % (self.filename, self.start, self.end)
+
+    def read(self):
+        "Read, and unescape, the text of the element."
+        with open(self.filename, "rb") as f:
+            f.seek(self.start)
+            data = f.read(self.end - self.start)
+
+        # The slice runs from the start tag up to the end tag; unless the
+        # element is self-closing, the end tag must be restored to parse it.
+        if not data.endswith(b"/>"):
+            data = data + ("</%s>" % self.tag).encode(self.encoding)
+        if self.encoding.lower().replace("-", "") != "utf8":
+            declaration = '<?xml version="1.0" encoding="%s"?>' % self.encoding
+            data = declaration.encode(self.encoding) + data
+        return ElementTree.fromstring(data).text or ""
+
+
+class JUnitXMLReader(object):
+    """Load the results in a JUnit XML file into a project.
+
+    The file is parsed as a stream, so no document tree is ever built.
+    The bodies of failures, errors and captured output, which can be very
+    large, are not held in memory; the results refer to them by their
+    offsets in the file, and they are read when they are displayed.
+    """
+
+    # Elements of a test case whose body holds the error report.
+    ERROR_TAGS = {
+        "failure": TestMethod.STATUS_FAIL,
+        "error": TestMethod.STATUS_ERROR,
+    }
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.encoding = "utf-8"
+
+        self.count = 0
+
+        # The state of the test case currently being parsed.
+        self._testcase = None
+        self._start = None
+        self._has_body = False
+
+    def load(self, project):
+        "Add every test case in the file to the project, with its result."
+        self.project = project
+
+        self._parser = expat.ParserCreate()
+        self._parser.buffer_text = True
+        self._parser.buffer_size = 65536
+        self._parser.XmlDeclHandler = self.on_declaration
+        self._parser.StartElementHandler = self.on_start
+        self._parser.EndElementHandler = self.on_end
+        self._parser.CharacterDataHandler = self.on_text
+
+        with EventSource.batched():
+            with open(self.filename, "rb") as f:
+                self._parser.ParseFile(f)
+
+        return self.count
+
+    def on_declaration(self, version, encoding, standalone):
+        if encoding:
+            self.encoding = encoding
+
+    def on_start(self, tag, attrs):
+        if tag == "testcase":
+            self._testcase = {
+                "path": testcase_path(attrs.get("classname"), attrs.get("name")),
+                "duration": float(attrs.get("time") or 0),
+                "status": TestMethod.STATUS_PASS,
+                "error": None,
+                "output": None,
+            }
+        elif self._testcase is not None:
+            self._start = self._parser.CurrentByteIndex
+            self._has_body = False
+            if tag in self.ERROR_TAGS:
+                self._testcase["status"] = self.ERROR_TAGS[tag]
+                self._testcase["error"] = attrs.get("message")
+            elif tag == "skipped":
+                self._testcase["status"] = TestMethod.STATUS_SKIP
+                # The writer's message already carries the prefix.
+                message = attrs.get("message", "")
+                if not message.startswith("Skipped: "):
+                    message = "Skipped: " + message
+                self._testcase["error"] = message
+
+    def on_text(self, data):
+        # The text itself is discarded; it will be read lazily if needed.
+        if self._start is not None and not data.isspace():
+            self._has_body = True
+
+    def on_end(self, tag):
+        if tag == "testcase":
+            self._add(self._testcase)
+            self._testcase = None
+        elif self._testcase is not None and self._start is not None:
+            if self._has_body and (tag in self.ERROR_TAGS or tag == "system-out"):
+                body = LazyText(
+                    self.filename,
+                    tag,
+                    self._start,
+                    self._parser.CurrentByteIndex,
+                    self.encoding,
+                )
+                if tag == "system-out":
+                    self._testcase["output"] = body
+                else:
+                    self._testcase["error"] = body
+            self._start = None
+
+    def _add(self, testcase):
+        testMethod = self.project.confirm_exists(testcase["path"])
+        if testMethod is None:
+            return
+        testMethod.set_result(
+            status=testcase["status"],
+            output=testcase["output"],
+            error=testcase["error"],
+            duration=testcase["duration"],
+        )
+        self.count = self.count + 1
+
+
+def read_project(project, filename):
+    """Load the results in a JUnit XML file into a project.
+
+    Returns the number of test cases loaded. Raises ModelLoadError if
+    the file can't be read or parsed.
+    """
+    try:
+        return JUnitXMLReader(filename).load(project)
+    except (OSError, expat.ExpatError) as e:
+        raise ModelLoadError("Unable to read %s: %s" % (filename, e))
+
+
+def write_project(project, filename):
+    "Write the results of every executed test in a project to a JUnit XML file."
+    writer = JUnitXMLWriter(filename)
+    try:
+        for path in sorted(project.node_paths()):
+            testMethod = project.get_node(path)
+            if isinstance(testMethod, TestMethod) and testMethod.status is not None:
+                writer.add(
+                    path,
+                    testMethod.status,
+                    testMethod.duration,
+                    testMethod.output,
+                    testMethod.error,
+                )
+    finally:
+        writer.close()
@@ -1,9 +1,119 @@
 import os
+import subprocess
 import sys
-from datetime import datetime
+from array import array
+from collections import namedtuple
 
 from libs.constants import DEFAULT_TEST_DIR
 from libs.events import EventSource
+from libs.results import ResultStore
+
+
+def _update_counts(node, tests=0, active=0, old_status=None, new_status=None):
+    """Adjust the aggregate test counters of a node and all of its ancestors.
+
+    This is called whenever a test method is added or removed, or changes
+    its active state or status, so it costs O(depth) rather than a walk
+    of the whole tree.
+    """
+    while node is not None:
+        node.test_count += tests
+        node.active_count += active
+        if old_status is not None:
+            node.status_count[old_status] -= 1
+        if new_status is not None:
+            node.status_count[new_status] = node.status_count.get(new_status, 0) + 1
+        node = node.parent
+
+
+def _set_subtree_active(root, is_active):
+    """Set the active flag of a node and everything under it, in a single pass.
+
+    No events are emitted for the individual nodes. Returns the change in
+    the number of active test methods under the node, so the caller can
+    update the counts of the node's ancestors.
+    """
+    before = root.active_count
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        node._active = is_active
+        node.active_count = node.test_count if is_active else 0
+        for child in node.values():
+            if isinstance(child, TestMethod):
+                child._active = is_active
+            else:
+                stack.append(child)
+    return root.active_count - before
+
+
+def _badge(node):
+    "A short summary of the results of all tests under a node"
+    failed = sum(node.status_count.get(state, 0) for state in TestMethod.FAILING_STATES)
+    if failed:
+        return "%d failed / %d" % (failed, node.test_count)
+    passed = node.status_count.get(TestMethod.STATUS_PASS, 0)
+    if passed:
+        return "%d passed / %d" % (passed, node.test_count)
+    return "%d tests" % node.test_count
+
+
+# The outcome of refreshing a project against a new list of tests: the
+# dotted paths of test methods that were added, removed, and kept.
+RefreshDiff = namedtuple("RefreshDiff", ["added", "removed", "kept"])
+
+
+def _resolve(value):
+    "Return a result value, reading it first if it is loaded lazily (e.g., from a file)"
+    read = getattr(value, "read", None)
+    return read() if read is not None else value
+
+
+# The result of a single subtest of a test method.
+Subtest = namedtuple("Subtest", ["name", "status", "duration", "error"])
+
+
+class SubtestResults(object):
+    """The results of the subtests of a test method.
+
+    The results are stored column by column: statuses and durations in
+    arrays, and errors only for the subtests that have one, so a test
+    with many thousands of subtests doesn't need an object for each.
+    Indexing returns a Subtest.
+    """
+
+    __slots__ = ("names", "statuses", "durations", "errors")
+
+    def __init__(self, subtests, intern=None):
+        self.names = []
+        self.statuses = array("H")
+        self.durations = array("d")
+        self.errors = {}
+        for index, (name, status, duration, error) in enumerate(subtests):
+            self.names.append(name)
+            self.statuses.append(status)
+            self.durations.append(duration)
+            if error:
+                self.errors[index] = intern(error) if intern else error
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, index):
+        return Subtest(
+            self.names[index],
+            self.statuses[index],
+            self.durations[index],
+            _resolve(self.errors.get(index)),
+        )
+
+    def failed(self):
+        "Return the indices of the subtests that failed."
+        return [
+            index
+            for index, status in enumerate(self.statuses)
+            if status in TestMethod.FAILING_STATES
+        ]
 
 
 class ModelLoadError(Exception):
@@ -15,7 +125,11 @@ class ModelLoadError(Exception):
 class TestMethod(EventSource):
     STATUS_PASS = 100
     STATUS_SKIP = 200
+    # Stopped part way through, when the run was stopped.
+    STATUS_INTERRUPTED = 250
     STATUS_EXPECTED_FAIL = 300
+    # Failed, but passed when it was run again.
+    STATUS_FLAKY = 350
     STATUS_UNEXPECTED_SUCCESS = 400
     STATUS_FAIL = 500
     STATUS_ERROR = 600
@@ -24,8 +138,10 @@ class TestMethod(EventSource):
     STATUS_LABELS = {
         STATUS_PASS: "passed",
         STATUS_SKIP: "skipped",
+        STATUS_INTERRUPTED: "interrupted",
         STATUS_FAIL: "failures",
         STATUS_EXPECTED_FAIL: "expected failures",
+        STATUS_FLAKY: "flaky",
         STATUS_UNEXPECTED_SUCCESS: "unexpected successes",
         STATUS_ERROR: "errors",
     }
@@ -39,8 +155,16 @@ class TestMethod(EventSource):
         # Set the parent of the TestMethod
         self.parent = testCase
         self.parent[name] = self
+        _update_counts(self.parent, tests=1, active=1)
         self.parent._update_active()
 
+        # Register the test method in the project's path index
+        self.project = testCase.project
+        self.project._index[self.path] = self
+
+        # The project refresh generation in which this method was last seen
+        self.generation = self.project.generation
+
         # Announce that there is a new test method
         self.emit("new")
 
@@ -62,12 +186,14 @@ class TestMethod(EventSource):
         if self._active:
             if not is_active:
                 self._active = False
+                _update_counts(self.parent, active=-1)
                 self.emit("inactive")
                 if cascade:
                     self.parent._update_active()
         else:
             if is_active:
                 self._active = True
+                _update_counts(self.parent, active=1)
                 self.emit("active")
                 if cascade:
                     self.parent._update_active()
@@ -86,14 +212,14 @@ class TestMethod(EventSource):
     @property
     def output(self):
         try:
-            return self._result["output"]
+            return _resolve(self._result["output"])
         except TypeError:
             return None
 
     @property
     def error(self):
         try:
-            return self._result["error"]
+            return _resolve(self._result["error"])
         except TypeError:
             return None
 
@@ -104,13 +230,95 @@ class TestMethod(EventSource):
         except TypeError:
             return None
 
-    def set_result(self, status, output, error, duration):
+    @property
+    def profile(self):
+        "The profile summary of the last run, if the test was profiled"
+        try:
+            return self._result.get("profile")
+        except AttributeError:
+            return None
+
+    @property
+    def resources(self):
+        "The CPU time, memory and GC use of the last run, if measured"
+        try:
+            return self._result.get("resources")
+        except AttributeError:
+            return None
+
+    @property
+    def cpu_time(self):
+        "The CPU time (user and system) used by the last run, if measured"
+        resources = self.resources
+        if resources and "cpu_user" in resources:
+            return resources["cpu_user"] + resources["cpu_system"]
+        return None
+
+    @property
+    def phases(self):
+        "The time spent in setUp, the test itself and tearDown in the last run"
+        try:
+            return self._result.get("phases")
+        except AttributeError:
+            return None
+
+    @property
+    def subtests(self):
+        "The results of the test's subtests in the last run, if it has any"
+        try:
+            return self._result.get("subtests")
+        except AttributeError:
+            return None
+
+    @property
+    def attempts(self):
+        "The number of times the test ran in the last run, if it was retried"
+        try:
+            return self._result.get("attempts")
+        except AttributeError:
+            return None
+
+    @property
+    def repeats(self):
+        "The pass rate and spread of durations, if the test was run repeatedly"
+        try:
+            return self._result.get("repeats")
+        except AttributeError:
+            return None
+
+    @property
+    def slower(self):
+        "How much slower than its history the last run was, if significantly"
+        try:
+            return self._result.get("slower")
+        except AttributeError:
+            return None
+
+    @property
+    def max_rss_delta(self):
+        "The growth in peak memory use (in bytes) during the last run, if measured"
+        resources = self.resources
+        return resources.get("max_rss_delta") if resources else None
+
+    def set_result(self, status, output, error, duration, **details):
+        _update_counts(self.parent, old_status=self.status, new_status=status)
+        # Output and errors are often repeated across tests; the project's
+        # result store keeps a single, compact copy of each.
+        results = self.project.results
         self._result = {
             "status": status,
-            "output": output,
-            "error": error,
+            "output": results.intern(output),
+            "error": results.intern(error),
             "duration": duration,
         }
+        results.set_failure(
+            self.path, error if status in self.FAILING_STATES else None
+        )
+        if details.get("subtests"):
+            details["subtests"] = SubtestResults(details["subtests"], results.intern)
+
+        # Any further measurements reported with the result.
+        self._result.update(details)
         self.emit("status_update")
 
 
@@ -120,10 +328,22 @@ class TestCase(dict, EventSource):
         self.name = name
         self._active = True
 
+        # Aggregate counts of the test methods in this test case; these
+        # are maintained incrementally as methods change.
+        self.test_count = 0
+        self.active_count = 0
+        self.status_count = {}
+
+        # The time taken by setUpClass and tearDownClass in the last run.
+        self.fixtures = {}
+
         # Set the parent of the TestCase
         self.parent = testApp
         self.parent[name] = self
-        self.parent._update_active()
+
+        # Register the test case in the project's path index
+        self.project = testApp.project
+        self.project._index[self.path] = self
 
         # Announce that there is a new TestCase
         self.emit("new")
@@ -140,27 +360,44 @@ class TestCase(dict, EventSource):
         return self._active
 
     def set_active(self, is_active, cascade=True):
-        if self._active:
-            if not is_active:
-                self._active = False
-                self.emit("inactive")
-                if cascade:
-                    self.parent._update_active()
-                for testMethod in self.values():
-                    testMethod.set_active(False, cascade=False)
-        else:
-            if is_active:
-                self._active = True
-                self.emit("active")
-                if cascade:
-                    self.parent._update_active()
-                for testMethod in self.values():
-                    testMethod.set_active(True, cascade=False)
+        """Set the active state of every test under this node.
+
+        The flags are updated in a single pass, and a single subtree event
+        is emitted, rather than an event for every node in the subtree.
+        """
+        if self._active == is_active and self.active_count == (
+            self.test_count if is_active else 0
+        ):
+            return
+
+        delta = _set_subtree_active(self, is_active)
+        _update_counts(self.parent, active=delta)
+        self.emit("subtree_active" if is_active else "subtree_inactive")
+        if cascade:
+            self.parent._update_active()
 
     def toggle_active(self):
         self.set_active(not self.active)
 
+    @property
+    def badge(self):
+        "A short summary of the results in this node, e.g. '3 failed / 120'"
+        return _badge(self)
+
     def find_tests(self, active=True, status=None, labels=None):
+        # Use the aggregate counts to avoid looking at individual methods
+        # when the whole test case is either included or excluded.
+        if not labels:
+            if status:
+                if not any(self.status_count.get(state) for state in status):
+                    return 0, []
+            else:
+                count = self.active_count if active else self.test_count
+                if count == len(self):
+                    return count, self.path
+                elif count == 0:
+                    return 0, []
+
         tests = []
         count = 0
 
@@ -191,22 +428,14 @@ class TestCase(dict, EventSource):
 
         return count, tests
 
-    def _purge(self, timestamp):
-        "Purge any test method that isn't current as of the timestamp"
-        for testMethod_name, testMethod in self.items():
-            if testMethod.timestamp != timestamp:
-                self.pop(testMethod_name)
-
     def _update_active(self):
-        "Check the active status of all child nodes, and update the status of this node accordingly"
-        for testMethod_name, testMethod in self.items():
-            if testMethod.active:
-                # As soon as we find an active child, this node
-                # must be marked active, and no other checks are
-                # required.
-                self.set_active(True)
-                return
-        self.set_active(False)
+        "Update the active status of this node to reflect its children, and propagate upwards"
+        # This node is active as long as any test under it is active.
+        is_active = self.active_count > 0
+        if is_active != self._active:
+            self._active = is_active
+            self.emit("active" if is_active else "inactive")
+        self.parent._update_active()
 
 
 class TestModule(dict, EventSource):
@@ -215,10 +444,23 @@ class TestModule(dict, EventSource):
         self.name = name
         self._active = True
 
+        # Aggregate counts of all the test methods in this module; these
+        # are maintained incrementally as methods change.
+        self.test_count = 0
+        self.active_count = 0
+        self.status_count = {}
+
+        # The time taken by setUpModule and tearDownModule in the last run.
+        self.fixtures = {}
+
         # Set the parent of the TestModule.
         self.parent = parent
         self.parent[name] = self
 
+        # Register the test module in the project's path index
+        self.project = parent.project
+        self.project._index[self.path] = self
+
         # Announce that there is a new test case
         self.emit("new")
 
@@ -238,27 +480,40 @@ class TestModule(dict, EventSource):
         return self._active
 
     def set_active(self, is_active, cascade=True):
-        if self._active:
-            if not is_active:
-                self._active = False
-                self.emit("inactive")
-                if cascade:
-                    self.parent._update_active()
-                for testModule in self.values():
-                    testModule.set_active(False, cascade=False)
-        else:
-            if is_active:
-                self._active = True
-                self.emit("active")
-                if cascade:
-                    self.parent._update_active()
-                for testModule in self.values():
-                    testModule.set_active(True, cascade=False)
+        """Set the active state of every test under this node.
+
+        The flags are updated in a single pass, and a single subtree event
+        is emitted, rather than an event for every node in the subtree.
+        """
+        if self._active == is_active and self.active_count == (
+            self.test_count if is_active else 0
+        ):
+            return
+
+        delta = _set_subtree_active(self, is_active)
+        _update_counts(self.parent, active=delta)
+        self.emit("subtree_active" if is_active else "subtree_inactive")
+        if cascade:
+            self.parent._update_active()
 
     def toggle_active(self):
         self.set_active(not self.active)
 
+    @property
+    def badge(self):
+        "A short summary of the results in this node, e.g. '3 failed / 120'"
+        return _badge(self)
+
     def find_tests(self, active=True, status=None, labels=None):
+        # Use the aggregate counts to avoid descending into the module
+        # when the whole module is either included or excluded.
+        if not labels:
+            if status:
+                if not any(self.status_count.get(state) for state in status):
+                    return 0, []
+            elif not active or self.active_count == self.test_count:
+                return self.test_count, self.path
+
         tests = []
         count = 0
 
@@ -300,19 +555,14 @@ class TestModule(dict, EventSource):
 
         return count, tests
 
-    def _purge(self, timestamp):
-        for testModule_name, testModule in self.items():
-            testModule._purge(timestamp)
-            if len(testModule) == 0:
-                self.pop(testModule_name)
-
     def _update_active(self):
-        "Check the active status of all child nodes, and update the status of this node accordingly"
-        for subModule_name, subModule in self.items():
-            if subModule.active:
-                self.set_active(True)
-                return
-        self.set_active(False)
+        "Update the active status of this node to reflect its children, and propagate upwards"
+        # This node is active as long as any test under it is active.
+        is_active = self.active_count > 0
+        if is_active != self._active:
+            self._active = is_active
+            self.emit("active" if is_active else "inactive")
+        self.parent._update_active()
 
 
 class Project(dict, EventSource):
@@ -321,6 +571,24 @@ class Project(dict, EventSource):
     def __init__(self):
         super(Project, self).__init__()
         self.errors = []
+        self.parent = None
+
+        # Incremented on every refresh; each test method records the
+        # generation in which it was last discovered.
+        self.generation = 0
+
+        # Aggregate counts of all the test methods in the project; these
+        # are maintained incrementally as methods change.
+        self.test_count = 0
+        self.active_count = 0
+        self.status_count = {}
+
+        # A flat index of every node in the project, keyed by dotted path.
+        # Nodes register themselves on creation, and are removed on purge.
+        self._index = {}
+
+        # The output and errors of every test, and groups of identical failures.
+        self.results = ResultStore()
 
     def __repr__(self):
         return "Project"
@@ -329,7 +597,65 @@ class Project(dict, EventSource):
     def path(self):
         return ""
 
+    @property
+    def project(self):
+        "Exists for API consistency; the project is the root of its own tree"
+        return self
+
+    def get_node(self, path):
+        """Return the module, test case or test method with the given dotted path.
+
+        Raises KeyError if no node exists at that path.
+        """
+        return self._index[path]
+
+    def find_node(self, path):
+        "Return the node with the given dotted path, or None if there isn't one."
+        return self._index.get(path)
+
+    def has_node(self, path):
+        "Return True if a node exists at the given dotted path."
+        return path in self._index
+
+    def node_paths(self):
+        "Return the path of every module, test case and test method in the project."
+        return list(self._index)
+
+    def get_nodes(self, paths):
+        """Return the nodes for a collection of dotted paths.
+
+        Paths that don't identify a node in the project are skipped.
+        """
+        index = self._index
+        return [index[path] for path in paths if path in index]
+
+    def test_paths(self, labels=None):
+        """Return the path of every test method named by a list of labels.
+
+        Labels may name modules, test cases or test methods; if no labels
+        are provided, every test method in the project is returned.
+        Paths are returned in tree order.
+        """
+        paths = []
+        stack = list(reversed(self.get_nodes(labels))) if labels else [self]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, TestMethod):
+                paths.append(node.path)
+            else:
+                stack.extend(reversed(list(node.values())))
+        return paths
+
     def find_tests(self, active=True, status=None, labels=None):
+        # Use the aggregate counts to avoid descending into the project
+        # when every test is either included or excluded.
+        if not labels:
+            if status:
+                if not any(self.status_count.get(state) for state in status):
+                    return 0, []
+            elif not active or self.active_count == self.test_count:
+                return self.test_count, []
+
         tests = []
         count = 0
 
@@ -371,7 +697,16 @@ class Project(dict, EventSource):
 
         return count, tests
 
-    def confirm_exists(self, test_label, timestamp=None):
+    def confirm_exists(self, test_label, generation=None):
+        if generation is None:
+            generation = self.generation
+
+        # Fast path: the test method is already known.
+        testMethod = self._index.get(test_label)
+        if isinstance(testMethod, TestMethod):
+            testMethod.generation = generation
+            return testMethod
+
         parts = test_label.split(".")
         if len(parts) < 2:
             return
@@ -394,22 +729,91 @@ class Project(dict, EventSource):
         except KeyError:
             testMethod = TestMethod(parts[-1], testCase)
 
-        testMethod.timestamp = timestamp
+        testMethod.generation = generation
         return testMethod
 
     def refresh(self, test_list, errors=None):
-        timestamp = datetime.now()
-
-        # Make sure there is a data representation for every test in the list.
-        for test_label in test_list:
-            self.confirm_exists(test_label, timestamp)
-
-        for testModule_name, testModule in self.items():
-            testModule._purge(timestamp)
-            if len(testModule) == 0:
-                self.pop(testModule_name)
+        """Bring the project up to date with a new list of test labels.
+
+        Tests that are already known keep their results and active state;
+        new tests are added, and tests that are no longer in the list are
+        removed, along with any modules or test cases left empty.
+
+        Returns a RefreshDiff of the paths that were added, removed and kept.
+        """
+        self.generation = self.generation + 1
+        added = []
+        kept = []
+
+        with EventSource.batched():
+            # Make sure there is a data representation for every test in the list.
+            for test_label in test_list:
+                testMethod = self._index.get(test_label)
+                if isinstance(testMethod, TestMethod):
+                    if testMethod.generation != self.generation:
+                        testMethod.generation = self.generation
+                        kept.append(test_label)
+                elif self.confirm_exists(test_label, self.generation) is not None:
+                    added.append(test_label)
+
+            # Anything that wasn't seen in this generation has gone away.
+            removed = [
+                path
+                for path, node in self._index.items()
+                if isinstance(node, TestMethod) and node.generation != self.generation
+            ]
+            for path in removed:
+                self._remove(self._index[path])
 
         self.errors = errors if errors is not None else []
+        return RefreshDiff(added, removed, kept)
+
+    def _remove(self, testMethod):
+        "Remove a test method, and any modules or test cases left empty as a result"
+        node = testMethod
+        parent = node.parent
+        _update_counts(
+            parent,
+            tests=-1,
+            active=-1 if testMethod.active else 0,
+            old_status=testMethod.status,
+        )
+        self.results.discard(testMethod.path)
+        while True:
+            del parent[node.name]
+            del self._index[node.path]
+            node.emit("removed")
+            if parent is self or len(parent):
+                break
+            node = parent
+            parent = node.parent
+
+        # The active state of the surviving ancestors may have changed.
+        parent._update_active()
+
+    def discover(self, testdir=DEFAULT_TEST_DIR):
+        """Discover the tests in a directory, using a subprocess.
+
+        Returns the list of discovered test labels, and a list of any
+        errors that were reported. Raises ModelLoadError if discovery
+        reported errors and found no tests.
+        """
+        runner = subprocess.Popen(
+            self.discover_commandline(testdir),
+            stdin=None,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            shell=False,
+        )
+        stdout, stderr = runner.communicate()
+
+        test_list = [line.strip() for line in stdout.decode("utf-8").splitlines()]
+        test_list = [line for line in test_list if line]
+        errors = [line.strip() for line in stderr.decode("utf-8").splitlines()]
+        if errors and not test_list:
+            raise ModelLoadError("\n".join(errors))
+
+        return test_list, errors
 
     def _update_active(self):
         "Exists for API consistency"
@@ -430,11 +834,38 @@ class UnittestProject(Project):
         discover_script = os.path.join(base_dir, "discover.py")
         return [sys.executable, discover_script, "--testdir", testdir]
 
-    def execute_commandline(self, labels, testdir=DEFAULT_TEST_DIR):
-        """Return the command line to execute the specified test labels."""
+    def execute_commandline(
+        self,
+        labels,
+        testdir=DEFAULT_TEST_DIR,
+        profile_dir=None,
+        trace_allocations=False,
+        max_failures=None,
+        timeout=None,
+        repeat=1,
+    ):
+        """Return the command line to execute the specified test labels.
+
+        If profile_dir is provided, each test is profiled, and its stats
+        saved in that directory. If trace_allocations is True, the memory
+        allocated by each test is traced. If max_failures is provided, the
+        tests stop once that many have failed. If timeout is provided, a
+        test without a timeout of its own fails after that many seconds.
+        If repeat is more than 1, the tests are run that many times over.
+        """
         base_dir = os.path.dirname(
             os.path.abspath(__file__)
         )  # Get the directory of the current file
         runner_script = os.path.join(base_dir, "runner.py")
         args = [sys.executable, runner_script, "--testdir", testdir]
+        if profile_dir:
+            args.extend(["--profile", profile_dir])
+        if trace_allocations:
+            args.append("--trace-allocations")
+        if max_failures:
+            args.extend(["--max-failures", str(max_failures)])
+        if timeout:
+            args.extend(["--timeout", "%g" % timeout])
+        if repeat > 1:
+            args.extend(["--repeat", str(repeat)])
         return args + labels
@@ -0,0 +1,115 @@
+import os
+
+from libs.model import TestMethod
+
+# The orderings a run can use.
+ORDER_DISCOVERY = "discovery"
+ORDER_FAILED_FIRST = "failed-first"
+ORDERINGS = (ORDER_DISCOVERY, ORDER_FAILED_FIRST)
+
+# The number of recent runs considered when working out failure rates.
+FAILURE_RATE_RUNS = 50
+
+
+def module_filename(testdir, module):
+    "Return the source file of a test module, or None if it can't be found."
+    base = os.path.join(testdir, *module.split("."))
+    for filename in (base + ".py", os.path.join(base, "__init__.py")):
+        if os.path.exists(filename):
+            return filename
+    return None
+
+
+class FailedFirstOrdering(object):
+    """Order tests so that the ones most likely to fail run first.
+
+    Each test falls into the first of these tiers that applies:
+
+    0. it failed in its last result, in the project or the run history;
+    1. its file has been modified since the last recorded run started,
+       most recently modified first;
+    2. it has failed in the recent run history, highest failure rate first;
+    3. everything else, in discovery order.
+
+    Tests are ordered module by module, and class by class, each ranked by
+    its best test, so that the tests of a class (and of a module) still
+    run together, and their fixtures still run only once.
+    """
+
+    def __init__(self, project, testdir, history=None):
+        self.project = project
+        self.testdir = testdir
+
+        self.failed = set()
+        self.failure_rates = {}
+        self.since = None
+        if history:
+            runs = history.runs(1)
+            if runs:
+                self.failed = history.failed_in_last_runs(1)
+                self.since = runs[0][1]
+            self.failure_rates = history.failure_rates(FAILURE_RATE_RUNS)
+
+        # The modification time of each module's file, if it is recent.
+        self._modified = {}
+
+    def modified(self, module):
+        "Return the modification time of a module, if it changed since the last run."
+        if module not in self._modified:
+            mtime = None
+            if self.since is not None:
+                filename = module_filename(self.testdir, module)
+                if filename and os.path.getmtime(filename) >= self.since:
+                    mtime = os.path.getmtime(filename)
+            self._modified[module] = mtime
+        return self._modified[module]
+
+    def rank(self, path):
+        "Return the sort key of a single test; lower runs sooner."
+        testMethod = self.project.get_node(path)
+        if testMethod.status in TestMethod.FAILING_STATES or path in self.failed:
+            return (0, 0.0)
+        mtime = self.modified(testMethod.parent.parent.path)
+        if mtime is not None:
+            return (1, -mtime)
+        rate = self.failure_rates.get(path)
+        if rate:
+            return (2, -rate)
+        return (3, 0.0)
+
+    def order(self, paths):
+        "Return the paths of tests, in the order they should run."
+        # The best rank of each test, class and module, and the position
+        # of each class and module, which keeps equally ranked groups apart.
+        ranks = {}
+        positions = {}
+        for position, path in enumerate(paths):
+            rank = self.rank(path)
+            ranks[path] = rank
+            case = path.rpartition(".")[0]
+            module = case.rpartition(".")[0]
+            for group in (case, module):
+                if group not in ranks or rank < ranks[group]:
+                    ranks[group] = rank
+                positions.setdefault(group, position)
+
+        def key(path):
+            case = path.rpartition(".")[0]
+            module = case.rpartition(".")[0]
+            return (
+                ranks[module],
+                positions[module],
+                ranks[case],
+                positions[case],
+                ranks[path],
+            )
+
+        # The sort is stable, so equally ranked tests keep their order.
+        return sorted(paths, key=key)
+
+
+def order_tests(paths, ordering, project, testdir, history=None):
+    "Return the paths of tests in the order a run with the given ordering uses."
+    if ordering == ORDER_FAILED_FIRST:
+        return FailedFirstOrdering(project, testdir, history).order(paths)
+    return paths
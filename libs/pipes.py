@@ -1,10 +1,188 @@
+import cProfile
+import functools
+import gc
+import inspect
 import json
+import os
+import signal
 import sys
+import threading
 import time
+import tracemalloc
 import traceback
 import unittest
 from io import StringIO
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; CPU time and memory use aren't measured.
+    resource = None
 from libs.constants import DEFAULT_TEST_DIR
+from libs.profiling import summarize
+
+# The attribute of a test method or class giving its own timeout, in seconds.
+TIMEOUT_ATTRIBUTE = "__timeout__"
+
+# The fixtures of test classes and modules, timed as their own entries.
+CLASS_FIXTURES = ("setUpClass", "tearDownClass")
+MODULE_FIXTURES = ("setUpModule", "tearDownModule")
+
+
+def iter_tests(suite):
+    "Yield every test case in a suite, depth first."
+    stack = [iter(suite)]
+    while stack:
+        try:
+            item = next(stack[-1])
+        except StopIteration:
+            stack.pop()
+            continue
+        if isinstance(item, unittest.TestSuite):
+            stack.append(iter(item))
+        else:
+            yield item
+
+
+def format_stacks():
+    "Return the current stack of every thread, formatted as text."
+    names = {thread.ident: thread.name for thread in threading.enumerate()}
+    current = threading.get_ident()
+    stacks = []
+    for ident, frame in sys._current_frames().items():
+        if ident == current:
+            # The watchdog itself.
+            continue
+        stacks.append(
+            'Thread "%s" (%d):\n%s'
+            % (
+                names.get(ident, "unknown"),
+                ident,
+                "".join(traceback.format_stack(frame)).rstrip(),
+            )
+        )
+    return "\n\n".join(stacks)
+
+
+def test_timeout(test, default=None):
+    """Return the timeout of a test, in seconds, or None if it has none.
+
+    A test method, or its class, can set its own timeout with a
+    __timeout__ attribute; otherwise, the default applies.
+    """
+    method = getattr(type(test), getattr(test, "_testMethodName", ""), None)
+    for owner in (method, type(test)):
+        timeout = getattr(owner, TIMEOUT_ATTRIBUTE, None)
+        if timeout is not None:
+            return timeout or None
+    return default
+
+
+class TestTimeout(Exception):
+    """Raised in a test that has run for longer than its timeout."""
+
+
+class Watchdog(object):
+    """Enforce the timeout of each test from a background thread.
+
+    When a test runs past its timeout, the stack of every thread is
+    captured, and the test is interrupted by raising TestTimeout in the
+    main thread, from a SIGALRM handler; that breaks sleeps and waits on
+    locks, so the test fails, and the run moves on. If the test is still
+    running GRACE seconds later (or it can't be interrupted at all), it
+    is reported as an error, and the process exits with EXIT_STATUS, so
+    that the runner can start a new one for the tests that remain.
+    """
+
+    GRACE = 5.0
+
+    EXIT_STATUS = 75
+
+    def __init__(self, result):
+        self.result = result
+        self._condition = threading.Condition()
+        self._test = None
+        self._timeout = None
+        self._deadline = None
+
+        # The thread stacks captured when the current test timed out.
+        self.stacks = None
+
+        # Tests can only be interrupted with a signal on POSIX, from the
+        # main thread, and if the tests don't use SIGALRM themselves.
+        self._main_thread = threading.get_ident()
+        self._previous_handler = None
+        self.can_interrupt = (
+            hasattr(signal, "pthread_kill")
+            and threading.current_thread() is threading.main_thread()
+            and signal.getsignal(signal.SIGALRM) in (signal.SIG_DFL, None)
+        )
+        if self.can_interrupt:
+            self._previous_handler = signal.signal(signal.SIGALRM, self._interrupt)
+
+        self._thread = threading.Thread(target=self._watch, name="watchdog")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def arm(self, test, timeout):
+        "Start timing a test."
+        with self._condition:
+            self._test = test
+            self._timeout = timeout
+            self._deadline = time.monotonic() + timeout
+            self.stacks = None
+            self._condition.notify()
+
+    def disarm(self):
+        "Stop timing the current test."
+        with self._condition:
+            self._test = None
+            self._deadline = None
+            self._condition.notify()
+
+    def close(self):
+        "Stop watching, and restore the SIGALRM handler."
+        self.disarm()
+        if self.can_interrupt:
+            signal.signal(signal.SIGALRM, self._previous_handler or signal.SIG_DFL)
+            self.can_interrupt = False
+
+    def _interrupt(self, signum, frame):
+        "Signal handler: raise TestTimeout in the test that timed out."
+        if self.stacks is not None and self._test is not None:
+            raise TestTimeout("Test timed out after %gs" % self._timeout)
+
+    def _wait(self, test, deadline):
+        """Wait until a deadline, or until the test stops being timed.
+
+        Returns True if the test is still being timed at the deadline.
+        """
+        while self._test is test and self._deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return True
+            self._condition.wait(remaining)
+        return False
+
+    def _watch(self):
+        "Watch the tests in turn, for as long as the process runs."
+        with self._condition:
+            while True:
+                while self._deadline is None:
+                    self._condition.wait()
+                test = self._test
+                if not self._wait(test, self._deadline):
+                    continue
+
+                self.stacks = format_stacks()
+                if self.can_interrupt:
+                    signal.pthread_kill(self._main_thread, signal.SIGALRM)
+                    if not self._wait(test, time.monotonic() + self.GRACE):
+                        continue
+
+                # The test can't be recovered from; report it, and give up.
+                self.result.write_timeout(test, self._timeout, self.stacks)
+                os._exit(self.EXIT_STATUS)
 
 
 class PipedTestResult(unittest.result.TestResult):
@@ -12,16 +190,61 @@ class PipedTestResult(unittest.result.TestResult):
 
     RESULT_SEPARATOR = "\x1f"  # ASCII US (Unit Separator)
 
-    def __init__(self, stream, use_old_discovery=True):
+    # The number of allocation sites reported when tracing allocations.
+    TOP_ALLOCATIONS = 10
+
+    def __init__(
+        self,
+        stream,
+        use_old_discovery=True,
+        profile_dir=None,
+        trace_allocations=False,
+        max_failures=None,
+        timeout=None,
+    ):
         super().__init__()
         self.stream = stream
         self.use_old_discovery = use_old_discovery
         self._first = True
 
+        # If provided, the run stops once this many tests have failed.
+        self.max_failures = max_failures
+        self.failed_count = 0
+
+        # The timeout of any test without one of its own, in seconds, and
+        # the watchdog enforcing timeouts, started once a test has one.
+        self.timeout = timeout
+        self._watchdog = None
+
         # Create a clean buffer for stdout content
         self._stdout = StringIO()
         self._current_test = None
 
+        # If provided, each test is profiled, and its stats saved in this directory.
+        self.profile_dir = profile_dir
+        self._profiler = None
+
+        # If True, the memory allocated by each test is traced.
+        self.trace_allocations = trace_allocations
+
+        # Resource usage and GC counts when the current test started.
+        self._usage = None
+        self._collections = None
+
+        # The time spent in each phase of the current test, and the
+        # names of the methods wrapped to time them.
+        self._phases = {}
+        self._timed_methods = []
+
+        # The (class, name) of each class fixture being timed; a fixture
+        # reached through super() is timed as part of the outer call.
+        self._running_fixtures = set()
+
+        # The worst status of the current test's subtests, if it has any,
+        # and when the last of them finished.
+        self._subtest_status = None
+        self._subtest_end = None
+
     @staticmethod
     def _trim_docstring(docstring):
         """Trim the docstring to remove leading/trailing whitespace and indentation."""
@@ -53,6 +276,24 @@ class PipedTestResult(unittest.result.TestResult):
         except AttributeError:
             return self._trim_docstring(test._testMethodDoc) if test._testMethodDoc else "No description"
 
+    def _format_error(self, error):
+        """Format an exception for a test result.
+
+        A test that timed out is reported with the stack of every thread
+        at the time, ahead of the traceback of the interruption.
+        """
+        formatted = "\n".join(traceback.format_exception(*error))
+        if (
+            issubclass(error[0], TestTimeout)
+            and self._watchdog
+            and self._watchdog.stacks
+        ):
+            formatted = (
+                "Thread stacks when the test timed out:\n\n%s\n\n%s"
+                % (self._watchdog.stacks, formatted)
+            )
+        return formatted
+
     def _write_result(self, status, test, error=None):
         """Write a test result to the stream in JSON format."""
         body = {
@@ -62,11 +303,66 @@ class PipedTestResult(unittest.result.TestResult):
             "output": self._stdout.getvalue(),
         }
         if error:
-            body["error"] = "\n".join(traceback.format_exception(*error))
+            body["error"] = self._format_error(error)
+        self.stream.write(f"{json.dumps(body)}\n")
+        self.stream.flush()
+        self._current_test = None
+
+    def write_timeout(self, test, timeout, stacks):
+        """Report a test that timed out, and couldn't be interrupted, as an error.
+
+        This is called from the watchdog thread, just before the process exits.
+        """
+        if self._current_test is None:
+            # The test's result has already been written.
+            return
+        body = {
+            "status": "E",
+            "end_time": time.time(),
+            "description": self.description(test),
+            "output": self._stdout.getvalue(),
+            "error": "Thread stacks when the test timed out:\n\n%s\n\n"
+            "TestTimeout: Test timed out after %gs, and couldn't be interrupted"
+            % (stacks, timeout),
+        }
+        self.stream.write(f"{json.dumps(body)}\n")
+        self.stream.flush()
+        self._current_test = None
+
+    def write_interrupted(self):
+        """Report the test that was running when the run was interrupted.
+
+        The test is reported with whatever output it had written so far.
+        """
+        test = self._current_test
+        if test is None:
+            return
+        body = {
+            "status": "I",
+            "end_time": time.time(),
+            "description": self.description(test),
+            "output": self._stdout.getvalue(),
+            "error": "Interrupted: the run was stopped while the test was running.",
+        }
         self.stream.write(f"{json.dumps(body)}\n")
         self.stream.flush()
         self._current_test = None
 
+    def _arm_watchdog(self, test):
+        """Start timing a test, if it has a timeout."""
+        timeout = test_timeout(test, self.timeout)
+        if timeout is None:
+            return
+        if self._watchdog is None:
+            self._watchdog = Watchdog(self)
+        self._watchdog.arm(test, timeout)
+
+    def close(self):
+        """Stop the watchdog, if one was started."""
+        if self._watchdog:
+            self._watchdog.close()
+            self._watchdog = None
+
     def startTest(self, test):
         super().startTest(test)
         self._current_test = test
@@ -83,6 +379,252 @@ class PipedTestResult(unittest.result.TestResult):
         self.stream.write(f"{json.dumps(body)}\n")
         self.stream.flush()
 
+        # An error in a class or module fixture is reported through a
+        # stand-in that is never stopped; only time the tests themselves.
+        if isinstance(test, unittest.TestCase):
+            self._arm_watchdog(test)
+
+        if self.trace_allocations:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            tracemalloc.start()
+        if resource:
+            self._usage = resource.getrusage(resource.RUSAGE_SELF)
+        self._collections = [stats["collections"] for stats in gc.get_stats()]
+
+        self._time_phases(test)
+        self._subtest_status = None
+        self._subtest_end = time.perf_counter()
+
+        if self.profile_dir:
+            if self._profiler:
+                # The last test never stopped (e.g., a class setup error).
+                self._profiler.disable()
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    def _timed(self, phase, function, report):
+        """Wrap a function so that the time it takes is recorded as a phase.
+
+        The time is passed to report(phase, duration) once the function
+        returns, or raises.
+        """
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                report(phase, time.perf_counter() - start)
+
+        return wrapper
+
+    def _add_phase(self, phase, duration):
+        """Add to the time spent in a phase of the current test."""
+        self._phases[phase] = self._phases.get(phase, 0.0) + duration
+
+    def _time_phases(self, test):
+        """Time the setUp, test method and tearDown of a test separately.
+
+        The methods are wrapped on the test instance, which TestCase.run
+        looks them up on after startTest; functools.wraps keeps any skip or
+        expected failure markers visible. Coroutines aren't timed, as they
+        don't run while they are being called.
+        """
+        self._phases = {}
+        self._timed_methods = []
+        method_name = getattr(test, "_testMethodName", None)
+        for phase, name in (
+            ("setUp", "setUp"),
+            ("test", method_name),
+            ("tearDown", "tearDown"),
+        ):
+            if name is None or name in vars(test):
+                continue
+            method = getattr(test, name, None)
+            if method is None or inspect.iscoroutinefunction(method):
+                continue
+            setattr(test, name, self._timed(phase, method, self._add_phase))
+            self._timed_methods.append(name)
+
+    def time_fixtures(self, suite):
+        """Time the class and module fixtures of every test in a suite.
+
+        Each fixture is wrapped where it is defined, and reports its time
+        as soon as it finishes, as a line of its own. Returns a list of
+        (owner, name, previous) tuples for restore_fixtures().
+        """
+        classes = []
+        for test in iter_tests(suite):
+            if isinstance(test, unittest.TestCase) and type(test) not in classes:
+                classes.append(type(test))
+
+        # The path of each test class; a class fixture reports its time
+        # under the class it was called for, which may have inherited it.
+        paths = {}
+        fixtures = []
+        modules = []
+        for cls in classes:
+            try:
+                path = self._get_node_path(cls)
+            except ValueError:
+                # Not a class from the test directory (e.g., a failed import).
+                continue
+            paths[cls] = path
+            for name in CLASS_FIXTURES:
+                owner = next(base for base in cls.__mro__ if name in vars(base))
+                fixture = vars(owner)[name]
+                if (
+                    owner is not unittest.TestCase
+                    and isinstance(fixture, classmethod)
+                    and (owner, name, fixture) not in fixtures
+                ):
+                    fixtures.append((owner, name, fixture))
+
+            module = sys.modules.get(cls.__module__)
+            if module is not None and module not in modules:
+                modules.append(module)
+                module_path = path.rsplit(".", 1)[0]
+                for name in MODULE_FIXTURES:
+                    function = getattr(module, name, None)
+                    if function is not None:
+                        fixtures.append((module, name, module_path, function))
+
+        replaced = []
+        for fixture in fixtures:
+            if len(fixture) == 3:
+                owner, name, method = fixture
+                wrapper = self._timed_class_fixture(name, method.__func__, paths)
+            else:
+                owner, name, path, function = fixture
+                wrapper = self._timed(
+                    name, function, functools.partial(self._write_fixture, path)
+                )
+            replaced.append((owner, name, vars(owner).get(name)))
+            setattr(owner, name, wrapper)
+        return replaced
+
+    def _timed_class_fixture(self, name, function, paths):
+        """Wrap the function of a class fixture in a classmethod that times it.
+
+        The function is called with the class the fixture is invoked on,
+        so a fixture reached through super() still gets the subclass. Only
+        the outermost call for a class is timed, under that class's path.
+        """
+        running = self._running_fixtures
+
+        @functools.wraps(function)
+        def wrapper(cls, *args, **kwargs):
+            key = (cls, name)
+            if cls not in paths or key in running:
+                return function(cls, *args, **kwargs)
+            running.add(key)
+            start = time.perf_counter()
+            try:
+                return function(cls, *args, **kwargs)
+            finally:
+                running.discard(key)
+                self._write_fixture(paths[cls], name, time.perf_counter() - start)
+
+        return classmethod(wrapper)
+
+    @staticmethod
+    def restore_fixtures(replaced):
+        """Undo time_fixtures()."""
+        for owner, name, previous in reversed(replaced):
+            if previous is None:
+                delattr(owner, name)
+            else:
+                setattr(owner, name, previous)
+
+    def _write_fixture(self, path, phase, duration):
+        """Write the time taken by a class or module fixture to the stream."""
+        body = {"fixture": {"path": path, "phase": phase, "duration": duration}}
+        self.stream.write(f"{json.dumps(body)}\n")
+        self.stream.flush()
+
+    def stopTest(self, test):
+        if self._watchdog:
+            self._watchdog.disarm()
+        super().stopTest(test)
+        if self._current_test is not None and self._subtest_status is not None:
+            # unittest reports no result of its own for a test with
+            # failing subtests; report the worst of them. Their errors
+            # have already been reported with each subtest.
+            self._write_result(self._subtest_status, test)
+            if self._subtest_status in ("F", "E"):
+                self._count_failure()
+        details = self._details(test)
+        if details:
+            # Further measurements of the test, sent after its result.
+            self.stream.write(f"{json.dumps({'details': details})}\n")
+            self.stream.flush()
+
+    def _details(self, test):
+        """Collect any measurements of the test that has just stopped."""
+        details = {}
+        for name in self._timed_methods:
+            delattr(test, name)
+        self._timed_methods = []
+        if self._phases:
+            details["phases"] = self._phases
+            self._phases = {}
+
+        if self._profiler:
+            self._profiler.disable()
+            stats_file = os.path.join(
+                self.profile_dir, self._get_test_path(test) + ".pstats"
+            )
+            self._profiler.dump_stats(stats_file)
+            details["profile"] = {
+                "stats_file": stats_file,
+                "top": summarize(self._profiler),
+            }
+            self._profiler = None
+
+        resources = self._resources()
+        if resources:
+            details["resources"] = resources
+        return details
+
+    def _resources(self):
+        """Measure the resources used by the test that has just stopped."""
+        resources = {}
+        if self._usage:
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            # ru_maxrss is in kilobytes, except on macOS, where it is bytes.
+            scale = 1 if sys.platform == "darwin" else 1024
+            resources["cpu_user"] = usage.ru_utime - self._usage.ru_utime
+            resources["cpu_system"] = usage.ru_stime - self._usage.ru_stime
+            resources["max_rss_delta"] = (
+                usage.ru_maxrss - self._usage.ru_maxrss
+            ) * scale
+            self._usage = None
+        if self._collections:
+            resources["gc_collections"] = [
+                stats["collections"] - before
+                for stats, before in zip(gc.get_stats(), self._collections)
+            ]
+            self._collections = None
+        if self.trace_allocations and tracemalloc.is_tracing():
+            resources["alloc_peak"] = tracemalloc.get_traced_memory()[1]
+            statistics = tracemalloc.take_snapshot().statistics("lineno")
+            resources["alloc_top"] = [
+                [str(stat.traceback), stat.size, stat.count]
+                for stat in statistics[: self.TOP_ALLOCATIONS]
+            ]
+            tracemalloc.stop()
+        return resources
+
+    def _get_node_path(self, cls):
+        """Return the path of the test case node for a test class."""
+        if self.use_old_discovery:
+            parts = cls.__module__.split(".")
+            tests_index = parts.index(DEFAULT_TEST_DIR)
+            return f"{parts[tests_index - 1]}.{cls.__name__}"
+        return f"{cls.__module__}.{cls.__qualname__}"
+
     def _get_test_path(self, test):
         if self.use_old_discovery:
             parts = test.id().split(".")
@@ -94,26 +636,71 @@ class PipedTestResult(unittest.result.TestResult):
         super().addSuccess(test)
         self._write_result("OK", test)
 
+    def _count_failure(self):
+        """Count a failed test, stopping the run if there have been too many."""
+        self.failed_count = self.failed_count + 1
+        if self.max_failures and self.failed_count >= self.max_failures:
+            self.stop()
+
     def addError(self, test, err):
         if self._current_test is None:
             self.startTest(test)
         super().addError(test, err)
         self._write_result("E", test, err)
+        self._count_failure()
 
     def addFailure(self, test, err):
         super().addFailure(test, err)
         self._write_result("F", test, err)
+        self._count_failure()
 
     def addSubTest(self, test, subtest, err):
+        super().addSubTest(test, subtest, err)
         if err is None:
-            self._write_result("OK", test)
+            status = "OK"
         elif issubclass(err[0], test.failureException):
-            self._write_result("F", test, err)
+            status = "F"
         else:
-            self._write_result("E", test, err)
+            status = "E"
+
+        self._write_subtest(
+            subtest,
+            status,
+            self._format_error(err) if err else None,
+        )
+
+    def _write_subtest(self, subtest, status, error=None):
+        """Write the result of a subtest to the stream in JSON format.
+
+        Each subtest is reported on a line of its own, without output,
+        which belongs to the test as a whole. A subtest's duration runs
+        from the end of the last subtest, or the start of the test.
+        """
+        now = time.perf_counter()
+        body = {
+            "name": subtest._subDescription(),
+            "status": status,
+            "duration": now - self._subtest_end,
+        }
+        if error:
+            body["error"] = error
+        self.stream.write(f"{json.dumps({'subtest': body})}\n")
+        self.stream.flush()
+        self._subtest_end = now
+
+        if self._subtest_status is None or status == "E":
+            self._subtest_status = status
+        elif status == "F" and self._subtest_status != "E":
+            self._subtest_status = status
+        elif self._subtest_status == "s":
+            # Skipped subtests don't make the test as a whole skipped.
+            self._subtest_status = status
 
     def addSkip(self, test, reason):
         super().addSkip(test, reason)
+        if isinstance(test, unittest.case._SubTest):
+            self._write_subtest(test, "s", reason)
+            return
         body = {
             "status": "s",
             "end_time": time.time(),
@@ -140,6 +727,7 @@ class PipedTestResult(unittest.result.TestResult):
         self.stream.write(f"{json.dumps(body)}\n")
         self.stream.flush()
         self._current_test = None
+        self._count_failure()
 
 
 class PipedTestRunner(unittest.TextTestRunner):
@@ -148,15 +736,43 @@ class PipedTestRunner(unittest.TextTestRunner):
     START_TEST_RESULTS = "\x02"  # ASCII STX (Start of Text)
     END_TEST_RESULTS = "\x03"    # ASCII ETX (End of Text)
 
-    def __init__(self, stream=sys.stdout, use_old_discovery=False):
+    def __init__(
+        self,
+        stream=sys.stdout,
+        use_old_discovery=False,
+        profile_dir=None,
+        trace_allocations=False,
+        max_failures=None,
+        timeout=None,
+    ):
         super().__init__(stream=stream)
         self.use_old_discovery = use_old_discovery
+        self.profile_dir = profile_dir
+        self.trace_allocations = trace_allocations
+        self.max_failures = max_failures
+        self.timeout = timeout
 
     def run(self, test):
         """Run the given test case or test suite."""
         old_stdout = sys.stdout
-        result = PipedTestResult(self.stream, self.use_old_discovery)
-        test(result)
+        result = PipedTestResult(
+            self.stream,
+            self.use_old_discovery,
+            profile_dir=self.profile_dir,
+            trace_allocations=self.trace_allocations,
+            max_failures=self.max_failures,
+            timeout=self.timeout,
+        )
+        replaced = result.time_fixtures(test)
+        try:
+            test(result)
+        except KeyboardInterrupt:
+            # The run was stopped (with SIGINT); report the test that was
+            # running, and end the results as usual.
+            result.write_interrupted()
+        finally:
+            result.restore_fixtures(replaced)
+            result.close()
         self.stream.write(f"{self.END_TEST_RESULTS}\n")
         self.stream.flush()
         sys.stdout = old_stdout
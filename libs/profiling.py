@@ -0,0 +1,103 @@
+import os
+import pstats
+
+# The number of functions reported with each profiled result.
+TOP_FUNCTIONS = 30
+
+# Call paths taking less time than this (in seconds) are left out of
+# collapsed stacks; they would be invisible in a flamegraph anyway.
+MIN_STACK_TIME = 0.000001
+
+# The deepest call path followed when building collapsed stacks.
+MAX_STACK_DEPTH = 200
+
+
+def function_label(function):
+    "Describe a function from profile stats, in the style used by pstats"
+    filename, line, name = function
+    if filename == "~":
+        # A built-in; the name already describes it.
+        return name
+    return "%s:%d(%s)" % (filename, line, name)
+
+
+def frame_label(function):
+    "Describe a function as a frame of a collapsed stack"
+    filename, line, name = function
+    if filename == "~":
+        label = name
+    else:
+        label = "%s (%s:%d)" % (name, os.path.basename(filename), line)
+    # Semicolons separate frames, and spaces separate the count.
+    return label.replace(";", ":").replace(" ", "_")
+
+
+def summarize(profiler, limit=TOP_FUNCTIONS):
+    """Return the functions that took the most time in a profile.
+
+    Each function is a [label, call count, own time, cumulative time] list,
+    ordered by cumulative time; lists, rather than dictionaries, keep the
+    summary compact when it is sent with the result.
+    """
+    stats = pstats.Stats(profiler).stats
+    rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)
+    return [
+        [function_label(function), calls, tottime, cumtime]
+        for function, (primitive, calls, tottime, cumtime, callers) in rows[:limit]
+    ]
+
+
+def collapsed_stacks(filename):
+    """Convert a .pstats file to collapsed stacks, for flamegraph tools.
+
+    Each line is a semicolon-separated call path, followed by the time
+    spent in the last function on that path, in microseconds. A profile
+    only records the time spent on each caller/callee edge, not on full
+    call paths, so the time on each path is estimated by dividing each
+    function's time between its callers in proportion.
+    """
+    stats = pstats.Stats(filename).stats
+
+    # The functions each function calls, with the cumulative time of those calls.
+    callees = {}
+    for function, (primitive, calls, tottime, cumtime, callers) in stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((function, edge[3]))
+
+    totals = {}
+    stack = [
+        ((function,), entry[3])
+        for function, entry in stats.items()
+        if not entry[4]  # No callers; the root of a call tree.
+    ]
+    while stack:
+        path, time = stack.pop()
+        function = path[-1]
+        primitive, calls, tottime, cumtime, callers = stats[function]
+        share = time / cumtime if cumtime else 0.0
+
+        key = ";".join(frame_label(frame) for frame in path)
+        totals[key] = totals.get(key, 0.0) + tottime * share
+
+        if len(path) >= MAX_STACK_DEPTH:
+            continue
+        for callee, edge_time in callees.get(function, []):
+            # Recursion is folded into the outermost call.
+            if callee in path:
+                continue
+            callee_time = edge_time * share
+            if callee_time >= MIN_STACK_TIME:
+                stack.append((path + (callee,), callee_time))
+
+    return [
+        "%s %d" % (key, round(total * 1000000))
+        for key, total in sorted(totals.items())
+        if round(total * 1000000)
+    ]
+
+
+def write_collapsed_stacks(stats_file, filename):
+    "Write the collapsed stacks of a .pstats file to a file."
+    with open(filename, "w") as f:
+        for line in collapsed_stacks(stats_file):
+            f.write(line + "\n")
@@ -0,0 +1,98 @@
+from libs.eta import median
+
+# Scales the median absolute deviation so that, for normally distributed
+# durations, the robust z-score matches the usual z-score.
+MAD_SCALE = 0.6745
+
+
+def robust_zscore(value, values, min_spread=0.0):
+    """Return how far a value lies above a list of values, in robust units.
+
+    The median and median absolute deviation stand in for the mean and
+    standard deviation, so a few outliers in the history don't hide a
+    regression. The deviation is never taken to be less than min_spread,
+    so that a perfectly steady history doesn't make every change significant.
+    """
+    center = median(values)
+    spread = max(median([abs(v - center) for v in values]), min_spread)
+    if not spread:
+        return 0.0
+    return MAD_SCALE * (value - center) / spread
+
+
+class RegressionDetector(object):
+    """Spot tests that have become significantly slower than their history.
+
+    Each completed test's duration is compared with its own durations in
+    the most recent runs that included it. A test is flagged when its
+    robust z-score is above THRESHOLD, and it is both MIN_RATIO times and
+    MIN_DELTA seconds slower than its median; the last two keep tiny or
+    noisy tests from being flagged for changes nobody would notice.
+    """
+
+    THRESHOLD = 3.5
+
+    MIN_RATIO = 1.5
+
+    MIN_DELTA = 0.05
+
+    # Tests with fewer recorded durations than this are never flagged.
+    MIN_RUNS = 3
+
+    # The smallest spread assumed, as a fraction of the median duration.
+    MIN_SPREAD = 0.05
+
+    def __init__(self, history=None, runs=10):
+        # The last `runs` durations recorded for each test, newest first.
+        self._recorded = history.recent_durations(runs) if history else {}
+
+        # The regressions found so far in this run, keyed by test path.
+        self.regressions = {}
+
+    def check(self, path, duration):
+        """Compare a test's duration with its history.
+
+        Returns a description of the regression, or None if the test
+        isn't significantly slower than usual.
+        """
+        recorded = self._recorded.get(path)
+        if duration is None or not recorded or len(recorded) < self.MIN_RUNS:
+            return None
+
+        baseline = median(recorded)
+        if duration < baseline * self.MIN_RATIO or duration - baseline < self.MIN_DELTA:
+            return None
+
+        zscore = robust_zscore(duration, recorded, baseline * self.MIN_SPREAD)
+        if zscore < self.THRESHOLD:
+            return None
+
+        regression = {
+            "baseline": baseline,
+            "ratio": duration / baseline if baseline else None,
+            "zscore": zscore,
+        }
+        self.regressions[path] = dict(regression, duration=duration)
+        return regression
+
+    def top(self, limit=10):
+        """Return the worst regressions in this run, as (path, regression) pairs.
+
+        The regressions that added the most time to the run come first.
+        """
+        return sorted(
+            self.regressions.items(),
+            key=lambda item: item[1]["duration"] - item[1]["baseline"],
+            reverse=True,
+        )[:limit]
+
+
+def describe(path, regression):
+    "Describe a regression for a run summary, e.g. 'path: 0.10s -> 0.45s (4.5x)'."
+    ratio = regression.get("ratio")
+    return "%s: %0.2fs -> %0.2fs%s" % (
+        path,
+        regression["baseline"],
+        regression["duration"],
+        " (%0.1fx)" % ratio if ratio else "",
+    )
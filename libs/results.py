@@ -0,0 +1,165 @@
+import hashlib
+import re
+import sys
+import weakref
+import zlib
+
+
+def error_signature(error):
+    """Reduce an error report to a short signature that identifies the failure.
+
+    The signature is the final line of the traceback (the exception type
+    and message), with memory addresses and numbers normalized, so that
+    the same failure produces the same signature from run to run.
+    """
+    if not error:
+        return None
+    lines = [line.strip() for line in error.strip().splitlines() if line.strip()]
+    if not lines:
+        return None
+    signature = re.sub(r"0x[0-9a-fA-F]+", "0x?", lines[-1])
+    signature = re.sub(r"\d+(\.\d+)?", "N", signature)
+    return signature[:200]
+
+
+# The location of a frame in a formatted traceback.
+FRAME_LOCATION = re.compile(r'^\s*File "([^"]+)", line \d+, in (\S+)', re.MULTILINE)
+
+
+def failure_signature(error):
+    """Reduce an error report to a signature shared by identical failures.
+
+    This is the error signature, qualified by the function that raised
+    it, so that the same exception raised in different places (e.g., a
+    bare AssertionError) isn't mistaken for the same failure.
+    """
+    signature = error_signature(error)
+    if signature is None:
+        return None
+    frames = FRAME_LOCATION.findall(error)
+    if frames:
+        filename, function = frames[-1]
+        return "%s (%s, in %s)" % (
+            signature,
+            filename.replace("\\", "/").rpartition("/")[2],
+            function,
+        )
+    return signature
+
+
+class StoredText(object):
+    """The body of an error or output, held compressed where that saves space.
+
+    Like any lazily loaded result value, the text is recovered by read().
+    """
+
+    __slots__ = ("_data", "_compressed", "__weakref__")
+
+    def __init__(self, text):
+        data = text.encode("utf-8")
+        compressed = zlib.compress(data)
+        if len(compressed) < len(data):
+            self._data = compressed
+            self._compressed = True
+        else:
+            self._data = text
+            self._compressed = False
+
+    def __repr__(self):
+        return "<StoredText %d bytes%s>" % (
+            len(self._data),
+            " compressed" if self._compressed else "",
+        )
+
+    def read(self):
+        "Return the text."
+        if self._compressed:
+            return zlib.decompress(self._data).decode("utf-8")
+        return self._data
+
+
+class ResultStore(object):
+    """Compact storage for the output and errors of the tests in a project.
+
+    Identical bodies are stored once: short ones are interned, and longer
+    ones are keyed by a hash of their content, and compressed. A body is
+    kept for as long as any result refers to it.
+
+    The store also groups failing tests by the signature of their error,
+    so that tests failing in the same way can be shown together.
+    """
+
+    # Bodies shorter than this (in characters) are interned, but not compressed.
+    COMPRESS_THRESHOLD = 1024
+
+    def __init__(self):
+        self._bodies = weakref.WeakValueDictionary()
+
+        # The failure signature of each failing test, and the failing
+        # tests with each signature.
+        self._signatures = {}
+        self._groups = {}
+
+    def intern(self, text):
+        """Return a compact stand-in for a result body.
+
+        Anything other than a string (e.g., a lazily loaded value) is
+        returned unchanged.
+        """
+        if not isinstance(text, str):
+            return text
+        if len(text) < self.COMPRESS_THRESHOLD:
+            return sys.intern(text)
+
+        key = hashlib.sha1(text.encode("utf-8")).digest()
+        body = self._bodies.get(key)
+        if body is None:
+            body = StoredText(text)
+            self._bodies[key] = body
+        return body
+
+    def set_failure(self, path, error):
+        """Record the error of a failing test, or clear it if error is None.
+
+        Errors that are loaded lazily aren't read, so those tests aren't grouped.
+        """
+        self.discard(path)
+        signature = failure_signature(error) if isinstance(error, str) else None
+        if signature is not None:
+            self._signatures[path] = signature
+            self._groups.setdefault(signature, set()).add(path)
+
+    def discard(self, path):
+        "Forget the failure of a test."
+        signature = self._signatures.pop(path, None)
+        if signature is not None:
+            group = self._groups[signature]
+            group.discard(path)
+            if not group:
+                del self._groups[signature]
+
+    def signature(self, path):
+        "Return the failure signature of a test, or None if it isn't failing."
+        return self._signatures.get(path)
+
+    def group(self, signature):
+        "Return the paths of the failing tests with a signature."
+        return sorted(self._groups.get(signature, ()))
+
+    def failure_groups(self, min_size=2):
+        """Return (signature, paths) for every group of identical failures.
+
+        The largest groups come first.
+        """
+        groups = [
+            (signature, sorted(paths))
+            for signature, paths in self._groups.items()
+            if len(paths) >= min_size
+        ]
+        groups.sort(key=lambda group: (-len(group[1]), group[0]))
+        return groups
+
+    @property
+    def body_count(self):
+        "The number of distinct long bodies currently stored."
+        return len(self._bodies)
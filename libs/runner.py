@@ -1,9 +1,15 @@
 import json
+import os
+import shutil
+import signal
 import subprocess
 import sys
+import tempfile
+import time
+from collections import Counter
 from threading import Thread
 
-from libs.constants import DEFAULT_TEST_DIR
+from libs.constants import DEFAULT_TEST_DIR, PROFILE_DIRNAME
 
 try:
     from Queue import Empty, Queue
@@ -11,8 +17,13 @@ except ImportError:
     from queue import Queue, Empty  # python 3.x
 
 from libs import pipes
+from libs.eta import ETAEstimator
 from libs.events import EventSource
 from libs.model import TestMethod
+from libs.ordering import ORDER_DISCOVERY, order_tests
+from libs.regression import RegressionDetector
+from libs.scheduler import Scheduler, partition
+from libs.stats import RepeatStats
 
 
 def enqueue_output(out, queue):
@@ -26,6 +37,71 @@ def enqueue_output(out, queue):
     out.close()
 
 
+def write_labels(stdin, labels):
+    """A utility method for passing test labels to a subprocess.
+
+    Labels are written one per line; writing happens in a separate
+    thread, so a large list can't block the caller.
+    """
+    try:
+        stdin.write("".join(label + "\n" for label in labels).encode("utf-8"))
+        stdin.close()
+    except (IOError, OSError):
+        # The subprocess went away before reading its labels.
+        pass
+
+
+def drain(queue):
+    "Return every item currently available on a queue, without blocking."
+    items = []
+    try:
+        while True:
+            items.append(queue.get(block=False))
+    except Empty:
+        # queue.get() raises an exception when the queue is empty.
+        # This means there is no more output to consume at this time.
+        pass
+    return items
+
+
+def signal_group(proc, signum):
+    """Send a signal to a subprocess, and every process it started.
+
+    On POSIX, each worker's subprocess leads a process group of its own,
+    which any processes started by its tests join; elsewhere, only the
+    subprocess itself is signalled.
+
+    Once the subprocess has been reaped, its pid (and so its process
+    group id) may be reused by an unrelated process; it isn't signalled.
+    """
+    if proc.poll() is not None:
+        return
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(proc.pid, signum)
+        else:
+            proc.send_signal(signum)
+    except (ProcessLookupError, OSError, ValueError):
+        # The processes exited before they could be signalled.
+        pass
+
+
+def profile_directory(testdir):
+    """Return an empty directory to hold the profile stats of a run.
+
+    The stats of each profiled run replace those of the last one, in the
+    test directory, so they don't pile up. If the test directory can't be
+    written to, a temporary directory is used instead.
+    """
+    path = os.path.abspath(os.path.join(testdir, PROFILE_DIRNAME))
+    shutil.rmtree(path, ignore_errors=True)
+    try:
+        os.makedirs(path)
+    except OSError:
+        return tempfile.mkdtemp(prefix="pytest-gui-profile-")
+    return path
+
+
 def parse_status_and_error(post):
     if post["status"] == "OK":
         status = TestMethod.STATUS_PASS
@@ -45,38 +121,90 @@ def parse_status_and_error(post):
     elif post["status"] == "E":
         status = TestMethod.STATUS_ERROR
         error = post.get("error")
+    elif post["status"] == "I":
+        status = TestMethod.STATUS_INTERRUPTED
+        error = post.get("error")
 
     return status, error
 
 
-class Runner(EventSource):
-    "A wrapper around the subprocess that executes tests."
+def describe_subtests(subtests, error=None, limit=10):
+    """Describe the failures of a test's subtests, after any error of its own.
 
-    def __init__(self, project, count, labels, testdir):
-        self.project = project
+    Only the first `limit` errors are included; every error is kept with
+    its subtest.
+    """
+    failed = [
+        subtest for subtest in subtests if subtest[1] in TestMethod.FAILING_STATES
+    ]
+    if not failed:
+        return error
+    parts = [error] if error else []
+    parts.append("%d of %d subtests failed" % (len(failed), len(subtests)))
+    for name, status, duration, subtest_error in failed[:limit]:
+        parts.append("%s\n%s" % (name, subtest_error or ""))
+    if len(failed) > limit:
+        parts.append("... and %d more" % (len(failed) - limit))
+    return "\n\n".join(parts)
+
+
+class Worker(object):
+    """A subprocess executing a share of the tests in a run.
+
+    The worker parses the output of its subprocess, and reports each
+    test as it starts and ends to the Runner that owns it.
+    """
+
+    def __init__(self, runner, labels, share, repeat=1):
+        self.runner = runner
+        self.labels = labels
 
+        # The paths of the tests this worker runs (once for each time it
+        # runs them), and the number of results reported for each.
+        self.share = share
+        self.repeat = repeat
+        self.completed = Counter()
+
+        # Labels are passed on stdin, rather than on the command line,
+        # so that there is no limit on the number that can be run.
         self.proc = subprocess.Popen(
-            self.project.execute_commandline(labels, testdir),
-            stdin=None,
+            runner.project.execute_commandline(
+                ["-"] if labels else [],
+                runner.testdir,
+                profile_dir=runner.profile_dir,
+                trace_allocations=runner.trace_allocations,
+                max_failures=runner.max_failures,
+                timeout=runner.timeout,
+                repeat=repeat,
+            ),
+            stdin=subprocess.PIPE if labels else None,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             shell=False,
-            bufsize=1,
             close_fds="posix" in sys.builtin_module_names,
+            start_new_session=hasattr(os, "killpg"),
         )
+        if labels:
+            t = Thread(target=write_labels, args=(self.proc.stdin, labels))
+            t.daemon = True
+            t.start()
 
         # Piped stdout/stderr reads are blocking; therefore, we need to
         # do all our readline calls in a background thread, and use a
         # queue object to store lines that have been read.
         self.stdout = Queue()
-        t = Thread(target=enqueue_output, args=(self.proc.stdout, self.stdout))
-        t.daemon = True
-        t.start()
+        self.stdout_reader = Thread(
+            target=enqueue_output, args=(self.proc.stdout, self.stdout)
+        )
+        self.stdout_reader.daemon = True
+        self.stdout_reader.start()
 
         self.stderr = Queue()
-        t = Thread(target=enqueue_output, args=(self.proc.stderr, self.stderr))
-        t.daemon = True
-        t.start()
+        self.stderr_reader = Thread(
+            target=enqueue_output, args=(self.proc.stderr, self.stderr)
+        )
+        self.stderr_reader.daemon = True
+        self.stderr_reader.start()
 
         # The TestMethod object currently under execution.
         self.current_test = None
@@ -89,66 +217,62 @@ class Runner(EventSource):
         # An accumulator for error output from the tests.
         self.error_buffer = []
 
-        # The timestamp when current_test started
-        self.start_time = None
+        # Set once the subprocess has reported the end of its test results.
+        self.finished = False
 
-        # The total count of tests under execution
-        self.total_count = count
-
-        # The count of tests that have been executed.
-        self.completed_count = 0
-
-        # The count of specific test results.
-        self.result_count = {}
+        # Set once the worker will produce no more results, either
+        # because it finished, or because its subprocess stopped.
+        self.done = False
 
     @property
     def is_running(self):
-        "Return True if this runner currently running."
+        "Return True if the subprocess is currently running."
         return self.proc.poll() is None
 
-    @property
-    def any_failed(self):
-        return sum(
-            self.result_count.get(state, 0) for state in TestMethod.FAILING_STATES
+    def interrupt(self):
+        """Ask the subprocess to stop, after reporting the test it is running.
+
+        Where process groups aren't available, the subprocess is terminated.
+        """
+        signal_group(
+            self.proc, signal.SIGINT if hasattr(os, "killpg") else signal.SIGTERM
         )
 
     def terminate(self):
-        "Stop the executor."
-        self.proc.terminate()
+        "Stop the subprocess, and any processes it started."
+        signal_group(self.proc, signal.SIGTERM)
+
+    def kill(self):
+        "Kill the subprocess, and any processes it started."
+        signal_group(self.proc, getattr(signal, "SIGKILL", signal.SIGTERM))
 
     def poll(self):
-        "Poll the runner looking for new test output"
-        stopped = False
-        finished = False
-
-        # Read from stdout, building a buffer.
-        lines = []
-        try:
-            while True:
-                lines.append(self.stdout.get(block=False))
-        except Empty:
-            # queue.get() raises an exception when the queue is empty.
-            # This means there is no more output to consume at this time.
-            pass
-
-        # Read from stderr, building a buffer.
-        try:
-            while True:
-                self.error_buffer.append(self.stderr.get(block=False))
-        except Empty:
-            # queue.get() raises an exception when the queue is empty.
-            # This means there is no more output to consume at this time.
-            pass
-
-        # Check to see if the subprocess is still running.
-        # If it isn't, raise an error.
-        if self.proc is None:
-            stopped = True
-        elif self.proc.poll() is not None:
-            stopped = True
+        "Consume any output from the subprocess, reporting results to the runner."
+        # If the subprocess has exited, and all its output has been
+        # read, nothing more will arrive after the queues are drained.
+        exited = (
+            self.proc.poll() is not None
+            and not self.stdout_reader.is_alive()
+            and not self.stderr_reader.is_alive()
+        )
+
+        lines = drain(self.stdout)
+        self.error_buffer.extend(drain(self.stderr))
 
         # Process all the full lines that are available
         for line in lines:
+            if self.finished:
+                break
+
+            # Class and module fixtures report their time as they finish,
+            # which can be before, between or after tests.
+            if line.startswith('{"fixture"'):
+                fixture = json.loads(line)["fixture"]
+                self.runner.record_fixture(
+                    fixture["path"], fixture["phase"], fixture["duration"]
+                )
+                continue
+
             # Look for a separator.
             if line in (
                 pipes.PipedTestResult.RESULT_SEPARATOR,
@@ -161,90 +285,26 @@ class Runner(EventSource):
                 else:
                     # Start of new test result; record the last result
                     # Then, work out what content goes where.
-                    pre = json.loads(self.buffer[0])
-                    if len(self.buffer) == 2:
-                        # No subtests are present, or only one subtest
-                        post = json.loads(self.buffer[1])
-                        status, error = parse_status_and_error(post)
-
-                    else:
-                        # We have subtests; capture the most important status (until we can capture all the statuses)
-                        status = (
-                            TestMethod.STATUS_PASS
-                        )  # Assume pass until told otherwise
-                        error = ""
-                        for line_num in range(1, len(self.buffer)):
-                            post = json.loads(self.buffer[line_num])
-                            subtest_status, subtest_error = parse_status_and_error(post)
-                            if subtest_status > status:
-                                status = subtest_status
-                            if subtest_error:
-                                error += subtest_error + "\n\n"
-
-                    # Increase the count of executed tests
-                    self.completed_count = self.completed_count + 1
-
-                    # Get the start and end times for the test
-                    start_time = float(pre["start_time"])
-                    end_time = float(post["end_time"])
-
-                    self.current_test.description = post["description"]
-
-                    self.current_test.set_result(
-                        status=status,
-                        output=post.get("output"),
-                        error=error,
-                        duration=end_time - start_time,
-                    )
-
-                    # Work out how long the suite has left to run (approximately)
-                    if self.start_time is None:
-                        self.start_time = start_time
-                    total_duration = end_time - self.start_time
-                    time_per_test = total_duration / self.completed_count
-                    remaining_time = (
-                        self.total_count - self.completed_count
-                    ) * time_per_test
-                    if remaining_time > 4800:
-                        remaining = "%s hours" % int(remaining_time / 2400)
-                    elif remaining_time > 2400:
-                        remaining = "%s hour" % int(remaining_time / 2400)
-                    elif remaining_time > 120:
-                        remaining = "%s mins" % int(remaining_time / 60)
-                    elif remaining_time > 60:
-                        remaining = "%s min" % int(remaining_time / 60)
-                    else:
-                        remaining = "%ss" % int(remaining_time)
-
-                    # Update test result counts
-                    self.result_count.setdefault(status, 0)
-                    self.result_count[status] = self.result_count[status] + 1
-
-                    # Notify the display to update.
-                    self.emit(
-                        "test_end",
-                        test_path=self.current_test.path,
-                        result=status,
-                        remaining_time=remaining,
-                    )
+                    if self.buffer:
+                        self._record_result()
 
                     # Clear the decks for the next test.
                     self.current_test = None
                     self.buffer = []
 
-                    if line == pipes.PipedTestRunner.END_TEST_RESULTS:
-                        # End of test execution.
-                        # Mark the runner as finished, and move back
-                        # to a pre-test state in the results.
-                        finished = True
-                        self.buffer = None
+                if line == pipes.PipedTestRunner.END_TEST_RESULTS:
+                    # End of test execution.
+                    # Mark the worker as finished, and move back
+                    # to a pre-test state in the results.
+                    self.finished = True
+                    self.buffer = None
 
             else:
                 # Not a separator line, so it's actual content.
                 if self.buffer is None:
                     # Suite isn't running yet - just display the output
                     # as a status update line.
-                    self.emit("test_status_update", update=line)
+                    self.runner.emit("test_status_update", update=line)
                 else:
                     # Suite is running - have we got an active test?
                     # Doctest (and some other tools) output invisible escape sequences.
@@ -262,32 +322,620 @@ class Runner(EventSource):
                             # No active test; first line tells us which test is running.
                             pre = json.loads(line)
                         except ValueError:
-                            self.emit("suit_end")
-                            return True
-                        self.current_test = self.project.confirm_exists(pre["path"])
-                        self.emit("test_start", test_path=pre["path"])
-        # If we're not finished, requeue the event.
-        if finished:
-            if self.error_buffer:
-                self.emit("suite_end", error="\n".join(self.error_buffer))
-            else:
-                self.emit("suite_end")
-            return False
+                            self.runner.emit("suit_end")
+                            return
+                        self.current_test = self.runner.project.confirm_exists(
+                            pre["path"]
+                        )
+                        self.runner.emit("test_start", test_path=pre["path"])
+
+        if exited and not self.finished and self.buffer and self.current_test:
+            # The subprocess stopped without ending the last result it wrote
+            # (e.g., a test that timed out, or crashed); record what it got to.
+            self._record_result()
+            self.current_test = None
+            self.buffer = []
+
+        self.done = self.finished or exited
 
-        elif stopped:
-            # Suite has stopped producing output.
-            if self.error_buffer:
-                self.emit("suite_error", error="\n".join(self.error_buffer))
+    @property
+    def timed_out(self):
+        "Return True if the subprocess gave up on a test that timed out."
+        return self.proc.poll() == pipes.Watchdog.EXIT_STATUS
+
+    def remaining(self):
+        "Return the paths of the tests in this worker's share without a result."
+        completed = Counter(self.completed)
+        remaining = []
+        for path in self.share:
+            if completed[path]:
+                completed[path] -= 1
             else:
-                self.emit("suite_error", error="Test output ended unexpectedly")
+                remaining.append(path)
+        return remaining
+
+    def _record_result(self):
+        "Parse the buffered output of the current test, and report its result."
+        pre = json.loads(self.buffer[0])
+
+        # Before the result, there may be a line for each subtest; after
+        # it, there may be a line of further measurements.
+        posts = []
+        subtests = []
+        details = {}
+        for line in self.buffer[1:]:
+            body = json.loads(line)
+            if "subtest" in body:
+                subtest = body["subtest"]
+                subtest_status, subtest_error = parse_status_and_error(subtest)
+                subtests.append(
+                    (
+                        subtest["name"],
+                        subtest_status,
+                        subtest["duration"],
+                        subtest_error,
+                    )
+                )
+            elif "details" in body:
+                details.update(body["details"])
+            else:
+                posts.append(body)
+
+        if not posts:
+            # The subprocess exited before it reported the test's result
+            # (e.g., it crashed, or was killed); the test can't have passed.
+            post = {"end_time": time.time()}
+            if self.runner.stopping is not None:
+                status = TestMethod.STATUS_INTERRUPTED
+                error = "The run was stopped before the test finished."
+            else:
+                status = TestMethod.STATUS_ERROR
+                error = "The worker running the test exited with code %s." % (
+                    self.proc.poll(),
+                )
 
-            # Suite has finished; don't requeue
-            return False
+        elif len(posts) == 1:
+            # No subtests are present, or only one subtest
+            post = posts[0]
+            status, error = parse_status_and_error(post)
+
+        else:
+            # We have subtests; capture the most important status (until we can capture all the statuses)
+            status = TestMethod.STATUS_PASS  # Assume pass until told otherwise
+            error = ""
+            for post in posts:
+                subtest_status, subtest_error = parse_status_and_error(post)
+                if subtest_status > status:
+                    status = subtest_status
+                if subtest_error:
+                    error += subtest_error + "\n\n"
+
+        if subtests:
+            details["subtests"] = subtests
+            error = describe_subtests(subtests, error)
+
+            # A failing subtest fails the test, however the rest of it went.
+            failing = [
+                subtest[1]
+                for subtest in subtests
+                if subtest[1] in TestMethod.FAILING_STATES
+            ]
+            if failing:
+                status = max([status] + failing)
+
+        self.completed[self.current_test.path] += 1
+        if "description" in post:
+            self.current_test.description = post["description"]
+        self.runner.record_result(
+            self.current_test,
+            status=status,
+            output=post.get("output"),
+            error=error,
+            start_time=float(pre["start_time"]),
+            end_time=float(post["end_time"]),
+            **details
+        )
+
+
+class Runner(EventSource):
+    """A wrapper around the subprocesses that execute tests.
+
+    With more than one worker, the tests are split between that many
+    subprocesses, which run in parallel.
+
+    A failing test can be retried up to `retries` more times; it is only
+    reported once its final result is known, and if any retry passes, it
+    is reported as flaky. Retries run as soon as a worker is free, in as
+    many subprocesses as there are free workers.
+
+    With `repeat` more than 1 (a stress run), every test is run that many
+    times, with the repetitions spread across the workers. Each run is
+    reported as it completes, and the test's status summarizes its runs
+    so far; `repeats` holds the pass rate and durations of each test.
+
+    If a checkpoint is provided, the final result of each test is written
+    to it as it arrives, so that a run that is cut short can be resumed;
+    with resume=True, the checkpoint's journal is continued rather than
+    started afresh. Stress runs aren't checkpointed.
+    """
+
+    # When the run is stopped, workers have INTERRUPT_TIMEOUT seconds to
+    # report the tests they were running, and then TERMINATE_TIMEOUT
+    # seconds to exit once terminated, before they are killed.
+    INTERRUPT_TIMEOUT = 5.0
+    TERMINATE_TIMEOUT = 5.0
+
+    def __init__(
+        self,
+        project,
+        count,
+        labels,
+        testdir,
+        history=None,
+        workers=1,
+        profile=False,
+        trace_allocations=False,
+        order=ORDER_DISCOVERY,
+        max_failures=None,
+        timeout=None,
+        retries=0,
+        repeat=1,
+        checkpoint=None,
+        resume=False,
+    ):
+        self.project = project
+        self.testdir = testdir
+        self.worker_count = max(1, workers)
+
+        # A failed test is retried up to this many times; retrying makes
+        # no sense in a stress run, which reports every run.
+        self.repeat = max(1, repeat)
+        self.retries = retries if self.repeat == 1 else 0
+
+        # The failed attempts of each test being retried, as (status,
+        # error, duration, output), and the tests waiting for a worker.
+        self._failed_attempts = {}
+        self._retry_queue = []
+
+        # In a stress run, the runs of each test, and its first failure.
+        self.repeats = {}
+        self._first_failures = {}
+
+        # If provided, the timeout of any test without one of its own, in seconds.
+        self.timeout = timeout
+
+        # If provided, the run stops once this many tests have failed,
+        # across all workers; stopped_early is set if it did.
+        self.max_failures = max_failures
+        self.stopped_early = False
+
+        # Set when the run is stopped by stop(), and the time it was, and
+        # how far the workers have been pushed to stop since: 0 when they
+        # have been interrupted, 1 terminated, and 2 killed.
+        self.interrupted = False
+        self.stopping = None
+        self._stop_stage = None
+
+        # If True, the memory allocated by each test is traced.
+        self.trace_allocations = trace_allocations
+
+        # If profiling, the directory holding the stats of each test.
+        self.profile_dir = profile_directory(testdir) if profile else None
+
+        # The store recording the results of this run, if any.
+        self.history = history
 
+        # The total count of tests under execution (counting each
+        # repetition, in a stress run)
+        self.total_count = count * self.repeat
+
+        # The count of tests that have been executed.
+        self.completed_count = 0
+
+        # The count of specific test results.
+        self.result_count = {}
+
+        # Expand the labels to every test method they cover. Workers can
+        # only share out individual tests; each worker gets a share of
+        # these, and the time remaining is predicted for each share.
+        paths = project.test_paths(labels)
+
+        # Unless tests run in discovery order, the executor is given every
+        # test, in the order they are to run.
+        ordered = order_tests(paths, order, project, testdir, history)
+
+        # With more than one worker, the tests are shared out so that the
+        # tests of a class or module with fixtures run together.
+        scheduler = Scheduler(project, history)
+
+        if self.repeat > 1 and paths:
+            # The repetitions are spread across the workers; if there are
+            # more workers than repetitions, the tests are split too.
+            repeats = [
+                len(group) for group in partition(list(range(self.repeat)), workers)
+            ]
+            parts = []
+            for count in repeats:
+                parts.extend(
+                    (part, count)
+                    for part in scheduler.schedule(
+                        ordered, self.worker_count // len(repeats)
+                    )
+                )
+            shares = [part * count for part, count in parts]
+        elif workers > 1 and paths:
+            parts = [(part, 1) for part in scheduler.schedule(ordered, workers)]
+            shares = [part for part, count in parts]
+        elif order != ORDER_DISCOVERY:
+            parts = [(ordered, 1)]
+            shares = [ordered]
         else:
-            # Still running - requeue event.
+            parts = [(labels, 1)]
+            shares = [paths]
+
+        # Predicts the time remaining, from the history of each test.
+        self.eta = ETAEstimator(shares, history)
+
+        # Spots tests that have become slower than their history.
+        self.regressions = RegressionDetector(history)
+        self.run_id = history.start_run(testdir) if history else None
+
+        # The journal of the run's results, if it can be resumed.
+        self.checkpoint = checkpoint if self.repeat == 1 else None
+        if self.checkpoint:
+            try:
+                if resume:
+                    self.checkpoint.resume()
+                else:
+                    self.checkpoint.start(testdir, paths)
+            except (IOError, OSError) as e:
+                sys.stderr.write("Unable to checkpoint the run: %s\n" % e)
+                self.checkpoint = None
+
+        self.workers = [
+            Worker(self, part, share, count)
+            for (part, count), share in zip(parts, shares)
+        ]
+
+    @property
+    def is_running(self):
+        "Return True if this runner currently running."
+        return any(worker.is_running for worker in self.workers)
+
+    @property
+    def any_failed(self):
+        return sum(
+            self.result_count.get(state, 0) for state in TestMethod.FAILING_STATES
+        )
+
+    def terminate(self):
+        "Stop the executor at once, without waiting for any results."
+        for worker in self.workers:
+            worker.terminate()
+        if self.history:
+            self.history.finish_run(self.run_id)
+        if self.checkpoint:
+            self.checkpoint.close()
+
+    def stop(self):
+        """Stop the run gracefully; keep polling until the run ends.
+
+        Each worker is interrupted (with SIGINT), reports the test it was
+        running as interrupted, with its output so far, and ends its
+        results. A worker that hasn't finished within INTERRUPT_TIMEOUT
+        is terminated, and one that hasn't exited TERMINATE_TIMEOUT after
+        that is killed, along with every process it started.
+        """
+        if self.stopping is not None:
+            return
+        self.interrupted = True
+        self._interrupt_workers()
+
+    def _interrupt_workers(self):
+        "Interrupt every worker; any that are slow to stop are terminated, then killed."
+        self.stopping = time.monotonic()
+        self._stop_stage = 0
+        for worker in self.workers:
+            if not worker.done:
+                worker.interrupt()
+
+    def kill(self):
+        "Kill every worker, and everything it started; keep polling until the run ends."
+        self.interrupted = True
+        if self.stopping is None:
+            self.stopping = time.monotonic()
+        self._stop_stage = 2
+        for worker in self.workers:
+            worker.kill()
+
+    def _escalate_stop(self):
+        "Terminate, then kill, any workers that are slow to stop."
+        elapsed = time.monotonic() - self.stopping
+        if self._stop_stage < 2 and elapsed >= (
+            self.INTERRUPT_TIMEOUT + self.TERMINATE_TIMEOUT
+        ):
+            self._stop_stage = 2
+            for worker in self.workers:
+                if not worker.done:
+                    worker.kill()
+        elif self._stop_stage < 1 and elapsed >= self.INTERRUPT_TIMEOUT:
+            self._stop_stage = 1
+            for worker in self.workers:
+                if not worker.done:
+                    worker.terminate()
+
+    def record_result(
+        self, testMethod, status, output, error, start_time, end_time, **details
+    ):
+        "Record the result of a test reported by a worker, and announce it."
+        path = testMethod.path
+        duration = end_time - start_time
+
+        # Only a test's first attempt was expected by the time estimate.
+        if path not in self._failed_attempts:
+            self.eta.test_end(path, duration)
+
+        if self.repeat > 1:
+            # The test's status summarizes its runs so far; the run itself
+            # is counted, and recorded in the history.
+            result, error = self._repeated_result(path, status, error, duration)
+            details["repeats"] = self.repeats[path]
+        elif status in TestMethod.FAILING_STATES and self._retry(
+            path, status, error, duration, output
+        ):
+            # The result is recorded once the retries are done.
+            return
+        else:
+            status, error, attempts = self._retried_result(path, status, error)
+            if attempts:
+                details["attempts"] = attempts
+            result = status
+
+        # Increase the count of executed tests
+        self.completed_count = self.completed_count + 1
+
+        slower = self.regressions.check(path, duration)
+        if slower:
+            details["slower"] = slower
+
+        testMethod.set_result(
+            status=result,
+            output=output,
+            error=error,
+            duration=duration,
+            **details
+        )
+
+        if self.history:
+            self.history.record(
+                self.run_id,
+                path,
+                status,
+                duration,
+                error,
+                end_time,
+            )
+            for phase, phase_duration in details.get("phases", {}).items():
+                self.history.record_phase(self.run_id, path, phase, phase_duration)
+
+        if self.checkpoint:
+            self.checkpoint.record(path, status, duration, output, error, **details)
+
+        # Work out how long the suite has left to run
+        remaining = self.eta.describe()
+
+        # Update test result counts
+        self.result_count.setdefault(status, 0)
+        self.result_count[status] = self.result_count[status] + 1
+
+        # Once there have been enough failures, stop every worker; each
+        # stops itself after that many of its own failures, but only the
+        # runner sees the failures of all of them. The tests the other
+        # workers are running are reported as interrupted, as for stop().
+        if (
+            self.max_failures
+            and self.any_failed >= self.max_failures
+            and not self.stopped_early
+        ):
+            self.stopped_early = True
+            if self.stopping is None:
+                self._interrupt_workers()
+
+        # Notify the display to update.
+        self.emit(
+            "test_end",
+            test_path=path,
+            result=status,
+            remaining_time=remaining,
+        )
+
+    def _retry(self, path, status, error, duration, output):
+        """Hold back a failed result, and queue the test to run again.
+
+        Returns False if the test has had all its retries, or the run is stopping.
+        """
+        attempts = self._failed_attempts.get(path, [])
+        if self.stopped_early or len(attempts) >= self.retries:
+            return False
+        self._failed_attempts[path] = attempts + [(status, error, duration, output)]
+        self._retry_queue.append(path)
+        return True
+
+    def _retried_result(self, path, status, error):
+        """Return the (status, error, attempts) to record for a test's final attempt.
+
+        A test that passes after failing is flaky; its error describes the
+        failed attempts. A test that never passes keeps its last failure.
+        """
+        attempts = self._failed_attempts.pop(path, None)
+        if not attempts:
+            return status, error, None
+
+        count = len(attempts) + 1
+        if status in TestMethod.FAILING_STATES:
+            return (
+                status,
+                "Failed all %d attempts; the last failure:\n\n%s" % (count, error),
+                count,
+            )
+        return (
+            TestMethod.STATUS_FLAKY,
+            "Passed on attempt %d, after failing:\n\n%s"
+            % (count, "\n\n".join(attempt[1] or "" for attempt in attempts)),
+            count,
+        )
+
+    def _repeated_result(self, path, status, error, duration):
+        """Add a run of a test to its stress results.
+
+        Returns the (status, error) summarizing the test's runs so far:
+        flaky if some runs passed and others failed, and otherwise the
+        status of the run; a failing test keeps its first failure.
+        """
+        stats = self.repeats.setdefault(path, RepeatStats())
+        failed = status in TestMethod.FAILING_STATES
+        stats.add(not failed, duration)
+        if failed:
+            self._first_failures.setdefault(path, (status, error))
+
+        first_failure = self._first_failures.get(path)
+        if first_failure is None:
+            return status, error
+
+        summary = "Failed %d of %d runs; the first failure:\n\n%s" % (
+            stats.failed,
+            stats.runs,
+            first_failure[1],
+        )
+        if stats.passed:
+            return TestMethod.STATUS_FLAKY, summary
+        return first_failure[0], summary
+
+    def _start_retries(self):
+        "Start workers to run the tests waiting to be retried, if any are free."
+        if not self._retry_queue or self.stopped_early or self.interrupted:
+            return
+        busy = sum(1 for worker in self.workers if not worker.done)
+        free = self.worker_count - busy
+        if free <= 0:
+            return
+        for part in partition(self._retry_queue, free):
+            self.workers.append(Worker(self, part, part))
+        self._retry_queue = []
+
+    def _release_retries(self):
+        "Record the last failure of each test whose retry will never run."
+        self._retry_queue = []
+        self.retries = 0
+        for path, attempts in list(self._failed_attempts.items()):
+            status, error, duration, output = attempts.pop()
+            end_time = time.time()
+            self.record_result(
+                self.project.get_node(path),
+                status,
+                output,
+                error,
+                end_time - duration,
+                end_time,
+            )
+
+    def _restart(self, worker):
+        """Replace a worker that gave up on a test that timed out.
+
+        Returns the workers that run the rest of the old worker's share.
+        In a stress run, the tests with the same number of repetitions left
+        share a worker, so that every test runs exactly as often as it has
+        left. Output on stderr so far is kept, so that it's still reported
+        at the end.
+        """
+        remaining = worker.remaining()
+        if not remaining:
+            return [worker]
+        counts = Counter(remaining)
+        groups = {}
+        for path in dict.fromkeys(remaining):
+            groups.setdefault(counts[path], []).append(path)
+        replacements = [
+            Worker(self, paths, paths * count, count)
+            for count, paths in sorted(groups.items(), reverse=True)
+        ]
+        replacements[0].error_buffer = worker.error_buffer
+        return replacements
+
+    def record_fixture(self, path, phase, duration):
+        "Record the time taken by a class or module fixture reported by a worker."
+        node = self.project.find_node(path)
+        if node is not None and hasattr(node, "fixtures"):
+            node.fixtures[phase] = duration
+
+        if self.history:
+            self.history.record_phase(self.run_id, path, phase, duration)
+
+    def poll(self):
+        "Poll the runner looking for new test output"
+        if self.stopping is not None:
+            self._escalate_stop()
+        if self.checkpoint:
+            self.checkpoint.sync()
+
+        stopping = self.stopped_early or self.interrupted
+        for index, worker in enumerate(list(self.workers)):
+            if not worker.done:
+                worker.poll()
+                if worker.done and worker.timed_out and not stopping:
+                    replacements = self._restart(worker)
+                    self.workers[index] = replacements[0]
+                    self.workers.extend(replacements[1:])
+        self._start_retries()
+
+        # If we're not finished, requeue the event.
+        if not all(worker.done for worker in self.workers):
+            return True
+        if self._retry_queue and not stopping:
             return True
 
+        if self.stopping is not None:
+            # Make sure no worker still exiting outlives the run, with
+            # anything its tests started, and reap the workers.
+            for worker in self.workers:
+                if worker.is_running:
+                    worker.kill()
+                worker.proc.wait()
+
+        # Any test still waiting for a retry keeps its last failure.
+        self._release_retries()
+
+        if self.history:
+            self.history.finish_run(self.run_id)
+
+        error = "\n".join(
+            line for worker in self.workers for line in worker.error_buffer
+        )
+        # A worker that gave up on its last test, after a timeout, finished too.
+        if (
+            self.stopped_early
+            or self.interrupted
+            or all(worker.finished or worker.timed_out for worker in self.workers)
+        ):
+            if self.checkpoint:
+                # Only a run that was cut short has anything left to resume.
+                if self.stopped_early or self.interrupted:
+                    self.checkpoint.close()
+                else:
+                    self.checkpoint.finish()
+            if error:
+                self.emit("suite_end", error=error)
+            else:
+                self.emit("suite_end")
+        else:
+            if self.checkpoint:
+                self.checkpoint.close()
+            # A worker stopped producing output before it finished.
+            self.emit("suite_error", error=error or "Test output ended unexpectedly")
+
+        # Suite has finished; don't requeue
+        return False
+
 
 import argparse
 import unittest
@@ -305,22 +953,74 @@ class PyTestExecutor(object):
         # Allows the executor to run a specified list of tests
         self.specified_list = None
 
+        # If provided, each test is profiled, and its stats saved in this directory.
+        self.profile_dir = None
+
+        # If True, the memory allocated by each test is traced.
+        self.trace_allocations = False
+
+        # If provided, the tests stop once this many have failed.
+        self.max_failures = None
+
+        # If provided, a test without a timeout of its own fails after
+        # this many seconds.
+        self.timeout = None
+
+        # The number of times over to run the tests.
+        self.repeat = 1
+
     def flatten_results(self, iterable):
-        input = list(iterable)
-        while input:
-            item = input.pop(0)
+        # Depth first, so tests are yielded in the order the suite would run them.
+        stack = [iter(iterable)]
+        while stack:
+            try:
+                item = next(stack[-1])
+            except StopIteration:
+                stack.pop()
+                continue
             try:
-                data = iter(item)
-                input = list(data) + input
-            except:
+                stack.append(iter(item))
+            except TypeError:
                 yield item
 
     def run_only(self, specified_list):
         self.specified_list = specified_list
 
     def stream_suite(self, suite):
-        print("Calling stream_suite: " + str(suite))
-        pipes.PipedTestRunner().run(suite)
+        if self.repeat > 1:
+            # Each repetition runs every test in turn, so class and module
+            # fixtures run once per repetition.
+            suite = unittest.TestSuite(list(self.flatten_results(suite)) * self.repeat)
+        print("Running %d tests" % suite.countTestCases())
+        pipes.PipedTestRunner(
+            profile_dir=self.profile_dir,
+            trace_allocations=self.trace_allocations,
+            max_failures=self.max_failures,
+            timeout=self.timeout,
+        ).run(suite)
+
+    def select(self, flat_tests):
+        """Return the tests named by the specified list, in the order specified.
+
+        A label may name a single test, or any module or class containing
+        tests. Each test is included once, however many labels name it.
+        """
+        # Index every test under its own id, and under the id of every
+        # module and class that contains it.
+        groups = {}
+        for test in flat_tests:
+            parts = test.id().split(".")
+            for end in range(1, len(parts) + 1):
+                groups.setdefault(".".join(parts[:end]), []).append(test)
+
+        selected = []
+        seen = set()
+        for specified in self.specified_list:
+            for test in groups.get(specified, []):
+                if id(test) not in seen:
+                    seen.add(id(test))
+                    selected.append(test)
+        return selected
 
     def stream_results(self, testdir=DEFAULT_TEST_DIR):
         if testdir is None:
@@ -328,35 +1028,11 @@ class PyTestExecutor(object):
 
         loader = unittest.TestLoader()
         tests = loader.discover(testdir)
-        flat_tests = list(self.flatten_results(tests))
 
         if not self.specified_list:
-            suite = loader.discover(testdir)
-            self.stream_suite(suite)
+            self.stream_suite(tests)
         else:
-            suite = unittest.TestSuite()
-
-            # Add individual test cases.
-            for test in flat_tests:
-                if test.id() in self.specified_list:
-                    suite.addTest(test)
-
-            # Add all tests in a file.
-            for specified in self.specified_list:
-                if specified.count(".") == 0:
-                    for test in flat_tests:
-                        module_name = test.id()[0 : test.id().index(".")]
-                        if specified == module_name:
-                            suite.addTest(test)
-
-            # Add all tests in a class within a file.
-            for specified in self.specified_list:
-                if specified.count(".") == 1:
-                    for test in flat_tests:
-                        module_name = test.id()[0 : test.id().rindex(".")]
-                        if specified == module_name:
-                            suite.addTest(test)
-
+            suite = unittest.TestSuite(self.select(self.flatten_results(tests)))
             self.stream_suite(suite)
 
 
@@ -365,15 +1041,51 @@ if __name__ == "__main__":
     parser.add_argument(
         "--testdir", dest="testdir", default=".", help="Directory to choose tests from"
     )
+    parser.add_argument(
+        "--profile",
+        dest="profile_dir",
+        help="Profile each test, saving its stats in this directory.",
+    )
+    parser.add_argument(
+        "--trace-allocations",
+        dest="trace_allocations",
+        action="store_true",
+        help="Trace the memory allocated by each test.",
+    )
+    parser.add_argument(
+        "--max-failures",
+        dest="max_failures",
+        type=int,
+        help="Stop once this many tests have failed.",
+    )
+    parser.add_argument(
+        "--timeout",
+        dest="timeout",
+        type=float,
+        help="Fail any test that runs for longer than this many seconds.",
+    )
+    parser.add_argument(
+        "--repeat",
+        dest="repeat",
+        type=int,
+        default=1,
+        help="Run the tests this many times over.",
+    )
     parser.add_argument("labels", nargs=argparse.REMAINDER, help="Test labels to run.")
     options = parser.parse_args()
     executor = PyTestExecutor()
+    executor.profile_dir = options.profile_dir
+    executor.trace_allocations = options.trace_allocations
+    executor.max_failures = options.max_failures
+    executor.timeout = options.timeout
+    executor.repeat = options.repeat
 
-    # options.labels = list()
-    # options.labels.append('test_acquire.TestAcquire.test_print_1')
+    # A single label of "-" means the labels are read from stdin, one per line.
+    if options.labels == ["-"]:
+        options.labels = [line.strip() for line in sys.stdin if line.strip()]
 
     if options.labels is not None:
-        print("Labels: ", options.labels)
+        print("Labels: %d" % len(options.labels))
 
     if options.labels:
         executor.run_only(options.labels)
@@ -0,0 +1,186 @@
+import heapq
+import math
+
+from libs.eta import median
+
+
+def partition(labels, count):
+    "Split a list of labels into at most `count` contiguous, similarly sized parts."
+    count = max(1, min(count, len(labels)))
+    size, extra = divmod(len(labels), count)
+    parts = []
+    start = 0
+    for index in range(count):
+        end = start + size + (1 if index < extra else 0)
+        parts.append(labels[start:end])
+        start = end
+    return parts
+
+
+class Scheduler(object):
+    """Share the tests of a run out between workers, keeping fixtures together.
+
+    The tests of a class with setUpClass or tearDownClass (or of a module
+    with setUpModule or tearDownModule) are kept in a single worker, so
+    that the fixtures only run once. A group is only split when it would,
+    on its own, take longer than an equal share of the run; each part
+    then pays for the fixtures again.
+
+    The groups (and lone tests) are then assigned longest first, each to
+    the worker with the least work so far (LPT scheduling). Durations are
+    predicted from each test's (and fixture's) own recent history, and
+    from the project's last results; a fixture is only known about once
+    it has been timed in a run.
+    """
+
+    # The duration assumed for a test, if no test has a known duration.
+    DEFAULT_DURATION = 0.1
+
+    def __init__(self, project, history=None, runs=5):
+        self.project = project
+        self.history = history
+        self.runs = runs
+
+        # The predicted durations of tests and fixtures, loaded from the
+        # history when they are first needed.
+        self._predicted = None
+        self._fixtures = None
+        self._default = self.DEFAULT_DURATION
+
+    def _load(self):
+        "Load the predicted durations of tests and fixtures from the history."
+        history = self.history
+        recorded = history.recent_durations(self.runs) if history else {}
+        self._predicted = {path: median(values) for path, values in recorded.items()}
+
+        fixtures = history.recent_fixture_durations(self.runs) if history else {}
+        self._fixtures = {path: median(values) for path, values in fixtures.items()}
+
+        if self._predicted:
+            self._default = sum(self._predicted.values()) / len(self._predicted)
+
+    def duration(self, path):
+        "Return the predicted duration of a test."
+        if self._predicted is None:
+            self._load()
+        if path in self._predicted:
+            return self._predicted[path]
+        node = self.project.find_node(path)
+        if node is not None and node.duration is not None:
+            return node.duration
+        return self._default
+
+    def fixture_cost(self, path):
+        "Return the time taken by the fixtures of a class or module, or 0 if none."
+        if self._fixtures is None:
+            self._load()
+        if path not in self._fixtures:
+            node = self.project.find_node(path)
+            fixtures = getattr(node, "fixtures", None)
+            self._fixtures[path] = sum(fixtures.values()) if fixtures else 0.0
+        return self._fixtures[path]
+
+    def cost(self, paths):
+        "Return the predicted time for a worker to run some tests, with their fixtures."
+        groups = set()
+        for path in paths:
+            case = path.rpartition(".")[0]
+            groups.update((case, case.rpartition(".")[0]))
+        return sum(self.duration(path) for path in paths) + sum(
+            self.fixture_cost(group) for group in groups
+        )
+
+    def group(self, path):
+        "Return the path of the group a test must run with, or the test's own path."
+        case = path.rpartition(".")[0]
+        module = case.rpartition(".")[0]
+        if self.fixture_cost(module):
+            return module
+        if self.fixture_cost(case):
+            return case
+        return path
+
+    def split(self, paths, target, workers):
+        """Split a group of tests into contiguous parts that each take about target.
+
+        Every part pays for the group's fixtures, so a group whose fixtures
+        alone take longer than target isn't split at all. Returns a list of
+        (cost, paths) for each part.
+        """
+        cost = self.cost(paths)
+        tests = sum(self.duration(path) for path in paths)
+        fixtures = cost - tests
+        if target <= fixtures:
+            return [(cost, paths)]
+        count = min(
+            len(paths), workers, int(math.ceil(tests / (target - fixtures)))
+        )
+        if count <= 1:
+            return [(cost, paths)]
+
+        # Walk the tests in order, closing each part once it has its
+        # share of the group's tests.
+        share = tests / count
+        parts = []
+        part = []
+        total = 0.0
+        for path in paths:
+            part.append(path)
+            total = total + self.duration(path)
+            if total >= share * (len(parts) + 1) and len(parts) < count - 1:
+                parts.append(part)
+                part = []
+        if part:
+            parts.append(part)
+        return [(self.cost(part), part) for part in parts]
+
+    @staticmethod
+    def assign(parts, workers):
+        """Assign parts to workers, longest first, each to the least loaded worker.
+
+        parts is a list of (cost, paths). Returns the predicted time the
+        busiest worker takes (the makespan), and the paths of each worker.
+        """
+        # The sort is stable, so equal parts keep their order.
+        loads = [(0.0, index) for index in range(workers)]
+        assigned = [[] for index in range(workers)]
+        for cost, members in sorted(parts, key=lambda part: -part[0]):
+            load, index = heapq.heappop(loads)
+            assigned[index].extend(members)
+            heapq.heappush(loads, (load + cost, index))
+        return max(load for load, index in loads), assigned
+
+    def schedule(self, paths, workers):
+        """Split a list of tests between at most `workers` workers.
+
+        Each worker's tests keep the order they have in paths.
+        """
+        if workers <= 1 or len(paths) <= 1:
+            return [list(paths)]
+
+        groups = {}
+        for path in paths:
+            groups.setdefault(self.group(path), []).append(path)
+        parts = [(self.cost(members), members) for members in groups.values()]
+        makespan, assigned = self.assign(parts, workers)
+
+        # Split the groups that take longer than an equal share of the
+        # run, largest first, for as long as that shortens the run.
+        target = sum(cost for cost, members in parts) / workers
+        for group in sorted(parts, key=lambda part: -part[0]):
+            cost, members = group
+            if cost <= target:
+                break
+            if len(members) < 2:
+                continue
+            candidate = [part for part in parts if part is not group]
+            candidate.extend(self.split(members, target, workers))
+            candidate_makespan, candidate_assigned = self.assign(candidate, workers)
+            if candidate_makespan < makespan:
+                parts = candidate
+                makespan, assigned = candidate_makespan, candidate_assigned
+
+        position = {path: index for index, path in enumerate(paths)}
+        return [
+            sorted(members, key=position.__getitem__) for members in assigned if members
+        ]
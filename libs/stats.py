@@ -0,0 +1,152 @@
+import heapq
+import math
+from array import array
+
+from libs.eta import median
+
+
+def short_duration(seconds):
+    "Format a duration compactly, for labelling an axis, e.g. '100us', '10ms', '1s'."
+    for unit, scale in (("s", 1), ("ms", 1000), ("us", 1000000)):
+        value = seconds * scale
+        if value >= 1 or unit == "us":
+            return "%g%s" % (round(value, 3), unit)
+
+
+class DurationStats(object):
+    """Running statistics of the durations of the tests in a run.
+
+    Keeps the slowest tests in a bounded heap, and counts every duration
+    in a fixed set of log-scale buckets; adding a result costs O(log N)
+    in the number of slowest tests kept, and nothing is ever rescanned.
+    """
+
+    # The shortest and longest durations (in seconds) with their own
+    # buckets; anything outside this range goes in the first or last bucket.
+    MIN_DURATION = 0.0001
+    MAX_DURATION = 1000.0
+
+    # The number of buckets in each factor of 10.
+    BUCKETS_PER_DECADE = 4
+
+    def __init__(self, size=20):
+        self.size = size
+
+        decades = math.log10(self.MAX_DURATION / self.MIN_DURATION)
+        self.bucket_count = int(round(decades * self.BUCKETS_PER_DECADE))
+        self.reset()
+
+    def reset(self):
+        "Forget every result recorded so far."
+        # A min-heap of (duration, sequence, path); the root is the
+        # fastest of the slowest tests.
+        self._heap = []
+        self._sequence = 0
+
+        self.buckets = [0] * self.bucket_count
+        self.count = 0
+        self.total = 0.0
+
+    def bucket(self, duration):
+        "Return the index of the bucket that a duration is counted in."
+        if duration <= self.MIN_DURATION:
+            return 0
+        index = int(
+            math.log10(duration / self.MIN_DURATION) * self.BUCKETS_PER_DECADE
+        )
+        return min(index, self.bucket_count - 1)
+
+    def bucket_bounds(self, index):
+        "Return the (lower, upper) durations of a bucket."
+        return (
+            self.MIN_DURATION * 10 ** (float(index) / self.BUCKETS_PER_DECADE),
+            self.MIN_DURATION * 10 ** (float(index + 1) / self.BUCKETS_PER_DECADE),
+        )
+
+    def add(self, path, duration):
+        "Record the duration of a test."
+        self.count = self.count + 1
+        self.total = self.total + duration
+        self.buckets[self.bucket(duration)] += 1
+
+        # The sequence number breaks ties, so paths are never compared.
+        self._sequence = self._sequence + 1
+        entry = (duration, self._sequence, path)
+        if len(self._heap) < self.size:
+            heapq.heappush(self._heap, entry)
+        elif duration > self._heap[0][0]:
+            heapq.heapreplace(self._heap, entry)
+
+    def slowest(self, distinct=False):
+        """Return (path, duration) for the slowest tests, slowest first.
+
+        In a stress run, a test can be among the slowest several times; if
+        distinct is True, each test is returned once, with its slowest run.
+        """
+        slowest = []
+        seen = set()
+        for duration, sequence, path in sorted(self._heap, reverse=True):
+            if distinct:
+                if path in seen:
+                    continue
+                seen.add(path)
+            slowest.append((path, duration))
+        return slowest
+
+
+class RepeatStats(object):
+    """The results of a test that was run many times over, as in a stress run.
+
+    Every duration is kept (compactly), so that the spread can be given
+    exactly; a stress run only repeats each test a bounded number of times.
+    """
+
+    def __init__(self):
+        self.runs = 0
+        self.passed = 0
+        self.durations = array("d")
+
+    def add(self, passed, duration):
+        "Record a run of the test."
+        self.runs = self.runs + 1
+        if passed:
+            self.passed = self.passed + 1
+        self.durations.append(duration)
+
+    @property
+    def failed(self):
+        "The number of runs that failed."
+        return self.runs - self.passed
+
+    @property
+    def pass_rate(self):
+        "The fraction of runs that passed, or None if there were none."
+        return float(self.passed) / self.runs if self.runs else None
+
+    def spread(self):
+        "Return the (min, median, max, standard deviation) of the durations."
+        if not self.durations:
+            return None
+        mean = sum(self.durations) / len(self.durations)
+        variance = sum((d - mean) ** 2 for d in self.durations) / len(self.durations)
+        return (
+            min(self.durations),
+            median(self.durations),
+            max(self.durations),
+            math.sqrt(variance),
+        )
+
+    def describe(self):
+        "Describe the runs, e.g. '9/10 passed (90%); 0.10s-0.50s, median 0.12s'."
+        if not self.runs:
+            return "no runs"
+        low, middle, high, deviation = self.spread()
+        return "%d/%d passed (%d%%); %0.3fs-%0.3fs, median %0.3fs, sd %0.3fs" % (
+            self.passed,
+            self.runs,
+            round(100 * self.pass_rate),
+            low,
+            high,
+            middle,
+            deviation,
+        )
@@ -1,13 +1,16 @@
 # All GUI related components go in here.
 
-import subprocess
+import hashlib
+import sqlite3
 import sys
+import time
 
-from libs.constants import DEFAULT_TEST_DIR
+from libs.constants import CHECKPOINT_FILENAME, DEFAULT_TEST_DIR, HISTORY_FILENAME
 
 try:
     import tkFileDialog as filedialog
     import tkMessageBox
+    import tkSimpleDialog as simpledialog
     from tkFont import *
     from Tkinter import *
     from tkreadonly import ReadOnlyText
@@ -18,12 +21,18 @@ except ImportError:
     from tkinter.font import *
     from tkinter.ttk import *
     from tkinter import messagebox as tkMessageBox
+    from tkinter import simpledialog
     from tkreadonly import ReadOnlyText
 
 import os
 
+from libs import junit, profiling, regression
+from libs.checkpoint import Checkpoint, SavedRun
+from libs.history import HistoryStore
 from libs.model import ModelLoadError, TestCase, TestMethod, TestModule
+from libs.ordering import ORDER_DISCOVERY, ORDER_FAILED_FIRST
 from libs.runner import Runner
+from libs.stats import DurationStats, short_duration
 
 # Display constants for test status
 STATUS = {
@@ -41,12 +50,42 @@ STATUS = {
         "tag": "skip",
         "color": "#259EBF",
     },
+    TestMethod.STATUS_INTERRUPTED: {
+        "description": "Interrupted",
+        "symbol": "\u25cf",  # Circle
+        "tag": "interrupted",
+        "color": "#8E7CC3",
+    },
+    TestMethod.STATUS_EXPECTED_FAIL: {
+        "description": "Expected\nfailure",
+        "symbol": "\u25cf",  # Circle
+        "tag": "expected",
+        "color": "#259EBF",
+    },
+    TestMethod.STATUS_FLAKY: {
+        "description": "Flaky",
+        "symbol": "\u25cf",  # Circle
+        "tag": "flaky",
+        "color": "#E8901A",
+    },
+    TestMethod.STATUS_UNEXPECTED_SUCCESS: {
+        "description": "Unexpected\nsuccess",
+        "symbol": "\u25cf",  # Circle
+        "tag": "unexpected",
+        "color": "#E32C2E",
+    },
     TestMethod.STATUS_FAIL: {
         "description": "Failure",
         "symbol": "\u25cf",  # Circle
         "tag": "fail",
         "color": "#E32C2E",
     },
+    TestMethod.STATUS_ERROR: {
+        "description": "Error",
+        "symbol": "\u25cf",  # Circle
+        "tag": "error",
+        "color": "#E32C2E",
+    },
 }
 
 STATUS_DEFAULT = {
@@ -57,11 +96,65 @@ STATUS_DEFAULT = {
 }
 
 
+# The statuses of the tests shown on the problem tree: failing tests, and
+# flaky ones, which passed only when retried (or sometimes, when repeated).
+PROBLEM_STATES = TestMethod.FAILING_STATES + (TestMethod.STATUS_FLAKY,)
+
+# The color used to highlight tests that ran slower than their history.
+SLOWER_COLOR = "#FFE8B0"
+
+# The problem tree item holding the tests that ran slower than usual. Each
+# test under it is identified by its path, prefixed with the section's id.
+SLOWER_SECTION = "slower:"
+
+# The problem tree item holding groups of tests that failed in the same
+# way. Each group, and each test in a group, is prefixed with the group's id.
+FAILURE_GROUPS_SECTION = "groups:"
+
+
+# The most subtests of a test shown on the tree; failing subtests are shown first.
+MAX_SUBTEST_ITEMS = 1000
+
+# A test method's subtests are only added to the tree when it is opened;
+# until then, it has a single placeholder child, so that it can be opened.
+SUBTESTS_PLACEHOLDER = "subtests:"
+
+
+def subtest_item(index, path):
+    "Return the tree id of a subtest of a test method"
+    return "subtest-%d:%s" % (index, path)
+
+
+def failure_group_item(signature):
+    "Return the problem tree id of the group of tests failing with a signature"
+    return "group-%s:" % hashlib.sha1(signature.encode("utf-8")).hexdigest()[:16]
+
+
+def node_path(item):
+    "Return the path of the node shown by a tree item, dropping any section prefix"
+    return item.rpartition(":")[2]
+
+
+def format_size(size):
+    "Format a size in bytes for display, e.g. '512 B', '12.0 KB', '2.1 MB'."
+    for unit in ("B", "KB", "MB"):
+        if abs(size) < 1024:
+            return ("%d %s" if unit == "B" else "%0.1f %s") % (size, unit)
+        size = size / 1024.0
+    return "%0.1f GB" % size
+
+
 class MainWindow(object):
     def __init__(self, root):
         self._project = None
+
+        # The failure signature of each failing test shown on the problem tree.
+        self._failure_signatures = {}
         self.executor = None
 
+        # The run history store for the current test directory.
+        self.history = None
+
         # Root window
         self.root = root
         self.root.title("GUI Test Runner")
@@ -94,10 +187,46 @@ class MainWindow(object):
         Runner.bind("suite_end", self.on_executorSuiteEnd)
         Runner.bind("suite_error", self.on_executorSuiteError)
 
+        # Listen for any state changes on nodes in the tree. Handlers are
+        # bound once for the life of the window, and are weakly referenced,
+        # so reloading the project doesn't accumulate duplicate handlers.
+        TestModule.bind("active", self.on_nodeActive)
+        TestCase.bind("active", self.on_nodeActive)
+        TestMethod.bind("active", self.on_nodeActive)
+
+        TestModule.bind("inactive", self.on_nodeInactive)
+        TestCase.bind("inactive", self.on_nodeInactive)
+        TestMethod.bind("inactive", self.on_nodeInactive)
+
+        # Bulk (de)activation of a module or test case is announced
+        # with a single event for the whole subtree.
+        TestModule.bind("subtree_active", self.on_subtreeActive)
+        TestCase.bind("subtree_active", self.on_subtreeActive)
+
+        TestModule.bind("subtree_inactive", self.on_subtreeInactive)
+        TestCase.bind("subtree_inactive", self.on_subtreeInactive)
+
+        # Listen for new nodes added to the tree
+        TestModule.bind("new", self.on_nodeAdded)
+        TestCase.bind("new", self.on_nodeAdded)
+        TestMethod.bind("new", self.on_nodeAdded)
+
+        # Listen for nodes removed from the tree. Removals are announced
+        # in bulk when the project is refreshed.
+        TestModule.bind("removed", self.on_nodesRemoved, batch=True)
+        TestCase.bind("removed", self.on_nodesRemoved, batch=True)
+        TestMethod.bind("removed", self.on_nodesRemoved, batch=True)
+
+        # Listen for any status updates on nodes in the tree.
+        TestMethod.bind("status_update", self.on_nodeStatusUpdate)
+
         # Now that we've laid out the grid, hide the error and output text
         # until we actually have an error/output to display
         self._hide_test_output()
         self._hide_test_errors()
+        self._hide_test_profile()
+        self._hide_test_resources()
+        self._hide_test_timing()
 
     def _setup_menubar(self):
         # Menubar
@@ -106,8 +235,13 @@ class MainWindow(object):
         # File menubar
         self.menu_file = Menu(self.menubar)
         self.menubar.add_cascade(menu=self.menu_file, label="File")
-        # self.menu_file.add_command(label='Load Run', command=self.cmd_load_run)
-        # self.menu_file.add_command(label='Save Run', command=self.cmd_export_run)
+        self.menu_file.add_command(label="Load Run", command=self.cmd_load_run)
+        self.menu_file.add_command(
+            label="Open JUnit XML...", command=self.cmd_import_junit
+        )
+        self.menu_file.add_command(
+            label="Export Run (JUnit XML)", command=self.cmd_export_run
+        )
         self.menu_file.add_command(label="Quit", command=self.cmd_quit)
 
         # Test Menubar
@@ -119,6 +253,13 @@ class MainWindow(object):
             label="Run selected tests", command=self.cmd_run_selected
         )
         self.menu_test.add_command(label="Re-run failed tests", command=self.cmd_rerun)
+        self.menu_test.add_command(label="Resume last run", command=self.cmd_resume_run)
+        self.menu_test.add_command(
+            label="Run selected tests N times...", command=self.cmd_repeat_selected
+        )
+        self.menu_test.add_command(
+            label="Profile selected tests", command=self.cmd_profile_selected
+        )
 
         # Add help menu.
         self.menu_help = Menu(self.menubar)
@@ -160,6 +301,73 @@ class MainWindow(object):
             self.toolbar, text="Stop", command=self.cmd_stop, state=DISABLED
         )
         self.stop_button.grid(column=3, row=0)
+        self.profile_selected_button = Button(
+            self.toolbar,
+            text="Profile",
+            command=self.cmd_profile_selected,
+            state=DISABLED,
+        )
+        self.profile_selected_button.grid(column=4, row=0)
+
+        # Number of subprocesses to run tests in parallel.
+        self.workers_label = Label(self.toolbar, text="Workers:")
+        self.workers_label.grid(column=5, row=0, padx=(10, 2))
+
+        self.workers = IntVar()
+        self.workers.set(1)
+        self.workers_widget = Spinbox(
+            self.toolbar, from_=1, to=64, textvariable=self.workers, width=3
+        )
+        self.workers_widget.grid(column=6, row=0)
+
+        # Trace the memory allocated by each test (slower).
+        self.trace_allocations = BooleanVar()
+        self.trace_allocations_widget = Checkbutton(
+            self.toolbar, text="Trace allocations", variable=self.trace_allocations
+        )
+        self.trace_allocations_widget.grid(column=7, row=0, padx=(10, 0))
+
+        # Run the tests most likely to fail first.
+        self.failed_first = BooleanVar()
+        self.failed_first_widget = Checkbutton(
+            self.toolbar, text="Failed first", variable=self.failed_first
+        )
+        self.failed_first_widget.grid(column=8, row=0, padx=(10, 0))
+
+        # Stop the run once this many tests have failed; 0 means never.
+        self.max_failures_label = Label(self.toolbar, text="Max failures:")
+        self.max_failures_label.grid(column=9, row=0, padx=(10, 2))
+
+        self.max_failures = IntVar()
+        self.max_failures.set(0)
+        self.max_failures_widget = Spinbox(
+            self.toolbar, from_=0, to=9999, textvariable=self.max_failures, width=4
+        )
+        self.max_failures_widget.grid(column=10, row=0)
+
+        # Fail a test that runs for longer than this many seconds, unless
+        # it sets its own timeout; 0 means no timeout.
+        self.timeout_label = Label(self.toolbar, text="Timeout (s):")
+        self.timeout_label.grid(column=11, row=0, padx=(10, 2))
+
+        self.timeout = IntVar()
+        self.timeout.set(0)
+        self.timeout_widget = Spinbox(
+            self.toolbar, from_=0, to=99999, textvariable=self.timeout, width=5
+        )
+        self.timeout_widget.grid(column=12, row=0)
+
+        # Run a failing test up to this many more times; it's flaky if a
+        # retry passes.
+        self.retries_label = Label(self.toolbar, text="Retries:")
+        self.retries_label.grid(column=13, row=0, padx=(10, 2))
+
+        self.retries = IntVar()
+        self.retries.set(0)
+        self.retries_widget = Spinbox(
+            self.toolbar, from_=0, to=99, textvariable=self.retries, width=3
+        )
+        self.retries_widget.grid(column=14, row=0)
 
         self.toolbar.columnconfigure(0, weight=0)
         self.toolbar.rowconfigure(0, weight=1)
@@ -177,6 +385,7 @@ class MainWindow(object):
         self._setup_left_frame()
         self._setup_all_tests_tree()
         self._setup_problem_tests_tree()
+        self._setup_slowest_tests_panel()
 
         # Create the output/viewer area on the right frame
         self._setup_right_frame()
@@ -208,13 +417,33 @@ class MainWindow(object):
         self.all_tests_tree_frame.grid(column=0, row=0, sticky=(N, S, E, W))
         self.tree_notebook.add(self.all_tests_tree_frame, text="All tests")
 
-        self.all_tests_tree = Treeview(self.all_tests_tree_frame)
+        self.all_tests_tree = Treeview(
+            self.all_tests_tree_frame, columns=("result", "cpu", "memory")
+        )
         self.all_tests_tree.grid(column=0, row=0, sticky=(N, S, E, W))
 
+        # The result column shows a summary badge for modules and test cases,
+        # and the duration for test methods. The CPU time and growth in peak
+        # memory of each test method are shown when they have been measured.
+        self.all_tests_tree.heading("#0", text="Test")
+        self.all_tests_tree.heading("result", text="Result")
+        self.all_tests_tree.heading("cpu", text="CPU")
+        self.all_tests_tree.heading("memory", text="Peak RSS")
+        self.all_tests_tree.column("result", width=120, stretch=False)
+        self.all_tests_tree.column("cpu", width=60, anchor=E, stretch=False)
+        self.all_tests_tree.column("memory", width=80, anchor=E, stretch=False)
+
+        # Clicking a heading sorts the tree by that column.
+        for column in ("#0", "result", "cpu", "memory"):
+            self.all_tests_tree.heading(
+                column, command=lambda column=column: self._sort_tests_tree(column)
+            )
+
         # Set up the tag colors for tree nodes.
         for status, config in STATUS.items():
             self.all_tests_tree.tag_configure(config["tag"], foreground=config["color"])
         self.all_tests_tree.tag_configure("inactive", foreground="lightgray")
+        self.all_tests_tree.tag_configure("slower", background=SLOWER_COLOR)
 
         # Listen for button clicks on tree nodes
         self.all_tests_tree.tag_bind(
@@ -236,6 +465,12 @@ class MainWindow(object):
         self.all_tests_tree.tag_bind(
             "TestMethod", "<<TreeviewSelect>>", self.on_testMethodSelected
         )
+        self.all_tests_tree.tag_bind(
+            "Subtest", "<<TreeviewSelect>>", self.on_subtestSelected
+        )
+
+        # Subtests are added to the tree when their test method is opened.
+        self.all_tests_tree.bind("<<TreeviewOpen>>", self.on_treeItemOpened)
 
         # The tree's vertical scrollbar
         self.all_tests_tree_scrollbar = Scrollbar(
@@ -272,6 +507,7 @@ class MainWindow(object):
                 config["tag"], foreground=config["color"]
             )
         self.problem_tests_tree.tag_configure("inactive", foreground="lightgray")
+        self.problem_tests_tree.tag_configure("slower", background=SLOWER_COLOR)
 
         # Problem tree only deals with selection, not clicks.
         self.problem_tests_tree.tag_bind(
@@ -302,6 +538,65 @@ class MainWindow(object):
         self.problem_tests_tree_frame.columnconfigure(1, weight=0)
         self.problem_tests_tree_frame.rowconfigure(0, weight=1)
 
+    def _setup_slowest_tests_panel(self):
+        # The slowest tests of the current run, and a histogram of durations
+        self.slowest_tests_frame = Frame(self.content)
+        self.slowest_tests_frame.grid(column=0, row=0, sticky=(N, S, E, W))
+        self.tree_notebook.add(self.slowest_tests_frame, text="Slowest")
+
+        self.duration_stats = DurationStats()
+
+        # Set when a redraw of the panel has been scheduled.
+        self._stats_update_pending = False
+
+        self.slowest_tests_tree = Treeview(
+            self.slowest_tests_frame, columns=("duration",)
+        )
+        self.slowest_tests_tree.grid(column=0, row=0, sticky=(N, S, E, W))
+        self.slowest_tests_tree.heading("#0", text="Test")
+        self.slowest_tests_tree.heading("duration", text="Duration")
+        self.slowest_tests_tree.column("duration", width=80, anchor=E, stretch=False)
+
+        # Set up the tag colors for tree nodes.
+        for status, config in STATUS.items():
+            self.slowest_tests_tree.tag_configure(
+                config["tag"], foreground=config["color"]
+            )
+
+        # The slowest tests tree only deals with selection, not clicks.
+        self.slowest_tests_tree.tag_bind(
+            "TestMethod", "<<TreeviewSelect>>", self.on_testMethodSelected
+        )
+
+        self.slowest_tests_tree_scrollbar = Scrollbar(
+            self.slowest_tests_frame, orient=VERTICAL
+        )
+        self.slowest_tests_tree_scrollbar.grid(column=1, row=0, sticky=(N, S))
+        self.slowest_tests_tree.config(
+            yscrollcommand=self.slowest_tests_tree_scrollbar.set
+        )
+        self.slowest_tests_tree_scrollbar.config(command=self.slowest_tests_tree.yview)
+
+        # A histogram of the durations of every test in the run.
+        self.duration_summary = StringVar()
+        self.duration_summary_label = Label(
+            self.slowest_tests_frame, textvariable=self.duration_summary
+        )
+        self.duration_summary_label.grid(column=0, row=1, columnspan=2, sticky=(W,))
+
+        self.histogram = Canvas(
+            self.slowest_tests_frame, height=140, background="white"
+        )
+        self.histogram.grid(column=0, row=2, columnspan=2, sticky=(N, S, E, W))
+        self.histogram.bind("<Configure>", lambda event: self._draw_histogram())
+
+        # Setup weights for the panel
+        self.slowest_tests_frame.columnconfigure(0, weight=1)
+        self.slowest_tests_frame.columnconfigure(1, weight=0)
+        self.slowest_tests_frame.rowconfigure(0, weight=1)
+        self.slowest_tests_frame.rowconfigure(1, weight=0)
+        self.slowest_tests_frame.rowconfigure(2, weight=0)
+
     def _setup_right_frame(self):
         """
         Right side view output
@@ -465,6 +760,73 @@ class MainWindow(object):
         self.error.config(yscrollcommand=self.error_scrollbar.set)
         self.error_scrollbar.config(command=self.error.yview)
 
+        # Profile of the test, if it was profiled
+        self.profile_label = Label(self.details_frame, text="Profile:")
+        self.profile_label.grid(column=0, row=7, pady=5, sticky=(N, E))
+
+        self.profile_tree = Treeview(
+            self.details_frame, columns=("calls", "tottime", "cumtime"), height=8
+        )
+        self.profile_tree.heading("#0", text="Function")
+        self.profile_tree.heading("calls", text="Calls")
+        self.profile_tree.heading("tottime", text="Own time")
+        self.profile_tree.heading("cumtime", text="Cumulative")
+        for column in ("#0", "calls", "tottime", "cumtime"):
+            self.profile_tree.heading(
+                column,
+                command=lambda column=column: self._sort_tree(
+                    self.profile_tree, column
+                ),
+            )
+        self.profile_tree.column("#0", width=360)
+        self.profile_tree.column("calls", width=60, anchor=E, stretch=False)
+        self.profile_tree.column("tottime", width=80, anchor=E, stretch=False)
+        self.profile_tree.column("cumtime", width=80, anchor=E, stretch=False)
+        self.profile_tree.grid(
+            column=1, row=7, pady=5, columnspan=2, sticky=(N, S, E, W)
+        )
+
+        self.profile_scrollbar = Scrollbar(self.details_frame, orient=VERTICAL)
+        self.profile_scrollbar.grid(column=3, row=7, pady=5, sticky=(N, S))
+        self.profile_tree.config(yscrollcommand=self.profile_scrollbar.set)
+        self.profile_scrollbar.config(command=self.profile_tree.yview)
+
+        self.export_profile_button = Button(
+            self.details_frame,
+            text="Export flamegraph...",
+            command=self.cmd_export_profile,
+        )
+        self.export_profile_button.grid(column=1, row=8, columnspan=2, sticky=(E,))
+
+        # The stats file of the profile being displayed.
+        self.profile_stats_file = None
+
+        # Resources used by the test
+        self.resources_label = Label(self.details_frame, text="Resources:")
+        self.resources_label.grid(column=0, row=9, pady=5, sticky=(N, E))
+
+        self.resources = ReadOnlyText(self.details_frame, width=80, height=6)
+        self.resources.grid(
+            column=1, row=9, pady=5, columnspan=2, sticky=(N, S, E, W)
+        )
+
+        self.resources_scrollbar = Scrollbar(self.details_frame, orient=VERTICAL)
+        self.resources_scrollbar.grid(column=3, row=9, pady=5, sticky=(N, S))
+        self.resources.config(yscrollcommand=self.resources_scrollbar.set)
+        self.resources_scrollbar.config(command=self.resources.yview)
+
+        # Time spent in each phase of the test, and in its fixtures
+        self.timing_label = Label(self.details_frame, text="Timing:")
+        self.timing_label.grid(column=0, row=10, pady=5, sticky=(N, E))
+
+        self.timing = ReadOnlyText(self.details_frame, width=80, height=5)
+        self.timing.grid(column=1, row=10, pady=5, columnspan=2, sticky=(N, S, E, W))
+
+        self.timing_scrollbar = Scrollbar(self.details_frame, orient=VERTICAL)
+        self.timing_scrollbar.grid(column=3, row=10, pady=5, sticky=(N, S))
+        self.timing.config(yscrollcommand=self.timing_scrollbar.set)
+        self.timing_scrollbar.config(command=self.timing.yview)
+
         # Set up GUI weights for the details frame
         self.details_frame.columnconfigure(0, weight=0)
         self.details_frame.columnconfigure(1, weight=1)
@@ -478,6 +840,10 @@ class MainWindow(object):
         self.details_frame.rowconfigure(4, weight=1)
         self.details_frame.rowconfigure(5, weight=5)
         self.details_frame.rowconfigure(6, weight=10)
+        self.details_frame.rowconfigure(7, weight=5)
+        self.details_frame.rowconfigure(8, weight=0)
+        self.details_frame.rowconfigure(9, weight=1)
+        self.details_frame.rowconfigure(10, weight=1)
 
     def _setup_status_bar(self):
         # Status bar
@@ -530,6 +896,8 @@ class MainWindow(object):
         current_tree_id = self.tree_notebook.select()
         if current_tree_id == self.problem_tests_tree_frame._w:
             return self.problem_tests_tree
+        elif current_tree_id == self.slowest_tests_frame._w:
+            return self.slowest_tests_tree
         else:
             return self.all_tests_tree
 
@@ -543,7 +911,8 @@ class MainWindow(object):
             "end",
             testModule.path,
             text=testModule.name,
-            tags=["TestModule", "active"],
+            values=(testModule.badge,),
+            tags=self._node_tags(testModule),
             open=True,
         )
 
@@ -557,7 +926,8 @@ class MainWindow(object):
                     "end",
                     testCase.path,
                     text=testCase.name,
-                    tags=["TestCase", "active"],
+                    values=(testCase.badge,),
+                    tags=self._node_tags(testCase),
                     open=True,
                 )
 
@@ -567,48 +937,49 @@ class MainWindow(object):
                         "end",
                         testMethod.path,
                         text=testMethod.name,
-                        tags=["TestMethod", "active"],
+                        values=self._method_values(testMethod),
+                        tags=self._node_tags(testMethod),
                         open=True,
                     )
+                    if testMethod.subtests:
+                        self._reset_subtest_items(testMethod)
 
     @project.setter
     def project(self, project):
         self._project = project
 
-        # Get a count of active tests to display in the status bar.
-        count, labels = self._project.find_tests(True)
-
-        # Update the run summary
-        self.run_summary.set(
-            "Total:%(total)s Passed:%(pass)s Failed:%(fail)s Skipped:%(skip)s"
-            % {"total": count, "pass": 0, "fail": 0, "skip": 0}
-        )
+        self._show_project_summary()
 
         # Clean treeview.
         self.all_tests_tree.delete(*self.all_tests_tree.get_children())
         self.problem_tests_tree.delete(*self.problem_tests_tree.get_children())
+        self._failure_signatures = {}
+        self.duration_stats.reset()
+        self._update_stats_panel()
 
         # Populate the initial tree nodes. This is recursive, because
         # the tree could be of arbitrary depth.
         for testModule_name, testModule in sorted(self._project.items()):
             self._add_test_module("", testModule)
 
-        # Listen for any state changes on nodes in the tree
-        TestModule.bind("active", self.on_nodeActive)
-        TestCase.bind("active", self.on_nodeActive)
-        TestMethod.bind("active", self.on_nodeActive)
-
-        TestModule.bind("inactive", self.on_nodeInactive)
-        TestCase.bind("inactive", self.on_nodeInactive)
-        TestMethod.bind("inactive", self.on_nodeInactive)
+        # The project may already hold results (e.g., when it was imported);
+        # any failing tests belong on the problem tree.
+        for node in self._project.get_nodes(self._project.node_paths()):
+            if isinstance(node, TestMethod) and node.status in PROBLEM_STATES:
+                self._add_problem_node(node)
+                self._update_failure_group(node)
 
-        # Listen for new nodes added to the tree
-        TestModule.bind("new", self.on_nodeAdded)
-        TestCase.bind("new", self.on_nodeAdded)
-        TestMethod.bind("new", self.on_nodeAdded)
-
-        # Listen for any status updates on nodes in the tree.
-        TestMethod.bind("status_update", self.on_nodeStatusUpdate)
+    def _show_project_summary(self):
+        "Update the run summary from the project's aggregate counts."
+        self.run_summary.set(
+            "Total:%(total)s Passed:%(pass)s Failed:%(fail)s Skipped:%(skip)s"
+            % {
+                "total": self._project.active_count,
+                "pass": self._project.status_count.get(TestMethod.STATUS_PASS, 0),
+                "fail": self._project.status_count.get(TestMethod.STATUS_FAIL, 0),
+                "skip": self._project.status_count.get(TestMethod.STATUS_SKIP, 0),
+            }
+        )
 
     def reload_project(self, testdir=DEFAULT_TEST_DIR):
         # If the directory does not exist, throw an error message and don't do anything.
@@ -617,10 +988,32 @@ class MainWindow(object):
             dialog(message="Directory: " + testdir + " does not exist!")
             return
 
-        self._reset_all_tests_tree()
-        self._reset_problem_tests_tree()
+        if self._project is None:
+            self.project = self.load_project(self.root, self.Model, testdir)
+            return
+
+        # Refresh the existing project in place. Tests that still exist
+        # keep their results; the tree is patched with only the tests
+        # that were added or removed.
+        self.refresh_project(self.root, self._project, testdir)
+        self._show_project_summary()
 
-        self.project = self.load_project(self.root, self.Model, testdir)
+    def refresh_project(self, root, project, testdir=DEFAULT_TEST_DIR):
+        "Rediscover the tests in a directory, and refresh the project with them."
+        while True:
+            try:
+                test_list, errors = project.discover(testdir)
+                project.refresh(test_list, errors)
+                break
+            except ModelLoadError as e:
+                # Load failed; show an error dialog. If the user selects cancel, quit.
+                dialog = TestLoadErrorDialog(root, e.trace)
+                if dialog.status == dialog.CANCEL:
+                    sys.exit(1)
+        if project.errors:
+            dialog = IgnorableTestLoadErrorDialog(root, "\n".join(project.errors))
+            if dialog.status == dialog.CANCEL:
+                sys.exit(1)
 
     def load_project(self, root, Model, testdir=DEFAULT_TEST_DIR):
         self.Model = Model
@@ -630,24 +1023,7 @@ class MainWindow(object):
                 # Create the project objects
                 project = Model()
 
-                runner = subprocess.Popen(
-                    project.discover_commandline(testdir),
-                    stdin=None,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    shell=False,
-                )
-
-                test_list = []
-                for line in runner.stdout:
-                    test_list.append(line.strip().decode("utf-8"))
-
-                errors = []
-                for line in runner.stderr:
-                    errors.append(line.strip().decode("utf-8"))
-                if errors and not test_list:
-                    raise ModelLoadError("\n".join(errors))
-
+                test_list, errors = project.discover(testdir)
                 project.refresh(test_list, errors)
             except ModelLoadError as e:
                 # Load failed; destroy the project and show an error dialog.
@@ -666,21 +1042,71 @@ class MainWindow(object):
     def mainloop(self):
         self.root.mainloop()
 
+    def open_history(self, testdir):
+        "Return the run history store for a test directory, opening it if required."
+        path = os.path.join(testdir, HISTORY_FILENAME)
+        if self.history is None or self.history.path != path:
+            if self.history:
+                self.history.close()
+            try:
+                self.history = HistoryStore(path)
+            except sqlite3.Error:
+                # History is a convenience; tests can still run without it.
+                self.history = None
+        return self.history
+
+    def load_run(self, history, run_id):
+        "Load the results of a recorded run into the project."
+        history.load_run(self.project, run_id)
+        self._show_project_summary()
+
     # Menu/button commands.
     def cmd_load_run(self):
-        self.load_filename = filedialog.askopenfilename(
-            initialdir=".", title="Select Run File to Load"
+        "Command: Load the results of a previous run"
+        history = self.open_history(self.testdir_name.get())
+        if history is None:
+            tkMessageBox.showerror(message="Unable to open the run history.")
+            return
+
+        dialog = RunHistoryDialog(self.root, history.runs())
+        if dialog.status == dialog.OK and dialog.run_id is not None:
+            self.load_run(history, dialog.run_id)
+
+    def cmd_import_junit(self):
+        "Command: Browse the results in a JUnit XML file"
+        filename = filedialog.askopenfilename(
+            initialdir=".",
+            title="Select JUnit XML File to Open",
+            filetypes=[("JUnit XML", "*.xml"), ("All files", "*")],
         )
-        print(self.load_filename)
+        if not filename:
+            return
+
+        project = self.Model()
+        try:
+            junit.read_project(project, filename)
+        except ModelLoadError as e:
+            tkMessageBox.showerror(message=e.trace)
+            return
+        self.project = project
 
     def cmd_export_run(self):
+        "Command: Export the current results as JUnit XML"
         self.save_filename = filedialog.asksaveasfilename(
-            initialdir=".", title="Select File to Save To"
+            initialdir=".",
+            title="Select File to Save To",
+            defaultextension=".xml",
+            filetypes=[("JUnit XML", "*.xml"), ("All files", "*")],
         )
-        print(self.save_filename)
+        if self.save_filename:
+            junit.write_project(self.project, self.save_filename)
 
     def cmd_quit(self):
-        self.stop()
+        if self.executor and self.executor.is_running:
+            self.executor.terminate()
+            self.executor = None
+        if self.history:
+            self.history.close()
         self.root.quit()
 
     def cmd_stop(self, event=None):
@@ -694,23 +1120,56 @@ class MainWindow(object):
         if not self.executor or not self.executor.is_running:
             self.run(active=True)
 
-    def cmd_run_selected(self, event=None):
+    def cmd_run_selected(self, event=None, profile=False, repeat=1):
         "Command: The 'run selected' button has been pressed"
         current_tree = self.current_test_tree
 
-        # If a node is selected, it needs to be made active
-        for path in current_tree.selection():
-            parts = path.split(".")
-            testModule = self.project
-            for part in parts:
-                testModule = testModule[part]
+        # Section headings on the problem tree don't name any tests.
+        labels = {node_path(item) for item in current_tree.selection()} - {""}
 
+        # If a node is selected, it needs to be made active
+        for testModule in self.project.get_nodes(labels):
             testModule.set_active(True)
 
         # If the executor isn't currently running, we can
         # start a test run.
-        if not self.executor or not self.executor.is_running:
-            self.run(labels=set(current_tree.selection()))
+        if labels and (not self.executor or not self.executor.is_running):
+            self.run(labels=labels, profile=profile, repeat=repeat)
+
+    def cmd_profile_selected(self, event=None):
+        "Command: The 'profile' button has been pressed"
+        self.cmd_run_selected(profile=True)
+
+    def cmd_repeat_selected(self, event=None):
+        "Command: Run the selected tests many times over, to expose flaky tests"
+        if not self.current_test_tree.selection():
+            return
+        repeat = simpledialog.askinteger(
+            "Run selected tests N times",
+            "Number of times to run each selected test:",
+            initialvalue=10,
+            minvalue=2,
+            parent=self.root,
+        )
+        if repeat:
+            self.cmd_run_selected(repeat=repeat)
+
+    def cmd_export_profile(self):
+        "Command: Export the displayed profile as collapsed stacks, for a flamegraph"
+        if not self.profile_stats_file:
+            return
+        filename = filedialog.asksaveasfilename(
+            initialdir=".",
+            title="Select File to Save To",
+            defaultextension=".txt",
+            filetypes=[("Collapsed stacks", "*.txt"), ("All files", "*")],
+        )
+        if not filename:
+            return
+        try:
+            profiling.write_collapsed_stacks(self.profile_stats_file, filename)
+        except (IOError, OSError) as e:
+            tkMessageBox.showerror(message="Unable to export the profile: %s" % e)
 
     def cmd_reload_tests(self):
         # Reload the project tree on left side.
@@ -726,6 +1185,30 @@ class MainWindow(object):
         if not self.executor or not self.executor.is_running:
             self.run(status=set(TestMethod.FAILING_STATES))
 
+    def cmd_resume_run(self, event=None):
+        "Command: Restore the results of an unfinished run, and run the rest of it"
+        if self.executor and self.executor.is_running:
+            return
+        testdir = self.testdir_name.get()
+        saved = SavedRun.load(os.path.join(testdir, CHECKPOINT_FILENAME))
+        if saved is None or saved.finished:
+            tkMessageBox.showinfo(message="There is no unfinished run to resume.")
+            return
+        if not saved.ran_in(testdir):
+            tkMessageBox.showerror(
+                message="The unfinished run was of the tests in %s, not %s."
+                % (saved.testdir, testdir)
+            )
+            return
+
+        saved.restore(self.project)
+        remaining = saved.remaining(self.project)
+        if not remaining:
+            self._show_project_summary()
+            tkMessageBox.showinfo(message="Every test in the last run has a result.")
+            return
+        self.run(active=False, labels=set(remaining), resume=True)
+
     def cmd_help_documentation(self):
         "Command: Open documentation"
         import webbrowser
@@ -734,29 +1217,17 @@ class MainWindow(object):
 
     def on_testModuleClicked(self, event):
         "Event handler: a module has been clicked in the tree"
-        parts = event.widget.focus().split(".")
-        testModule = self.project
-        for part in parts:
-            testModule = testModule[part]
-
+        testModule = self.project.get_node(event.widget.focus())
         testModule.toggle_active()
 
     def on_testCaseClicked(self, event):
         "Event handler: a test case has been clicked in the tree"
-        parts = event.widget.focus().split(".")
-        testCase = self.project
-        for part in parts:
-            testCase = testCase[part]
-
+        testCase = self.project.get_node(event.widget.focus())
         testCase.toggle_active()
 
     def on_testMethodClicked(self, event):
         "Event handler: a test case has been clicked in the tree"
-        parts = event.widget.focus().split(".")
-        testMethod = self.project
-        for part in parts:
-            testMethod = testMethod[part]
-
+        testMethod = self.project.get_node(event.widget.focus())
         testMethod.toggle_active()
 
     def on_testModuleSelected(self, event):
@@ -790,13 +1261,9 @@ class MainWindow(object):
     def on_testMethodSelected(self, event):
         "Event handler: a test case has been selected in the tree"
         if len(event.widget.selection()) == 1:
-            parts = event.widget.selection()[0].split(".")
-
             # Find the definition for the actual test method
             # out of the project.
-            testMethod = self.project
-            for part in parts:
-                testMethod = testMethod[part]
+            testMethod = self.project.get_node(node_path(event.widget.selection()[0]))
 
             self.name.set(testMethod.path)
 
@@ -820,12 +1287,30 @@ class MainWindow(object):
                     self._show_test_errors(testMethod.error)
                 else:
                     self._hide_test_errors()
+
+                if testMethod.profile:
+                    self._show_test_profile(testMethod.profile)
+                else:
+                    self._hide_test_profile()
+
+                if testMethod.resources:
+                    self._show_test_resources(testMethod.resources)
+                else:
+                    self._hide_test_resources()
+
+                if testMethod.phases or testMethod.attempts or testMethod.repeats:
+                    self._show_test_timing(testMethod)
+                else:
+                    self._hide_test_timing()
             else:
                 # Test hasn't been executed yet.
                 self.duration.set("Not executed")
 
                 self._hide_test_output()
                 self._hide_test_errors()
+                self._hide_test_profile()
+                self._hide_test_resources()
+                self._hide_test_timing()
 
         else:
             # Multiple tests selected
@@ -837,18 +1322,25 @@ class MainWindow(object):
 
             self._hide_test_output()
             self._hide_test_errors()
+            self._hide_test_profile()
+            self._hide_test_resources()
+            self._hide_test_timing()
 
         # update "run selected" button enabled state
         self.set_selected_button_state()
 
     def on_nodeAdded(self, node):
         "Event handler: a new node has been added to the tree"
+        if node.project is not self._project:
+            # The node belongs to a project that isn't being displayed.
+            return
         try:
             self.all_tests_tree.insert(
                 node.parent.path,
                 "end",
                 node.path,
                 text=node.name,
+                values=(getattr(node, "badge", ""),),
                 tags=[node.__class__.__name__, "active"],
                 open=True,
             )
@@ -856,62 +1348,341 @@ class MainWindow(object):
             # print("Test already added ignoring.")
             pass
 
+    def _node_tags(self, node):
+        "The tags describing the current state of a node on the tree"
+        if not node.active:
+            return [node.__class__.__name__, "inactive"]
+        if isinstance(node, TestMethod) and node.status in STATUS:
+            return self._method_tags(node)
+        return [node.__class__.__name__, "active"]
+
+    def _method_tags(self, node):
+        "The tags describing the last result of a test method on the tree"
+        tags = ["TestMethod", STATUS[node.status]["tag"]]
+        if node.slower:
+            tags.append("slower")
+        return tags
+
+    def _duration_text(self, node):
+        "The text describing the duration of a test method on the tree"
+        return "%0.2fs" % node.duration if node.duration is not None else ""
+
+    def _method_values(self, node):
+        "The column values describing the last result of a test method on the tree"
+        cpu_time = node.cpu_time
+        max_rss_delta = node.max_rss_delta
+        return (
+            self._duration_text(node),
+            "%0.2fs" % cpu_time if cpu_time is not None else "",
+            format_size(max_rss_delta) if max_rss_delta is not None else "",
+        )
+
     def on_nodeActive(self, node):
         "Event handler: a node on the tree has been made active"
-        self.all_tests_tree.item(node.path, tags=[node.__class__.__name__, "active"])
-        self.all_tests_tree.item(node.path, open=True)
+        if node.project is not self._project:
+            return
+        self.all_tests_tree.item(
+            node.path, tags=self._node_tags(node), open=self._can_open(node)
+        )
+
+    def _can_open(self, node):
+        """Return True if a node can be opened on the tree from code.
+
+        A test method whose subtests haven't been added yet only holds the
+        placeholder, which is replaced when the user opens it; opening it
+        from code would show the placeholder instead.
+        """
+        return not self.all_tests_tree.exists(SUBTESTS_PLACEHOLDER + node.path)
 
     def on_nodeInactive(self, node):
         "Event handler: a node on the tree has been made inactive"
-        self.all_tests_tree.item(node.path, tags=[node.__class__.__name__, "inactive"])
-        self.all_tests_tree.item(node.path, open=False)
+        if node.project is not self._project:
+            return
+        self.all_tests_tree.item(node.path, tags=self._node_tags(node), open=False)
+
+    def _retag_subtree(self, node, is_open):
+        "Update the tags of a node and everything under it in the tree"
+        self.all_tests_tree.item(
+            node.path,
+            tags=self._node_tags(node),
+            open=is_open and self._can_open(node),
+        )
+
+        # Build child paths as we descend, rather than asking each node
+        # to compute its own path by walking back up the tree.
+        stack = [(node.path, node)]
+        while stack:
+            path, parent = stack.pop()
+            for name, child in parent.items():
+                child_path = "%s.%s" % (path, name)
+                self.all_tests_tree.item(child_path, tags=self._node_tags(child))
+                if not isinstance(child, TestMethod):
+                    stack.append((child_path, child))
+
+    def on_subtreeActive(self, node):
+        "Event handler: a node and everything under it has been made active"
+        if node.project is not self._project:
+            return
+        self._retag_subtree(node, is_open=True)
+
+    def on_subtreeInactive(self, node):
+        "Event handler: a node and everything under it has been made inactive"
+        if node.project is not self._project:
+            return
+        self._retag_subtree(node, is_open=False)
+
+    def on_nodesRemoved(self, nodes, data):
+        "Event handler: nodes have been removed from the tree"
+        nodes = [node for node in nodes if node.project is self._project]
+        paths = [node.path for node in nodes]
+        self.all_tests_tree.delete(
+            *[path for path in paths if self.all_tests_tree.exists(path)]
+        )
+        for node in nodes:
+            self._remove_problem_node(node)
+            self._update_failure_group(node)
+
+    def _remove_problem_node(self, node):
+        "Remove a node from the problem tree, along with any parents left empty"
+        if self.problem_tests_tree.exists(node.path):
+            self.problem_tests_tree.delete(node.path)
+
+            # Check all parents of this node. Recursively remove
+            # any parent has no children as a result of this deletion.
+            has_children = False
+            node = node.parent
+            while node.path and not has_children:
+                if not self.problem_tests_tree.exists(node.path):
+                    break
+                if not self.problem_tests_tree.get_children(node.path):
+                    self.problem_tests_tree.delete(node.path)
+                else:
+                    has_children = True
+                node = node.parent
 
     def on_nodeStatusUpdate(self, node):
         "Event handler: a node on the tree has received a status update"
+        if node.project is not self._project:
+            return
         self.all_tests_tree.item(
-            node.path, tags=["TestMethod", STATUS[node.status]["tag"]]
+            node.path,
+            values=self._method_values(node),
+            tags=self._method_tags(node),
         )
 
-        if node.status in TestMethod.FAILING_STATES:
-            # Test is in a failing state. Make sure it is on the problem tree,
-            # with the correct current status.
+        self._reset_subtest_items(node)
 
-            parts = node.path.split(".")
-            parentModule = self.project
-            for pos, part in enumerate(parts):
-                path = ".".join(parts[: pos + 1])
-                testModule = parentModule[part]
+        # Refresh the result badges of every ancestor of the node.
+        parent = node.parent
+        while parent.path:
+            self.all_tests_tree.item(parent.path, values=(parent.badge,))
+            parent = parent.parent
 
-                if not self.problem_tests_tree.exists(path):
-                    self.problem_tests_tree.insert(
-                        parentModule.path,
-                        "end",
-                        testModule.path,
-                        text=testModule.name,
-                        tags=[testModule.__class__.__name__, "active"],
-                        open=True,
-                    )
+        if node.status in PROBLEM_STATES:
+            # Test is in a failing (or flaky) state. Make sure it is on the
+            # problem tree, with the correct current status.
+            self._add_problem_node(node)
+        else:
+            # Test passed; if it's on the problem tree, remove it.
+            self._remove_problem_node(node)
+
+        if node.slower:
+            self._add_slower_node(node)
+        else:
+            self._remove_slower_node(node)
+
+        self._update_failure_group(node)
+
+    def _reset_subtest_items(self, node):
+        "Replace any subtests of a test method on the tree with a placeholder"
+        tree = self.all_tests_tree
+        children = tree.get_children(node.path)
+        if children:
+            tree.delete(*children)
+        if node.subtests:
+            tree.insert(node.path, "end", SUBTESTS_PLACEHOLDER + node.path)
+            tree.item(node.path, open=False)
+
+    def on_treeItemOpened(self, event):
+        "Event handler: an item on the tree has been opened; add any subtests"
+        tree = self.all_tests_tree
+        path = tree.focus()
+        if not tree.exists(SUBTESTS_PLACEHOLDER + path):
+            return
+        tree.delete(SUBTESTS_PLACEHOLDER + path)
+
+        subtests = self.project.get_node(path).subtests
+        failed = subtests.failed()
+        shown = set(failed[:MAX_SUBTEST_ITEMS])
+        indices = failed[:MAX_SUBTEST_ITEMS]
+        for index in range(len(subtests)):
+            if len(indices) >= MAX_SUBTEST_ITEMS:
+                break
+            if index not in shown:
+                indices.append(index)
+
+        for index in indices:
+            name, status, duration, error = subtests[index]
+            tree.insert(
+                path,
+                "end",
+                subtest_item(index, path),
+                text=name,
+                values=("%0.3fs" % duration, "", ""),
+                tags=["Subtest", STATUS.get(status, STATUS_DEFAULT)["tag"]],
+            )
+        if len(subtests) > len(indices):
+            tree.insert(
+                path,
+                "end",
+                SUBTESTS_PLACEHOLDER + "more:" + path,
+                text="... %d more subtests" % (len(subtests) - len(indices)),
+            )
+
+    def on_subtestSelected(self, event):
+        "Event handler: a subtest has been selected in the tree"
+        if len(event.widget.selection()) != 1:
+            return
+        item = event.widget.selection()[0]
+        index = int(item.partition(":")[0].rpartition("-")[2])
+        testMethod = self.project.get_node(node_path(item))
+        name, status, duration, error = testMethod.subtests[index]
+
+        self.name.set("%s %s" % (testMethod.path, name))
+        self.description.delete("1.0", END)
+        self.description.insert("1.0", testMethod.description)
+
+        config = STATUS.get(status, STATUS_DEFAULT)
+        self.test_status_widget.config(foreground=config["color"])
+        self.test_status.set(config["symbol"])
+        self.duration.set("%0.3fs" % duration)
+
+        if error:
+            self._show_test_errors(error)
+        else:
+            self._hide_test_errors()
+        self._hide_test_output()
+        self._hide_test_profile()
+        self._hide_test_resources()
+        self._hide_test_timing()
+
+        # update "run selected" button enabled state
+        self.set_selected_button_state()
+
+    def _add_problem_node(self, node):
+        "Add a failing test method to the problem tree, along with any missing parents"
+        # Walk up the parent links to find every ancestor of the node;
+        # then add any that are missing, from the top down.
+        ancestors = []
+        testModule = node
+        while testModule.path:
+            ancestors.append(testModule)
+            testModule = testModule.parent
+
+        for testModule in reversed(ancestors):
+            if not self.problem_tests_tree.exists(testModule.path):
+                self.problem_tests_tree.insert(
+                    testModule.parent.path,
+                    "end",
+                    testModule.path,
+                    text=testModule.name,
+                    tags=[testModule.__class__.__name__, "active"],
+                    open=True,
+                )
 
-                parentModule = testModule
+        self.problem_tests_tree.item(node.path, tags=self._method_tags(node))
 
-            self.problem_tests_tree.item(
-                node.path, tags=["TestMethod", STATUS[node.status]["tag"]]
+    def _add_slower_node(self, node):
+        "Add a test method that ran slower than usual to the problem tree"
+        if not self.problem_tests_tree.exists(SLOWER_SECTION):
+            self.problem_tests_tree.insert(
+                "", 0, SLOWER_SECTION, text="Slower", tags=["section"], open=True
             )
+
+        item = SLOWER_SECTION + node.path
+        text = "%s (%0.1fx)" % (node.path, node.slower["ratio"])
+        if self.problem_tests_tree.exists(item):
+            self.problem_tests_tree.item(item, text=text, tags=self._method_tags(node))
         else:
-            # Test passed; if it's on the problem tree, remove it.
-            if self.problem_tests_tree.exists(node.path):
-                self.problem_tests_tree.delete(node.path)
+            self.problem_tests_tree.insert(
+                SLOWER_SECTION, "end", item, text=text, tags=self._method_tags(node)
+            )
 
-                # Check all parents of this node. Recursively remove
-                # any parent has no children as a result of this deletion.
-                has_children = False
-                node = node.parent
-                while node.path and not has_children:
-                    if not self.problem_tests_tree.get_children(node.path):
-                        self.problem_tests_tree.delete(node.path)
-                    else:
-                        has_children = True
-                    node = node.parent
+    def _update_failure_group(self, node):
+        "Move a test to the group of tests failing the same way, if it has changed"
+        old = self._failure_signatures.pop(node.path, None)
+        new = self.project.results.signature(node.path)
+        if new is not None:
+            self._failure_signatures[node.path] = new
+        if old != new:
+            if old is not None:
+                self._refresh_failure_group(old, node.path)
+            if new is not None:
+                self._refresh_failure_group(new, node.path)
+        elif new is not None:
+            item = failure_group_item(new) + node.path
+            if self.problem_tests_tree.exists(item):
+                self.problem_tests_tree.item(item, tags=self._method_tags(node))
+
+    def _refresh_failure_group(self, signature, path):
+        """Update a group of identical failures on the problem tree after a test
+        has joined or left it.
+
+        Only groups of more than one test are shown, closed, so that many
+        identical failures take up a single line.
+        """
+        tree = self.problem_tests_tree
+        group = failure_group_item(signature)
+        paths = self.project.results.group(signature)
+
+        if len(paths) < 2:
+            if tree.exists(group):
+                tree.delete(group)
+                if not tree.get_children(FAILURE_GROUPS_SECTION):
+                    tree.delete(FAILURE_GROUPS_SECTION)
+            return
+
+        if not tree.exists(FAILURE_GROUPS_SECTION):
+            tree.insert(
+                "",
+                0,
+                FAILURE_GROUPS_SECTION,
+                text="Failure groups",
+                tags=["section"],
+                open=True,
+            )
+
+        if not tree.exists(group):
+            tree.insert(FAILURE_GROUPS_SECTION, "end", group, tags=["section"])
+            added = paths
+        elif path in paths:
+            added = [path]
+        else:
+            added = []
+            if tree.exists(group + path):
+                tree.delete(group + path)
+
+        for added_path in added:
+            # With batched events, a test may already be in its new group.
+            if tree.exists(group + added_path):
+                continue
+            node = self.project.get_node(added_path)
+            tree.insert(
+                group,
+                "end",
+                group + added_path,
+                text=added_path,
+                tags=self._method_tags(node),
+            )
+        tree.item(group, text="%s (%d tests)" % (signature, len(paths)))
+
+    def _remove_slower_node(self, node):
+        "Remove a test method from the slower tests on the problem tree"
+        item = SLOWER_SECTION + node.path
+        if self.problem_tests_tree.exists(item):
+            self.problem_tests_tree.delete(item)
+            if not self.problem_tests_tree.get_children(SLOWER_SECTION):
+                self.problem_tests_tree.delete(SLOWER_SECTION)
 
     def on_testProgress(self):
         "Event handler: a periodic update to poll the runner for output, generating GUI updates"
@@ -932,16 +1703,24 @@ class MainWindow(object):
     def on_executorTestEnd(self, event, test_path, result, remaining_time):
         "The executor has finished running a test."
         # Update the progress meter
-        self.progress_value.set(self.progress_value.get() + 1)
+        self.progress_value.set(self.executor.completed_count)
+
+        # Update the slowest tests panel
+        duration = self.project.get_node(test_path).duration
+        if duration is not None:
+            self.duration_stats.add(test_path, duration)
+            self._schedule_stats_update()
 
         # Update the run summary
         self.run_summary.set(
-            "Total:%(total)s Passed:%(pass)s Failed:%(fail)s Skipped:%(skip)s"
+            "Total:%(total)s Passed:%(pass)s Failed:%(fail)s Skipped:%(skip)s "
+            "Remaining:%(remaining)s"
             % {
                 "total": self.executor.total_count,
                 "pass": self.executor.result_count.get(TestMethod.STATUS_PASS, 0),
                 "fail": self.executor.result_count.get(TestMethod.STATUS_FAIL, 0),
                 "skip": self.executor.result_count.get(TestMethod.STATUS_SKIP, 0),
+                "remaining": remaining_time,
             }
         )
 
@@ -950,7 +1729,7 @@ class MainWindow(object):
         current_tree = self.current_test_tree
         if len(current_tree.selection()) == 1:
             # One test selected.
-            if current_tree.selection()[0] == test_path:
+            if node_path(current_tree.selection()[0]) == test_path:
                 # If the test that just finished running is the selected
                 # test, force reset the selection, which will generate a
                 # selection event, forcing a refresh of the result page.
@@ -965,13 +1744,24 @@ class MainWindow(object):
 
             self._hide_test_output()
             self._hide_test_errors()
+            self._hide_test_profile()
+            self._hide_test_resources()
+            self._hide_test_timing()
 
     def on_executorSuiteEnd(self, event, error=None):
         "The test suite finished running."
         # Display the final results
-        self.run_status.set("Finished.")
+        if self.executor.interrupted:
+            self.run_status.set("Stopped.")
+        elif self.executor.stopped_early:
+            self.run_status.set(
+                "Stopped at the failure limit (%d)." % self.executor.max_failures
+            )
+        else:
+            self.run_status.set("Finished.")
 
-        if error:
+        # A run that was stopped ends quietly.
+        if error and not self.executor.interrupted:
             TestErrorsDialog(self.root, error)
 
         if self.executor.any_failed:
@@ -984,7 +1774,32 @@ class MainWindow(object):
             for state, count in sorted(self.executor.result_count.items())
         )
 
-        dialog(message=message or "No tests were ran")
+        message = message or "No tests were ran"
+
+        regressions = self.executor.regressions.top(5)
+        if regressions:
+            message = "%s\n\nSlower than usual:\n%s" % (
+                message,
+                "\n".join(regression.describe(*item) for item in regressions),
+            )
+
+        # In a stress run, the tests that failed most often.
+        unreliable = sorted(
+            (stats.pass_rate, path)
+            for path, stats in self.executor.repeats.items()
+            if stats.failed
+        )[:5]
+        if unreliable:
+            message = "%s\n\nLeast reliable:\n%s" % (
+                message,
+                "\n".join(
+                    "%s: %s" % (path, self.executor.repeats[path].describe())
+                    for rate, path in unreliable
+                ),
+            )
+
+        if not self.executor.interrupted:
+            dialog(message=message)
 
         # Update the run summary
         self.run_summary.set(
@@ -1027,13 +1842,23 @@ class MainWindow(object):
 
     def set_selected_button_state(self):
         if self.executor and self.executor.is_running:
-            self.run_selected_button.configure(state=DISABLED)
+            state = DISABLED
         elif self.current_test_tree.selection():
-            self.run_selected_button.configure(state=NORMAL)
+            state = NORMAL
         else:
-            self.run_selected_button.configure(state=DISABLED)
-
-    def run(self, active=True, status=None, labels=None):
+            state = DISABLED
+        self.run_selected_button.configure(state=state)
+        self.profile_selected_button.configure(state=state)
+
+    def run(
+        self,
+        active=True,
+        status=None,
+        labels=None,
+        profile=False,
+        repeat=1,
+        resume=False,
+    ):
         """Run the test suite.
 
         If active=True, only active tests will be run.
@@ -1041,6 +1866,10 @@ class MainWindow(object):
             status matches the set provided will be executed.
         If labels is provided, only tests with those labels will
             be executed
+        If profile=True, each test is run under a profiler.
+        If repeat is more than 1, each test is run that many times.
+        If resume=True, the results are added to the journal of the last
+            run, rather than starting a new one.
         """
         count, labels = self.project.find_tests(active, status, labels)
         self.run_status.set("Running...")
@@ -1055,27 +1884,67 @@ class MainWindow(object):
 
         self.run_all_button.configure(state=DISABLED)
         self.run_selected_button.configure(state=DISABLED)
+        self.profile_selected_button.configure(state=DISABLED)
         self.rerun_button.configure(state=DISABLED)
 
-        self.progress["maximum"] = count
+        self.progress["maximum"] = count * repeat
         self.progress_value.set(0)
+
+        # The slowest tests panel describes a single run.
+        self.duration_stats.reset()
+        self._update_stats_panel()
         # Create the runner
-        self.executor = Runner(self.project, count, labels, self.testdir_name.get())
+        testdir = self.testdir_name.get()
+        try:
+            workers = max(1, self.workers.get())
+        except (TclError, ValueError):
+            workers = 1
+        try:
+            max_failures = max(0, self.max_failures.get()) or None
+        except (TclError, ValueError):
+            max_failures = None
+        try:
+            timeout = max(0, self.timeout.get()) or None
+        except (TclError, ValueError):
+            timeout = None
+        try:
+            retries = max(0, self.retries.get())
+        except (TclError, ValueError):
+            retries = 0
+        self.executor = Runner(
+            self.project,
+            count,
+            labels,
+            testdir,
+            history=self.open_history(testdir),
+            workers=workers,
+            profile=profile,
+            trace_allocations=self.trace_allocations.get(),
+            order=ORDER_FAILED_FIRST if self.failed_first.get() else ORDER_DISCOVERY,
+            max_failures=max_failures,
+            timeout=timeout,
+            retries=retries,
+            repeat=repeat,
+            checkpoint=Checkpoint(os.path.join(testdir, CHECKPOINT_FILENAME)),
+            resume=resume,
+        )
 
         # Queue the first progress handling event
         self.root.after(100, self.on_testProgress)
 
     def stop(self):
-        "Stop the test suite."
-        if self.executor and self.executor.is_running:
-            self.run_status.set("Stopping...")
-
-            self.executor.terminate()
-            self.executor = None
+        """Stop the test suite.
 
-            self.run_status.set("Stopped.")
-
-            self.reset_button_states_on_end()
+        The tests that are running are reported as interrupted, and the
+        run ends as usual; stopping again kills the tests straight away.
+        """
+        if self.executor and self.executor.is_running:
+            if self.executor.stopping is None:
+                self.run_status.set("Stopping...")
+                self.executor.stop()
+            else:
+                self.run_status.set("Killing tests...")
+                self.executor.kill()
 
     def _hide_test_output(self):
         "Hide the test output panel on the test results page"
@@ -1109,6 +1978,256 @@ class MainWindow(object):
         self.error.grid()
         self.error_scrollbar.grid()
 
+    def _hide_test_profile(self):
+        "Hide the profile panel on the test results page"
+        self.profile_label.grid_remove()
+        self.profile_tree.grid_remove()
+        self.profile_scrollbar.grid_remove()
+        self.export_profile_button.grid_remove()
+        self.profile_stats_file = None
+
+    def _show_test_profile(self, profile):
+        "Show the profile panel on the test results page"
+        self.profile_tree.delete(*self.profile_tree.get_children())
+        for function, calls, tottime, cumtime in profile["top"]:
+            self.profile_tree.insert(
+                "",
+                "end",
+                text=function,
+                values=(calls, "%0.4f" % tottime, "%0.4f" % cumtime),
+            )
+        self.profile_stats_file = profile.get("stats_file")
+
+        self.profile_label.grid()
+        self.profile_tree.grid()
+        self.profile_scrollbar.grid()
+        if self.profile_stats_file:
+            self.export_profile_button.grid()
+
+    def _schedule_stats_update(self):
+        "Redraw the slowest tests panel shortly, folding any other updates into it"
+        if not self._stats_update_pending:
+            self._stats_update_pending = True
+            self.root.after(250, self._update_stats_panel)
+
+    def _update_stats_panel(self):
+        "Redraw the slowest tests panel from the current run's statistics"
+        self._stats_update_pending = False
+        stats = self.duration_stats
+
+        self.slowest_tests_tree.delete(*self.slowest_tests_tree.get_children())
+        # Each tree item is identified by its test's path, so a test that
+        # ran more than once (in a stress run) is shown once.
+        for path, duration in stats.slowest(distinct=True):
+            try:
+                status = self.project.get_node(path).status
+            except KeyError:
+                status = None
+            self.slowest_tests_tree.insert(
+                "",
+                "end",
+                path,
+                text=path,
+                values=("%0.2fs" % duration,),
+                tags=["TestMethod", STATUS.get(status, STATUS_DEFAULT)["tag"]],
+            )
+
+        if stats.count:
+            self.duration_summary.set(
+                "%d tests, %0.2fs in total, %0.3fs mean"
+                % (stats.count, stats.total, stats.total / stats.count)
+            )
+        else:
+            self.duration_summary.set("")
+        self._draw_histogram()
+
+    def _draw_histogram(self):
+        "Draw the histogram of test durations, on a log scale"
+        canvas = self.histogram
+        stats = self.duration_stats
+        canvas.delete("all")
+
+        width = canvas.winfo_width()
+        height = canvas.winfo_height()
+        axis = height - 16
+        bar_width = float(width) / stats.bucket_count
+        peak = max(stats.buckets) or 1
+
+        for index, count in enumerate(stats.buckets):
+            if count:
+                top = axis - (axis - 4) * count / float(peak)
+                canvas.create_rectangle(
+                    index * bar_width,
+                    top,
+                    (index + 1) * bar_width - 1,
+                    axis,
+                    fill=STATUS[TestMethod.STATUS_SKIP]["color"],
+                    outline="",
+                )
+
+        # Label each factor of 10 along the axis.
+        canvas.create_line(0, axis, width, axis)
+        for index in range(0, stats.bucket_count, stats.BUCKETS_PER_DECADE):
+            x = index * bar_width
+            canvas.create_line(x, axis, x, axis + 3)
+            canvas.create_text(
+                x + 2,
+                axis + 2,
+                text=short_duration(stats.bucket_bounds(index)[0]),
+                anchor=NW,
+                font=("TkDefaultFont", 8),
+            )
+
+    def _hide_test_timing(self):
+        "Hide the timing panel on the test results page"
+        self.timing_label.grid_remove()
+        self.timing.grid_remove()
+        self.timing_scrollbar.grid_remove()
+
+    def _show_test_timing(self, testMethod):
+        "Show the timing panel on the test results page"
+        lines = []
+        if testMethod.phases:
+            lines.append(
+                "  ".join(
+                    "%s: %0.3fs" % (phase, testMethod.phases[phase])
+                    for phase in ("setUp", "test", "tearDown")
+                    if phase in testMethod.phases
+                )
+            )
+        if testMethod.attempts:
+            lines.append("Attempts: %d" % testMethod.attempts)
+        if testMethod.repeats:
+            lines.append("Runs: %s" % testMethod.repeats.describe())
+        # The fixtures shared by this test, from its class outwards.
+        node = testMethod.parent
+        while getattr(node, "fixtures", None) is not None:
+            if node.fixtures:
+                lines.append(
+                    "%s  %s"
+                    % (
+                        node.path,
+                        "  ".join(
+                            "%s: %0.3fs" % (phase, duration)
+                            for phase, duration in sorted(node.fixtures.items())
+                        ),
+                    )
+                )
+            node = node.parent
+
+        self.timing.delete("1.0", END)
+        self.timing.insert("1.0", "\n".join(lines))
+
+        self.timing_label.grid()
+        self.timing.grid()
+        self.timing_scrollbar.grid()
+
+    def _hide_test_resources(self):
+        "Hide the resources panel on the test results page"
+        self.resources_label.grid_remove()
+        self.resources.grid_remove()
+        self.resources_scrollbar.grid_remove()
+
+    def _show_test_resources(self, resources):
+        "Show the resources panel on the test results page"
+        lines = []
+        if "cpu_user" in resources:
+            lines.append(
+                "CPU time: %0.3fs user, %0.3fs system"
+                % (resources["cpu_user"], resources["cpu_system"])
+            )
+        if "max_rss_delta" in resources:
+            lines.append(
+                "Peak RSS growth: %s" % format_size(resources["max_rss_delta"])
+            )
+        if "gc_collections" in resources:
+            lines.append(
+                "GC collections (by generation): %s"
+                % ", ".join(str(count) for count in resources["gc_collections"])
+            )
+        if "alloc_peak" in resources:
+            lines.append(
+                "Peak traced allocations: %s" % format_size(resources["alloc_peak"])
+            )
+            lines.append("Top allocation sites:")
+            for site, size, count in resources.get("alloc_top", []):
+                lines.append(
+                    "    %s: %s in %d blocks" % (site, format_size(size), count)
+                )
+
+        self.resources.delete("1.0", END)
+        self.resources.insert("1.0", "\n".join(lines))
+
+        self.resources_label.grid()
+        self.resources.grid()
+        self.resources_scrollbar.grid()
+
+    def _sort_tests_tree(self, column, reverse=False):
+        """Sort every level of the all tests tree by a column.
+
+        Test methods are sorted by their own measurement; modules and test
+        cases by the total (or, for memory, the largest) measurement of the
+        tests they contain. Tests with no measurement are sorted last.
+        Sorting by the same column again reverses the order.
+        """
+        measures = {
+            "result": lambda testMethod: testMethod.duration,
+            "cpu": lambda testMethod: testMethod.cpu_time,
+            "memory": lambda testMethod: testMethod.max_rss_delta,
+        }
+        combine = max if column == "memory" else sum
+        keys = {}
+
+        def measure(node):
+            if column == "#0":
+                value = node.name
+            elif isinstance(node, TestMethod):
+                value = measures[column](node)
+            else:
+                values = [measure(child) for child in node.values()]
+                values = [value for value in values if value is not None]
+                value = combine(values) if values else None
+            keys[node.path] = value
+            return value
+
+        for testModule in self.project.values():
+            measure(testModule)
+
+        parents = [""]
+        while parents:
+            parent = parents.pop()
+            children = self.all_tests_tree.get_children(parent)
+            measured = [item for item in children if keys.get(item) is not None]
+            unmeasured = [item for item in children if keys.get(item) is None]
+            measured.sort(key=keys.get, reverse=reverse)
+            for index, item in enumerate(measured + unmeasured):
+                self.all_tests_tree.move(item, parent, index)
+            parents.extend(children)
+
+        self.all_tests_tree.heading(
+            column, command=lambda: self._sort_tests_tree(column, not reverse)
+        )
+
+    def _sort_tree(self, tree, column, reverse=False):
+        """Sort the top-level rows of a tree by the values in a column.
+
+        Sorting by the same column again reverses the order.
+        """
+
+        def key(item):
+            value = tree.item(item, "text") if column == "#0" else tree.set(item, column)
+            try:
+                return (0, float(value.split()[0]), value)
+            except (ValueError, IndexError):
+                return (1, 0.0, value)
+
+        items = sorted(tree.get_children(""), key=key, reverse=reverse)
+        for index, item in enumerate(items):
+            tree.move(item, "", index)
+        tree.heading(
+            column, command=lambda: self._sort_tree(tree, column, not reverse)
+        )
+
 
 class StackTraceDialog(Toplevel):
     OK = 1
@@ -1284,3 +2403,115 @@ class IgnorableTestLoadErrorDialog(StackTraceDialog):
             button_text="Continue",
             cancel_text="Quit",
         )
+
+
+class RunHistoryDialog(Toplevel):
+    OK = 1
+    CANCEL = 2
+
+    def __init__(self, parent, runs):
+        """Show a dialog listing recorded runs, so one can be selected."""
+        Toplevel.__init__(self, parent)
+        self.withdraw()  # remain invisible for now
+        if parent.winfo_viewable():
+            self.transient(parent)
+
+        self.title("Load Run")
+        self.parent = parent
+        self.run_id = None
+        self.status = self.CANCEL
+
+        self.frame = Frame(self)
+        self.frame.grid(column=0, row=0, sticky=(N, S, E, W))
+
+        self.label = Label(self.frame, text="Select a recorded run to load:")
+        self.label.grid(column=0, row=0, padx=5, pady=5, sticky=(W, E))
+
+        self.runs = Treeview(
+            self.frame,
+            columns=("started", "duration", "tests", "failed"),
+            show="headings",
+            selectmode="browse",
+            height=15,
+        )
+        self.runs.heading("started", text="Started")
+        self.runs.heading("duration", text="Duration")
+        self.runs.heading("tests", text="Tests")
+        self.runs.heading("failed", text="Failed")
+        self.runs.grid(column=0, columnspan=2, row=1, pady=5, sticky=(N, S, E, W))
+
+        self.runs_scrollbar = Scrollbar(self.frame, orient=VERTICAL)
+        self.runs_scrollbar.grid(column=2, row=1, pady=5, sticky=(N, S))
+        self.runs.config(yscrollcommand=self.runs_scrollbar.set)
+        self.runs_scrollbar.config(command=self.runs.yview)
+
+        for run_id, started, finished, tests, failed in runs:
+            self.runs.insert(
+                "",
+                "end",
+                str(run_id),
+                values=(
+                    time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(started)),
+                    "%0.1fs" % (finished - started) if finished else "Incomplete",
+                    tests,
+                    failed,
+                ),
+            )
+
+        self.cancel_button = Button(self.frame, text="Cancel", command=self.cancel)
+        self.cancel_button.grid(column=0, row=2, padx=5, pady=5, sticky=(E,))
+
+        self.ok_button = Button(
+            self.frame, text="Load", command=self.ok, default=ACTIVE
+        )
+        self.ok_button.grid(column=1, row=2, padx=5, pady=5, sticky=(E,))
+
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(0, weight=1)
+
+        self.frame.columnconfigure(0, weight=1)
+        self.frame.columnconfigure(1, weight=0)
+
+        self.frame.rowconfigure(0, weight=0)
+        self.frame.rowconfigure(1, weight=1)
+        self.frame.rowconfigure(2, weight=0)
+
+        self.protocol("WM_DELETE_WINDOW", self.cancel)
+        self.bind("<Return>", self.ok)
+        self.runs.bind("<Double-Button-1>", self.ok)
+
+        if self.parent is not None:
+            self.geometry(
+                "+%d+%d" % (parent.winfo_rootx() + 50, parent.winfo_rooty() + 50)
+            )
+
+        self.deiconify()  # become visible now
+        self.runs.focus_set()
+
+        # wait for window to appear on screen before calling grab_set
+        self.wait_visibility()
+        self.grab_set()
+        self.wait_window(self)
+
+    def ok(self, event=None):
+        selection = self.runs.selection()
+        if selection:
+            self.run_id = int(selection[0])
+
+        self.withdraw()
+        self.update_idletasks()
+
+        if self.parent is not None:
+            self.parent.focus_set()
+        self.destroy()
+        self.status = self.OK
+
+    def cancel(self, event=None):
+        self.withdraw()
+        self.update_idletasks()
+
+        if self.parent is not None:
+            self.parent.focus_set()
+
+        self.destroy()
+        self.status = self.CANCEL
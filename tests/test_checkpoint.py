@@ -0,0 +1,112 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from libs import model
+from libs.checkpoint import Checkpoint, SavedRun
+
+PATHS = ["m.A.test_1", "m.A.test_2", "m.A.test_3", "m.B.test_1"]
+
+
+class TestCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "checkpoint.jsonl")
+        self.project = model.UnittestProject()
+        for path in PATHS:
+            self.project.confirm_exists(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def start(self):
+        checkpoint = Checkpoint(self.path)
+        checkpoint.start("tests", PATHS)
+        return checkpoint
+
+    def test_no_journal(self):
+        self.assertIsNone(SavedRun.load(self.path))
+
+    def test_unfinished_run(self):
+        TestMethod = model.TestMethod
+        checkpoint = self.start()
+        checkpoint.record(
+            "m.A.test_1",
+            TestMethod.STATUS_PASS,
+            0.5,
+            "output",
+            None,
+            phases={"test": 0.5},
+        )
+        checkpoint.record("m.A.test_2", TestMethod.STATUS_FAIL, 0.25, None, "Boom")
+        checkpoint.record("m.B.test_1", TestMethod.STATUS_INTERRUPTED, 1.0, "partial")
+        checkpoint.close()
+
+        saved = SavedRun.load(self.path)
+        self.assertFalse(saved.finished)
+        self.assertEqual(saved.paths, PATHS)
+        # Interrupted tests run again.
+        self.assertEqual(saved.remaining(self.project), ["m.A.test_3", "m.B.test_1"])
+
+        self.assertEqual(saved.restore(self.project), 2)
+        passed = self.project.get_node("m.A.test_1")
+        self.assertEqual(passed.status, TestMethod.STATUS_PASS)
+        self.assertEqual(passed.output, "output")
+        self.assertEqual(passed.phases, {"test": 0.5})
+        failed = self.project.get_node("m.A.test_2")
+        self.assertEqual(failed.status, TestMethod.STATUS_FAIL)
+        self.assertEqual(failed.error, "Boom")
+        self.assertIsNone(self.project.get_node("m.B.test_1").status)
+
+    def test_finished_run(self):
+        checkpoint = self.start()
+        for path in PATHS:
+            checkpoint.record(path, model.TestMethod.STATUS_PASS, 0.1)
+        checkpoint.finish()
+        saved = SavedRun.load(self.path)
+        self.assertTrue(saved.finished)
+        self.assertEqual(saved.remaining(self.project), [])
+
+    def test_resume_after_a_partly_written_line(self):
+        checkpoint = self.start()
+        checkpoint.record("m.A.test_1", model.TestMethod.STATUS_PASS, 0.1)
+        checkpoint.close()
+        with open(self.path, "a") as f:
+            f.write('{"result":{"path":"m.A.te')
+
+        self.assertEqual(SavedRun.load(self.path).remaining(self.project), PATHS[1:])
+
+        checkpoint = Checkpoint(self.path)
+        checkpoint.resume()
+        checkpoint.record("m.A.test_2", model.TestMethod.STATUS_PASS, 0.1)
+        checkpoint.close()
+        self.assertEqual(SavedRun.load(self.path).remaining(self.project), PATHS[2:])
+
+    def test_run_is_tied_to_its_test_directory(self):
+        self.start().close()
+        saved = SavedRun.load(self.path)
+        self.assertEqual(saved.testdir, os.path.abspath("tests"))
+        self.assertTrue(saved.ran_in("tests"))
+        self.assertTrue(saved.ran_in(os.path.abspath("tests") + os.sep))
+        self.assertFalse(saved.ran_in(self.directory))
+
+    def test_tests_no_longer_in_the_project_are_skipped(self):
+        self.start().close()
+        project = model.UnittestProject()
+        project.confirm_exists("m.A.test_1")
+        self.assertEqual(SavedRun.load(self.path).remaining(project), ["m.A.test_1"])
+
+    def test_syncs_are_batched(self):
+        checkpoint = self.start()
+        checkpoint.SYNC_INTERVAL = 3600
+        checkpoint.SYNC_RESULTS = 2
+        checkpoint.record("m.A.test_1", model.TestMethod.STATUS_PASS, 0.1)
+        self.assertEqual(checkpoint._unsynced, 1)
+        checkpoint.record("m.A.test_2", model.TestMethod.STATUS_PASS, 0.1)
+        self.assertEqual(checkpoint._unsynced, 0)
+        checkpoint.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
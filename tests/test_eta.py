@@ -0,0 +1,77 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from libs import model
+from libs.eta import ETAEstimator
+from libs.history import HistoryStore
+
+
+class TestPrediction(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.history = HistoryStore(os.path.join(self.directory, "history.sqlite3"))
+
+    def tearDown(self):
+        self.history.close()
+        shutil.rmtree(self.directory)
+
+    def record_run(self, results):
+        run_id = self.history.start_run()
+        for path, duration in results.items():
+            self.history.record(run_id, path, model.TestMethod.STATUS_PASS, duration)
+        self.history.finish_run(run_id)
+
+    def test_predicts_from_each_tests_own_history(self):
+        for index in range(3):
+            self.record_run({"m.C.test_slow": 2.0, "m.C.test_fast": 0.1})
+        # Runs of another test don't hide test_slow's history.
+        for index in range(10):
+            self.record_run({"m.C.test_fast": 0.1})
+        self.history.flush()
+
+        eta = ETAEstimator([["m.C.test_slow", "m.C.test_fast"]], self.history)
+        self.assertEqual(eta.predict("m.C.test_slow"), 2.0)
+        self.assertEqual(eta.predict("m.C.test_fast"), 0.1)
+        self.assertAlmostEqual(eta.estimate()[1], 2.1)
+
+    def test_fixture_durations_use_each_classes_own_runs(self):
+        for index in range(2):
+            run_id = self.history.start_run()
+            self.history.record_phase(run_id, "m.C", "setUpClass", 1.5)
+            self.history.record_phase(run_id, "m.C", "tearDownClass", 0.5)
+        for index in range(10):
+            self.record_run({"m.D.test_other": 0.1})
+        self.history.flush()
+
+        self.assertEqual(self.history.recent_fixture_durations(5), {"m.C": [2.0, 2.0]})
+
+    def test_predictions_are_calibrated(self):
+        paths = ["m.C.test_%d" % index for index in range(4)]
+        self.record_run({path: 1.0 for path in paths})
+        self.history.flush()
+
+        eta = ETAEstimator([paths], self.history)
+        self.assertEqual(eta.estimate()[1], 4.0)
+        # The tests are taking twice as long as predicted this time.
+        eta.test_end(paths[0], 2.0)
+        eta.test_end(paths[1], 2.0)
+        self.assertAlmostEqual(eta.calibration, 2.0)
+        low, expected, high = eta.estimate()
+        self.assertAlmostEqual(expected, 4.0)
+        self.assertTrue(low <= expected <= high)
+
+
+class TestUnknownTests(unittest.TestCase):
+    def test_unknown_tests_use_the_mean_so_far(self):
+        eta = ETAEstimator([["m.C.test_a", "m.C.test_b", "m.C.test_c"]])
+        self.assertIsNone(eta.estimate())
+        eta.test_end("m.C.test_a", 3.0)
+        self.assertEqual(eta.estimate()[1], 6.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
+
+
@@ -0,0 +1,85 @@
+import gc
+import unittest
+
+from libs.events import EventSource
+
+
+class Recorder(object):
+    "An object with handlers that record the events they receive."
+
+    def __init__(self):
+        self.received = []
+
+    def on_changed(self, sender, **data):
+        self.received.append((sender, data))
+
+    def on_batch(self, senders, payloads):
+        self.received.append((senders, payloads))
+
+
+class TestEventSource(unittest.TestCase):
+    def setUp(self):
+        # Handlers are registered per class; a class of its own keeps
+        # each test's handlers apart.
+        class Source(EventSource):
+            pass
+
+        self.Source = Source
+
+    def test_handlers_are_called_once_however_often_bound(self):
+        recorder = Recorder()
+        self.Source.bind("changed", recorder.on_changed)
+        self.Source.bind("changed", recorder.on_changed)
+        source = self.Source()
+        source.emit("changed", value=1)
+        self.assertEqual(recorder.received, [(source, {"value": 1})])
+
+    def test_unbind(self):
+        recorder = Recorder()
+        self.Source.bind("changed", recorder.on_changed)
+        self.Source.unbind("changed", recorder.on_changed)
+        self.Source().emit("changed")
+        self.assertEqual(recorder.received, [])
+
+    def test_bound_methods_are_held_weakly(self):
+        received = []
+
+        class Owner(Recorder):
+            def on_changed(self, sender, **data):
+                received.append(sender)
+
+        owner = Owner()
+        self.Source.bind("changed", owner.on_changed)
+        del owner
+        gc.collect()
+        self.Source().emit("changed")
+        self.assertEqual(received, [])
+        self.assertEqual(self.Source._events[self.Source]["changed"], [])
+
+    def test_batched_defers_events_until_the_block_ends(self):
+        recorder = Recorder()
+        self.Source.bind("changed", recorder.on_changed)
+        first, second = self.Source(), self.Source()
+        with EventSource.batched():
+            first.emit("changed", value=1)
+            with EventSource.batched():
+                second.emit("changed", value=2)
+            self.assertEqual(recorder.received, [])
+        self.assertEqual(
+            recorder.received, [(first, {"value": 1}), (second, {"value": 2})]
+        )
+
+    def test_batch_handlers_get_every_sender_at_once(self):
+        recorder = Recorder()
+        self.Source.bind("changed", recorder.on_batch, batch=True)
+        first, second = self.Source(), self.Source()
+        with EventSource.batched():
+            first.emit("changed", value=1)
+            second.emit("changed", value=2)
+        self.assertEqual(
+            recorder.received, [([first, second], [{"value": 1}, {"value": 2}])]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
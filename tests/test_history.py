@@ -0,0 +1,73 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+
+from libs import model
+from libs.history import HistoryStore
+from libs.regression import RegressionDetector
+
+
+class HistoryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.history = HistoryStore(os.path.join(self.directory, "history.sqlite3"))
+
+    def tearDown(self):
+        self.history.close()
+        shutil.rmtree(self.directory)
+
+    def record_runs(self, results, count=1):
+        "Record count runs, each with the given {path: duration} results."
+        for index in range(count):
+            run_id = self.history.start_run()
+            for path, duration in results.items():
+                self.history.record(
+                    run_id, path, model.TestMethod.STATUS_PASS, duration
+                )
+            self.history.finish_run(run_id)
+        self.history.flush()
+
+
+class TestRecentDurations(HistoryTestCase):
+    def test_each_test_keeps_its_own_runs(self):
+        self.record_runs({"m.C.test_a": 0.1, "m.C.test_b": 1.0}, count=5)
+        # Many runs of a single test don't push the others out of the window.
+        self.record_runs({"m.C.test_b": 2.0}, count=20)
+
+        durations = self.history.recent_durations(3)
+        self.assertEqual(durations["m.C.test_a"], [0.1, 0.1, 0.1])
+        self.assertEqual(durations["m.C.test_b"], [2.0, 2.0, 2.0])
+
+    def test_regressions_use_each_tests_history(self):
+        self.record_runs({"m.C.test_a": 0.1, "m.C.test_b": 1.0}, count=5)
+        self.record_runs({"m.C.test_b": 1.0}, count=20)
+
+        detector = RegressionDetector(self.history)
+        self.assertIsNotNone(detector.check("m.C.test_a", 1.0))
+        self.assertIsNone(detector.check("m.C.test_b", 1.0))
+
+
+class TestWriter(HistoryTestCase):
+    def test_close_after_a_failed_write(self):
+        # Hold a lock on the database, so that the writer is stuck on its
+        # first write while a failing write and the request to stop are
+        # queued behind it; they are then applied in the same batch.
+        other = sqlite3.connect(self.history.path)
+        other.execute("BEGIN EXCLUSIVE")
+        self.history.finish_run(1)
+        time.sleep(0.2)
+        self.history._write("INSERT INTO missing (id) VALUES (?)", (1,))
+        self.history._writes.put(None)
+        time.sleep(0.2)
+        other.rollback()
+        other.close()
+
+        # This is what close() waits for.
+        self.history._writer.join(10)
+        self.assertFalse(self.history._writer.is_alive(), "The writer didn't stop")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from libs import junit, model
+
+
+class TestJUnitXML(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "results.xml")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, results):
+        "Write (path, status, duration, output, error) results to the file."
+        writer = junit.JUnitXMLWriter(self.filename)
+        for result in results:
+            writer.add(*result)
+        writer.close()
+
+    def read(self):
+        project = model.UnittestProject()
+        junit.read_project(project, self.filename)
+        return project
+
+    def test_round_trip(self):
+        TestMethod = model.TestMethod
+        error = "Traceback\nAssertionError: 1 != 2"
+        self.write(
+            [
+                ("m.C.test_pass", TestMethod.STATUS_PASS, 0.5, "some output", None),
+                ("m.C.test_fail", TestMethod.STATUS_FAIL, 0.25, None, error),
+                ("m.D.test_skip", TestMethod.STATUS_SKIP, 0.0, None, "Skipped: why"),
+            ]
+        )
+        project = self.read()
+
+        passed = project.get_node("m.C.test_pass")
+        self.assertEqual(passed.status, TestMethod.STATUS_PASS)
+        self.assertEqual(passed.duration, 0.5)
+        self.assertEqual(passed.output, "some output")
+
+        failed = project.get_node("m.C.test_fail")
+        self.assertEqual(failed.status, TestMethod.STATUS_FAIL)
+        self.assertEqual(failed.error, error)
+
+        skipped = project.get_node("m.D.test_skip")
+        self.assertEqual(skipped.status, TestMethod.STATUS_SKIP)
+        self.assertEqual(skipped.error, "Skipped: why")
+
+    def test_classname_without_a_class(self):
+        with open(self.filename, "w") as f:
+            f.write(
+                '<testsuite><testcase classname="test_foo" name="test_bar" time="1"/>'
+                "</testsuite>"
+            )
+        project = self.read()
+
+        path = "test_foo.%s.test_bar" % junit.MODULE_CASE
+        testMethod = project.get_node(path)
+        self.assertEqual(testMethod.status, model.TestMethod.STATUS_PASS)
+        self.assertIsInstance(project["test_foo"], model.TestModule)
+
+        # Written back out, the test keeps its original classname.
+        self.write([(path, testMethod.status, testMethod.duration, None, None)])
+        self.assertIsNotNone(self.read().get_node(path))
+        with open(self.filename) as f:
+            self.assertIn('classname="test_foo"', f.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
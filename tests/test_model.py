@@ -0,0 +1,206 @@
+import unittest
+
+from libs import model
+
+PATHS = [
+    "pkg.mod.A.test_1",
+    "pkg.mod.A.test_2",
+    "pkg.mod.B.test_1",
+    "pkg.other.C.test_1",
+    "top.D.test_1",
+]
+
+# The modules and test cases holding the tests.
+PARENT_PATHS = [
+    "pkg",
+    "pkg.mod",
+    "pkg.mod.A",
+    "pkg.mod.B",
+    "pkg.other",
+    "pkg.other.C",
+    "top",
+    "top.D",
+]
+
+
+class ModelTestCase(unittest.TestCase):
+    def setUp(self):
+        self.project = model.UnittestProject()
+        self.project.refresh(PATHS)
+
+
+class TestIndex(ModelTestCase):
+    def test_every_node_is_indexed(self):
+        self.assertEqual(
+            sorted(self.project.node_paths()), sorted(PATHS + PARENT_PATHS)
+        )
+        for path in self.project.node_paths():
+            node = self.project.get_node(path)
+            self.assertEqual(node.path, path)
+            self.assertTrue(self.project.has_node(path))
+            self.assertIs(self.project.find_node(path), node)
+
+    def test_unknown_paths(self):
+        self.assertFalse(self.project.has_node("pkg.mod.A.test_3"))
+        self.assertIsNone(self.project.find_node("pkg.mod.A.test_3"))
+        with self.assertRaises(KeyError):
+            self.project.get_node("pkg.mod.A.test_3")
+        self.assertEqual(
+            self.project.get_nodes(["pkg.mod.A.test_3", "top.D"]),
+            [self.project.get_node("top.D")],
+        )
+
+    def test_added_nodes_are_indexed(self):
+        testMethod = self.project.confirm_exists("pkg.new.E.test_1")
+        self.assertIs(self.project.get_node("pkg.new.E.test_1"), testMethod)
+        self.assertIs(self.project.get_node("pkg.new.E"), testMethod.parent)
+        self.assertIs(self.project.get_node("pkg.new"), testMethod.parent.parent)
+        self.assertIs(self.project.confirm_exists("pkg.new.E.test_1"), testMethod)
+
+    def test_removed_nodes_are_unindexed(self):
+        self.project.refresh(PATHS[:2] + PATHS[3:4])
+        for path in ("pkg.mod.B.test_1", "pkg.mod.B", "top.D.test_1", "top.D", "top"):
+            self.assertFalse(self.project.has_node(path), path)
+        for path in PATHS[:2] + ["pkg.mod", "pkg.mod.A", "pkg.other.C.test_1"]:
+            self.assertTrue(self.project.has_node(path), path)
+        self.assertEqual(self.project.test_paths(), PATHS[:2] + PATHS[3:4])
+
+    def test_test_paths(self):
+        self.assertEqual(self.project.test_paths(), PATHS)
+        self.assertEqual(
+            self.project.test_paths(["pkg.mod", "top.D.test_1"]),
+            PATHS[:3] + ["top.D.test_1"],
+        )
+
+
+class TestCounters(ModelTestCase):
+    def assertCounts(self, path, tests, active, statuses=None):
+        "Check the test, active and status counts of a node."
+        node = self.project.get_node(path) if path else self.project
+        self.assertEqual((node.test_count, node.active_count), (tests, active), path)
+        self.assertEqual(
+            {status: count for status, count in node.status_count.items() if count},
+            statuses or {},
+            path,
+        )
+
+    def test_counts_after_discovery(self):
+        self.assertCounts("", 5, 5)
+        self.assertCounts("pkg", 4, 4)
+        self.assertCounts("pkg.mod", 3, 3)
+        self.assertCounts("pkg.mod.A", 2, 2)
+        self.assertCounts("top.D", 1, 1)
+
+    def test_deactivating_a_test(self):
+        testMethod = self.project.get_node("pkg.mod.A.test_1")
+        testMethod.set_active(False)
+        self.assertCounts("", 5, 4)
+        self.assertCounts("pkg.mod", 3, 2)
+        self.assertCounts("pkg.mod.A", 2, 1)
+        self.assertTrue(self.project.get_node("pkg.mod.A").active)
+
+        # A test case is inactive once none of its tests are active.
+        self.project.get_node("pkg.mod.A.test_2").set_active(False)
+        self.assertCounts("pkg.mod.A", 2, 0)
+        self.assertFalse(self.project.get_node("pkg.mod.A").active)
+        self.assertTrue(self.project.get_node("pkg.mod").active)
+
+        testMethod.set_active(True)
+        self.assertCounts("", 5, 4)
+        self.assertCounts("pkg.mod.A", 2, 1)
+        self.assertTrue(self.project.get_node("pkg.mod.A").active)
+
+    def test_deactivating_a_module(self):
+        self.project.get_node("pkg").set_active(False)
+        self.assertCounts("", 5, 1)
+        self.assertCounts("pkg", 4, 0)
+        self.assertCounts("pkg.other.C", 1, 0)
+        self.assertFalse(self.project.get_node("pkg.other.C.test_1").active)
+
+        self.project.get_node("pkg.mod.B").set_active(True)
+        self.assertCounts("", 5, 2)
+        self.assertCounts("pkg", 4, 1)
+        self.assertTrue(self.project.get_node("pkg").active)
+
+    def test_status_changes(self):
+        PASS = model.TestMethod.STATUS_PASS
+        FAIL = model.TestMethod.STATUS_FAIL
+        first = self.project.get_node("pkg.mod.A.test_1")
+        second = self.project.get_node("pkg.mod.A.test_2")
+        first.set_result(PASS, "", None, 0.1)
+        second.set_result(FAIL, "", "Boom", 0.1)
+        self.assertCounts("", 5, 5, {PASS: 1, FAIL: 1})
+        self.assertCounts("pkg.mod.A", 2, 2, {PASS: 1, FAIL: 1})
+        self.assertCounts("pkg.other", 1, 1)
+        self.assertEqual(self.project.get_node("pkg.mod").badge, "1 failed / 3")
+
+        # A new result moves the test from one count to another.
+        second.set_result(PASS, "", None, 0.1)
+        self.assertCounts("pkg", 4, 4, {PASS: 2})
+        self.assertEqual(self.project.get_node("pkg.mod").badge, "2 passed / 3")
+
+        # A removed test no longer counts.
+        self.project.refresh(PATHS[1:])
+        self.assertCounts("", 4, 4, {PASS: 1})
+        self.assertCounts("pkg.mod.A", 1, 1, {PASS: 1})
+
+class TestRefresh(ModelTestCase):
+    def test_diff(self):
+        first = self.project.refresh(PATHS)
+        self.assertEqual(first, model.RefreshDiff([], [], PATHS))
+
+        new_paths = PATHS[1:] + ["pkg.mod.B.test_2", "new.E.test_1"]
+        diff = self.project.refresh(new_paths + ["new.E.test_1"])
+        self.assertEqual(diff.added, ["pkg.mod.B.test_2", "new.E.test_1"])
+        self.assertEqual(diff.removed, ["pkg.mod.A.test_1"])
+        self.assertEqual(diff.kept, PATHS[1:])
+        self.assertEqual(sorted(self.project.test_paths()), sorted(new_paths))
+
+    def test_vanished_nodes_are_removed(self):
+        removed = []
+
+        def on_removed(node):
+            removed.append(node.path)
+
+        for cls in (model.TestMethod, model.TestCase, model.TestModule):
+            cls.bind("removed", on_removed)
+            self.addCleanup(cls.unbind, "removed", on_removed)
+
+        self.project.refresh(["pkg.mod.A.test_2", "pkg.mod.B.test_1"])
+
+        # Test cases and modules left empty go too.
+        self.assertEqual(
+            sorted(removed),
+            sorted(
+                [
+                    "pkg.mod.A.test_1",
+                    "pkg.other.C.test_1",
+                    "pkg.other.C",
+                    "pkg.other",
+                    "top.D.test_1",
+                    "top.D",
+                    "top",
+                ]
+            ),
+        )
+        self.assertEqual(list(self.project), ["pkg"])
+        self.assertEqual(list(self.project.get_node("pkg")), ["mod"])
+        self.assertEqual(self.project.test_count, 2)
+
+    def test_kept_tests_keep_their_results_and_active_state(self):
+        testMethod = self.project.get_node("pkg.mod.A.test_1")
+        testMethod.set_result(model.TestMethod.STATUS_FAIL, "output", "Boom", 0.5)
+        testMethod.set_active(False)
+        self.project.get_node("top.D.test_1").set_active(False)
+
+        self.project.refresh(PATHS[:3])
+        self.assertIs(self.project.get_node("pkg.mod.A.test_1"), testMethod)
+        self.assertEqual(testMethod.status, model.TestMethod.STATUS_FAIL)
+        self.assertEqual(testMethod.error, "Boom")
+        self.assertFalse(testMethod.active)
+        self.assertEqual(self.project.active_count, 2)
+        self.assertEqual(self.project.generation, testMethod.generation)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from libs import model
+from libs.history import HistoryStore
+from libs.ordering import ORDER_DISCOVERY, FailedFirstOrdering, order_tests
+
+PATHS = [
+    "a.A.test_1",
+    "a.A.test_2",
+    "a.B.test_1",
+    "b.A.test_1",
+    "b.A.test_2",
+    "c.A.test_1",
+]
+
+
+class TestFailedFirstOrdering(unittest.TestCase):
+    def setUp(self):
+        self.testdir = tempfile.mkdtemp()
+        self.history = HistoryStore(os.path.join(self.testdir, "history.sqlite3"))
+        self.project = model.UnittestProject()
+        for path in PATHS:
+            self.project.confirm_exists(path)
+
+    def tearDown(self):
+        self.history.close()
+        shutil.rmtree(self.testdir)
+
+    def record_run(self, failed=()):
+        run_id = self.history.start_run(self.testdir)
+        for path in PATHS:
+            status = (
+                model.TestMethod.STATUS_FAIL
+                if path in failed
+                else model.TestMethod.STATUS_PASS
+            )
+            self.history.record(run_id, path, status, 0.1)
+        self.history.finish_run(run_id)
+        self.history.flush()
+
+    def order(self):
+        return FailedFirstOrdering(self.project, self.testdir, self.history).order(
+            PATHS
+        )
+
+    def test_discovery_order_without_history(self):
+        self.assertEqual(
+            FailedFirstOrdering(self.project, self.testdir).order(PATHS), PATHS
+        )
+        self.assertEqual(
+            order_tests(PATHS, ORDER_DISCOVERY, self.project, self.testdir), PATHS
+        )
+
+    def test_failed_tests_run_first_with_their_class_and_module(self):
+        self.project.get_node("b.A.test_2").set_result(
+            model.TestMethod.STATUS_FAIL, None, "AssertionError", 0.1
+        )
+        # The failing test's class and module move ahead, and the failing
+        # test leads its class; everything else keeps its order.
+        self.assertEqual(
+            self.order(),
+            [
+                "b.A.test_2",
+                "b.A.test_1",
+                "a.A.test_1",
+                "a.A.test_2",
+                "a.B.test_1",
+                "c.A.test_1",
+            ],
+        )
+
+    def test_failures_in_the_last_recorded_run_count(self):
+        self.record_run(failed={"c.A.test_1"})
+        self.assertEqual(self.order()[0], "c.A.test_1")
+
+    def test_modified_modules_come_next(self):
+        self.record_run()
+        filename = os.path.join(self.testdir, "c.py")
+        with open(filename, "w") as f:
+            f.write("")
+        modified = time.time() + 10
+        os.utime(filename, (modified, modified))
+        self.assertEqual(self.order()[0], "c.A.test_1")
+
+    def test_tests_that_often_fail_come_after_that(self):
+        for index in range(3):
+            self.record_run(failed={"b.A.test_1"} if index == 0 else ())
+        self.assertEqual(self.order()[:2], ["b.A.test_1", "b.A.test_2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+import json
+import time
+import unittest
+from io import StringIO
+
+from libs.pipes import PipedTestRunner
+
+
+def make_inherited_fixtures():
+    "Return test classes that inherit class fixtures, or call them through super()."
+
+    class Base(unittest.TestCase):
+        @classmethod
+        def setUpClass(cls):
+            cls.owner = cls.__name__
+
+        def test_owner(self):
+            self.assertEqual(self.owner, type(self).__name__)
+
+    class Sub(Base):
+        @classmethod
+        def setUpClass(cls):
+            super().setUpClass()
+            cls.extended = True
+
+        def test_extended(self):
+            self.assertTrue(self.extended)
+
+    class Inherits(Base):
+        pass
+
+    return Base, Sub, Inherits
+
+
+class TestTimeFixtures(unittest.TestCase):
+    def run_classes(self, *classes):
+        "Run the tests of some classes through the piped runner; return result, output."
+        loader = unittest.TestLoader()
+        suite = unittest.TestSuite(loader.loadTestsFromTestCase(cls) for cls in classes)
+        stream = StringIO()
+        result = PipedTestRunner(stream=stream).run(suite)
+        return result, stream.getvalue()
+
+    def test_inherited_fixtures_get_their_own_class(self):
+        classes = make_inherited_fixtures()
+        result, output = self.run_classes(*classes)
+        self.assertEqual(result.testsRun, 4)
+        self.assertEqual(result.failures + result.errors, [])
+
+        fixtures = [
+            json.loads(line)["fixture"]
+            for line in output.splitlines()
+            if line.startswith('{"fixture"')
+        ]
+        # Each class's setUpClass is timed once, under its own path,
+        # including the call Sub makes through super().
+        self.assertEqual(
+            sorted(fixture["path"].rpartition(".")[2] for fixture in fixtures),
+            ["Base", "Inherits", "Sub"],
+        )
+
+    def test_fixtures_are_restored(self):
+        classes = make_inherited_fixtures()
+        originals = [vars(cls).get("setUpClass") for cls in classes]
+        self.run_classes(*classes)
+        self.assertEqual([vars(cls).get("setUpClass") for cls in classes], originals)
+        classes[1].setUpClass()
+        self.assertEqual(classes[1].owner, "Sub")
+
+
+class TestWatchdog(unittest.TestCase):
+    def test_fixture_errors_are_not_timed(self):
+        class Broken(unittest.TestCase):
+            @classmethod
+            def setUpClass(cls):
+                raise RuntimeError("setUpClass failed")
+
+            def test_never_runs(self):
+                pass
+
+        class Slow(unittest.TestCase):
+            @classmethod
+            def setUpClass(cls):
+                # Longer than the timeout, but fixtures aren't timed.
+                time.sleep(1.5)
+
+            def test_passes(self):
+                pass
+
+        loader = unittest.TestLoader()
+        suite = unittest.TestSuite(
+            loader.loadTestsFromTestCase(cls) for cls in (Broken, Slow)
+        )
+        result = PipedTestRunner(stream=StringIO(), timeout=1).run(suite)
+
+        # Only the setUpClass of Broken fails; Slow isn't blamed for a
+        # timeout started by the error reported for Broken.
+        self.assertEqual(len(result.errors), 1)
+        self.assertIn("Broken", str(result.errors[0][0]))
+        self.assertEqual(result.testsRun, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+import gc
+import unittest
+
+from libs import model
+from libs.results import ResultStore, StoredText, failure_signature
+
+
+def traceback(function, message, address="0x7f3a2c1d"):
+    "Return a formatted traceback of an AssertionError raised in a function."
+    return (
+        "Traceback (most recent call last):\n"
+        '  File "/src/tests/test_app.py", line 12, in %s\n'
+        "    self.check(%s)\n"
+        "AssertionError: %s\n" % (function, address, message)
+    )
+
+
+class TestInterning(unittest.TestCase):
+    def setUp(self):
+        self.store = ResultStore()
+
+    def test_short_bodies_are_interned(self):
+        first = self.store.intern("".join(["short ", "output"]))
+        second = self.store.intern("short " + "output")
+        self.assertIs(first, second)
+        self.assertEqual(first, "short output")
+        self.assertEqual(self.store.body_count, 0)
+
+    def test_long_bodies_are_stored_once(self):
+        text = "A line of output.\n" * 1000
+        first = self.store.intern(text)
+        second = self.store.intern("".join(["A line of output.\n"] * 1000))
+        self.assertIsInstance(first, StoredText)
+        self.assertIs(first, second)
+        self.assertEqual(self.store.body_count, 1)
+        self.assertEqual(first.read(), text)
+        self.assertIn("compressed", repr(first))
+
+        # A body is only kept while something refers to it.
+        del first, second
+        gc.collect()
+        self.assertEqual(self.store.body_count, 0)
+
+    def test_incompressible_bodies(self):
+        # Text that doesn't shrink when compressed is kept as it is.
+        stored = StoredText("abc")
+        self.assertEqual(repr(stored), "<StoredText 3 bytes>")
+        self.assertEqual(stored.read(), "abc")
+
+    def test_other_values_are_unchanged(self):
+        value = object()
+        self.assertIs(self.store.intern(value), value)
+        self.assertIsNone(self.store.intern(None))
+
+    def test_results_in_the_model(self):
+        project = model.UnittestProject()
+        project.refresh(["m.A.test_1", "m.A.test_2"])
+        error = traceback("test_1", "x" * 2000)
+        for path in ("m.A.test_1", "m.A.test_2"):
+            project.get_node(path).set_result(
+                model.TestMethod.STATUS_FAIL, "", error, 0.1
+            )
+        self.assertEqual(project.results.body_count, 1)
+        self.assertEqual(project.get_node("m.A.test_2").error, error)
+
+
+class TestFailureGroups(unittest.TestCase):
+    def setUp(self):
+        self.store = ResultStore()
+
+    def test_signatures_ignore_numbers_and_addresses(self):
+        self.assertEqual(
+            failure_signature(traceback("test_1", "3 != 4")),
+            failure_signature(traceback("test_1", "17 != 4", "0x55d0e4a0")),
+        )
+        self.assertEqual(
+            failure_signature(traceback("test_1", "3 != 4")),
+            "AssertionError: N != N (test_app.py, in test_1)",
+        )
+        # The same error raised somewhere else is another failure.
+        self.assertNotEqual(
+            failure_signature(traceback("test_1", "3 != 4")),
+            failure_signature(traceback("test_2", "3 != 4")),
+        )
+        self.assertIsNone(failure_signature(None))
+
+    def test_identical_failures_are_grouped(self):
+        self.store.set_failure("m.A.test_1", traceback("check", "1 != 2"))
+        self.store.set_failure("m.A.test_2", traceback("check", "5 != 2"))
+        self.store.set_failure("m.B.test_1", traceback("check", "9 != 2"))
+        self.store.set_failure("m.B.test_2", traceback("other", "1 != 2"))
+        self.store.set_failure("m.C.test_1", traceback("another", "1 != 2"))
+        self.store.set_failure("m.C.test_2", traceback("another", "1 != 2"))
+
+        signature = self.store.signature("m.A.test_1")
+        self.assertEqual(
+            self.store.group(signature), ["m.A.test_1", "m.A.test_2", "m.B.test_1"]
+        )
+        # The largest groups come first; a failure of its own isn't a group.
+        self.assertEqual(
+            self.store.failure_groups(),
+            [
+                (signature, ["m.A.test_1", "m.A.test_2", "m.B.test_1"]),
+                (self.store.signature("m.C.test_1"), ["m.C.test_1", "m.C.test_2"]),
+            ],
+        )
+
+    def test_fixed_failures_leave_their_group(self):
+        self.store.set_failure("m.A.test_1", traceback("check", "1 != 2"))
+        self.store.set_failure("m.A.test_2", traceback("check", "1 != 2"))
+        signature = self.store.signature("m.A.test_1")
+
+        self.store.set_failure("m.A.test_1", None)
+        self.assertIsNone(self.store.signature("m.A.test_1"))
+        self.assertEqual(self.store.group(signature), ["m.A.test_2"])
+
+        self.store.discard("m.A.test_2")
+        self.assertEqual(self.store.group(signature), [])
+        self.assertEqual(self.store.failure_groups(min_size=1), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,492 @@
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import textwrap
+import time
+import unittest
+from unittest import mock
+
+from libs import model
+from libs.runner import Runner, signal_group
+
+# The directory holding the libs package, which the worker subprocesses import.
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class RunnerTestCase(unittest.TestCase):
+    "Run small generated test modules through a real Runner and its workers."
+
+    def setUp(self):
+        self.testdir = tempfile.mkdtemp()
+        self.pythonpath = os.environ.get("PYTHONPATH")
+        os.environ["PYTHONPATH"] = os.pathsep.join(
+            path for path in (PACKAGE_DIR, self.pythonpath) if path
+        )
+        self.events = []
+        for event in ("test_end", "suite_end", "suite_error"):
+            Runner.bind(event, self.on_event)
+
+    def tearDown(self):
+        for event in ("test_end", "suite_end", "suite_error"):
+            Runner.unbind(event, self.on_event)
+        if self.pythonpath is None:
+            del os.environ["PYTHONPATH"]
+        else:
+            os.environ["PYTHONPATH"] = self.pythonpath
+        shutil.rmtree(self.testdir)
+
+    def on_event(self, runner, **data):
+        self.events.append(data)
+
+    def reported_paths(self):
+        "Return the paths of the tests the runner reported, in order."
+        return [event["test_path"] for event in self.events if "test_path" in event]
+
+    def write_module(self, name, source):
+        with open(os.path.join(self.testdir, name + ".py"), "w") as f:
+            f.write(textwrap.dedent(source))
+
+    def marker(self, name):
+        "Return the path of a file the generated tests can leave behind."
+        return os.path.join(self.testdir, name)
+
+    def start_tests(self, **options):
+        "Start running every test in the test directory; return project and runner."
+        project = model.UnittestProject()
+        project.refresh(*project.discover(self.testdir))
+        count, labels = project.find_tests(True)
+        return project, Runner(project, count, labels, self.testdir, **options)
+
+    def poll_until(self, runner, condition, seconds=60):
+        "Poll a runner until a condition holds, or the run ends."
+        deadline = time.time() + seconds
+        while not condition() and runner.poll():
+            self.assertLess(time.time(), deadline, "The run didn't finish")
+            time.sleep(0.02)
+
+    def run_tests(self, seconds=60, **options):
+        """Run every test in the test directory; return the project and the runner.
+
+        The run must finish within the given number of seconds.
+        """
+        project, runner = self.start_tests(**options)
+        self.poll_until(runner, lambda: False, seconds)
+        return project, runner
+
+
+class TestSubtests(RunnerTestCase):
+    def test_subtests_are_aggregated(self):
+        self.write_module(
+            "test_steps",
+            """
+            import unittest
+
+            class Steps(unittest.TestCase):
+                def test_passes(self):
+                    for step in range(3):
+                        with self.subTest(step=step):
+                            pass
+
+                def test_fails(self):
+                    for step in range(4):
+                        with self.subTest(step=step):
+                            self.assertNotEqual(step, 2, "step 2 failed")
+            """,
+        )
+        project, runner = self.run_tests()
+        self.assertEqual(runner.completed_count, 2)
+
+        passes = project.get_node("test_steps.Steps.test_passes")
+        self.assertEqual(passes.status, model.TestMethod.STATUS_PASS)
+        self.assertEqual(len(passes.subtests), 3)
+        self.assertEqual(passes.subtests.failed(), [])
+
+        # Every subtest runs; the test takes the status of the worst.
+        fails = project.get_node("test_steps.Steps.test_fails")
+        self.assertEqual(fails.status, model.TestMethod.STATUS_FAIL)
+        self.assertEqual(len(fails.subtests), 4)
+        self.assertEqual(fails.subtests.failed(), [2])
+        name, status, duration, error = fails.subtests[2]
+        self.assertEqual(name, "(step=2)")
+        self.assertIn("step 2 failed", error)
+        self.assertIn("step 2 failed", fails.error)
+
+
+class TestWorkerExit(RunnerTestCase):
+    def test_worker_exits_after_a_subtest(self):
+        self.write_module(
+            "test_crash",
+            """
+            import os
+            import unittest
+
+            class Crash(unittest.TestCase):
+                def test_crash(self):
+                    with self.subTest(step=1):
+                        pass
+                    with self.subTest(step=2):
+                        self.fail("step 2 failed")
+                    os._exit(3)
+            """,
+        )
+        project, runner = self.run_tests()
+
+        # The test is reported, with the subtests it got through.
+        testMethod = project.get_node("test_crash.Crash.test_crash")
+        self.assertEqual(testMethod.status, model.TestMethod.STATUS_ERROR)
+        self.assertIn("exited with code 3", testMethod.error)
+        self.assertIn("step 2 failed", testMethod.error)
+        self.assertEqual(len(testMethod.subtests), 2)
+        self.assertEqual(runner.completed_count, 1)
+        self.assertIn("test_crash.Crash.test_crash", self.reported_paths())
+
+    def test_worker_exits_without_a_subtest(self):
+        self.write_module(
+            "test_crash",
+            """
+            import os
+            import unittest
+
+            class Crash(unittest.TestCase):
+                def test_crash(self):
+                    os._exit(4)
+            """,
+        )
+        project, runner = self.run_tests()
+
+        testMethod = project.get_node("test_crash.Crash.test_crash")
+        self.assertEqual(testMethod.status, model.TestMethod.STATUS_ERROR)
+        self.assertIn("exited with code 4", testMethod.error)
+
+
+class TestSignalGroup(unittest.TestCase):
+    def start(self):
+        return subprocess.Popen(
+            [sys.executable, "-c", "import time; time.sleep(30)"],
+            start_new_session=hasattr(os, "killpg"),
+        )
+
+    def test_running_process_is_signalled(self):
+        proc = self.start()
+        signal_group(proc, signal.SIGTERM)
+        self.assertNotEqual(proc.wait(10), 0)
+
+    def test_reaped_process_is_not_signalled(self):
+        proc = self.start()
+        proc.kill()
+        proc.wait()
+        # Its pid could belong to another process by now.
+        with mock.patch("os.killpg") as killpg, mock.patch.object(
+            proc, "send_signal"
+        ) as send_signal:
+            signal_group(proc, signal.SIGTERM)
+        killpg.assert_not_called()
+        send_signal.assert_not_called()
+
+
+class TestMaxFailures(RunnerTestCase):
+    def test_run_stops_at_the_failure_limit(self):
+        self.write_module(
+            "test_failing",
+            """
+            import unittest
+
+            class Failing(unittest.TestCase):
+                pass
+
+            for number in range(5):
+                setattr(Failing, "test_%d" % number, lambda self: self.fail())
+            """,
+        )
+        project, runner = self.run_tests(max_failures=2)
+
+        self.assertTrue(runner.stopped_early)
+        self.assertEqual(runner.any_failed, 2)
+        self.assertEqual(runner.completed_count, 2)
+
+    def test_other_workers_stop_at_the_failure_limit(self):
+        self.write_module(
+            "test_failing",
+            """
+            import unittest
+
+            class Failing(unittest.TestCase):
+                def test_1(self):
+                    self.fail()
+
+                def test_2(self):
+                    self.fail()
+            """,
+        )
+        self.write_module(
+            "test_slow",
+            """
+            import time
+            import unittest
+
+            class Slow(unittest.TestCase):
+                pass
+
+            for number in range(20):
+                setattr(Slow, "test_%d" % number, lambda self: time.sleep(0.5))
+            """,
+        )
+        start = time.time()
+        project, runner = self.run_tests(max_failures=2, workers=2)
+
+        # The worker running the slow tests is stopped gracefully, once
+        # the other has reached the limit, well before it could finish.
+        self.assertTrue(runner.stopped_early)
+        self.assertEqual(runner.any_failed, 2)
+        self.assertLess(runner.completed_count, 22)
+        self.assertLess(time.time() - start, 8)
+        statuses = {
+            path: project.get_node(path).status for path in project.test_paths(None)
+        }
+        self.assertNotIn(model.TestMethod.STATUS_ERROR, statuses.values())
+
+
+class TestRetries(RunnerTestCase):
+    def test_failed_tests_are_retried(self):
+        self.write_module(
+            "test_retried",
+            """
+            import os
+            import unittest
+
+            MARKER = os.path.join(os.path.dirname(__file__), "failed-once")
+
+            class Retried(unittest.TestCase):
+                def test_fails_once(self):
+                    if not os.path.exists(MARKER):
+                        open(MARKER, "w").close()
+                        self.fail("first attempt")
+
+                def test_always_fails(self):
+                    self.fail("every attempt")
+
+                def test_passes(self):
+                    pass
+            """,
+        )
+        project, runner = self.run_tests(retries=2)
+
+        flaky = project.get_node("test_retried.Retried.test_fails_once")
+        self.assertEqual(flaky.status, model.TestMethod.STATUS_FLAKY)
+        self.assertIn("first attempt", flaky.error)
+        failed = project.get_node("test_retried.Retried.test_always_fails")
+        self.assertEqual(failed.status, model.TestMethod.STATUS_FAIL)
+        self.assertIn("Failed all 3 attempts", failed.error)
+        passed = project.get_node("test_retried.Retried.test_passes")
+        self.assertEqual(passed.status, model.TestMethod.STATUS_PASS)
+
+        # Only the final attempt of each test is reported.
+        self.assertEqual(
+            sorted(self.reported_paths()),
+            [
+                "test_retried.Retried.test_always_fails",
+                "test_retried.Retried.test_fails_once",
+                "test_retried.Retried.test_passes",
+            ],
+        )
+
+
+class TestStress(RunnerTestCase):
+    def test_every_repetition_is_run(self):
+        self.write_module(
+            "test_repeated",
+            """
+            import os
+            import unittest
+
+            COUNTER = os.path.join(os.path.dirname(__file__), "runs")
+
+            class Repeated(unittest.TestCase):
+                def test_every_other_run_fails(self):
+                    with open(COUNTER, "a+") as f:
+                        f.write("x")
+                        runs = f.tell()
+                    self.assertEqual(runs % 2, 1)
+
+                def test_passes(self):
+                    pass
+            """,
+        )
+        project, runner = self.run_tests(repeat=3, workers=2)
+
+        # The repetitions are shared between the workers; each is reported.
+        paths = self.reported_paths()
+        self.assertEqual(len(paths), 6)
+        self.assertEqual(runner.completed_count, runner.total_count)
+        for name, status, failed in (
+            ("test_every_other_run_fails", model.TestMethod.STATUS_FLAKY, 1),
+            ("test_passes", model.TestMethod.STATUS_PASS, 0),
+        ):
+            path = "test_repeated.Repeated." + name
+            self.assertEqual(paths.count(path), 3)
+            self.assertEqual(runner.repeats[path].runs, 3)
+            self.assertEqual(runner.repeats[path].failed, failed)
+            self.assertEqual(project.get_node(path).status, status)
+
+    def test_repetitions_left_after_a_timeout_are_run(self):
+        self.write_module(
+            "test_hangs",
+            """
+            import os
+            import time
+            import unittest
+
+            MARKER = os.path.join(os.path.dirname(__file__), "hung")
+
+            class Hangs(unittest.TestCase):
+                def test_hangs_once(self):
+                    if os.path.exists(MARKER):
+                        return
+                    open(MARKER, "w").close()
+                    # Swallow the timeout, so the worker has to give up.
+                    deadline = time.time() + 30
+                    while time.time() < deadline:
+                        try:
+                            time.sleep(0.1)
+                        except BaseException:
+                            pass
+
+                def test_passes(self):
+                    pass
+            """,
+        )
+        project, runner = self.run_tests(repeat=3, timeout=1)
+
+        # The worker that gave up is replaced by workers running exactly
+        # the repetitions it had left, duplicates and all.
+        paths = self.reported_paths()
+        self.assertEqual(runner.completed_count, 6)
+        for name in ("test_hangs_once", "test_passes"):
+            path = "test_hangs.Hangs." + name
+            self.assertEqual(paths.count(path), 3)
+            self.assertEqual(runner.repeats[path].runs, 3)
+        hung = project.get_node("test_hangs.Hangs.test_hangs_once")
+        self.assertEqual(runner.repeats[hung.path].failed, 1)
+        self.assertEqual(hung.status, model.TestMethod.STATUS_FLAKY)
+        self.assertIn("timed out", hung.error)
+
+
+def is_alive(pid):
+    "Return True if a process is running (and not just waiting to be reaped)."
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    try:
+        with open("/proc/%d/stat" % pid) as f:
+            return f.read().rpartition(")")[2].split()[0] != "Z"
+    except OSError:
+        return True
+
+
+@unittest.skipUnless(hasattr(os, "killpg"), "Workers lead process groups on POSIX")
+class TestStop(RunnerTestCase):
+    # A test that starts a process of its own, then sleeps; its pid is
+    # written out once it has started.
+    SOURCE = """
+        import os
+        import signal
+        import subprocess
+        import sys
+        import time
+        import unittest
+
+        HERE = os.path.dirname(__file__)
+
+        class Sleeps(unittest.TestCase):
+            def test_1_passes(self):
+                pass
+
+            def test_2_sleeps(self):
+                print("before the stop")
+                if IGNORE_SIGNALS:
+                    signal.signal(signal.SIGINT, signal.SIG_IGN)
+                    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+                child = subprocess.Popen(
+                    [sys.executable, "-c", "import time; time.sleep(60)"]
+                )
+                with open(os.path.join(HERE, "child.tmp"), "w") as f:
+                    f.write(str(child.pid))
+                os.rename(
+                    os.path.join(HERE, "child.tmp"), os.path.join(HERE, "child")
+                )
+                time.sleep(60)
+
+            def test_3_never_runs(self):
+                pass
+        """
+
+    def start_sleeping(self, ignore_signals=False):
+        "Start the run, and wait for the sleeping test; return project, runner, pid."
+        self.write_module(
+            "test_sleeps",
+            "IGNORE_SIGNALS = %r\n" % ignore_signals + textwrap.dedent(self.SOURCE),
+        )
+        project, runner = self.start_tests()
+        child = self.marker("child")
+        self.poll_until(runner, lambda: os.path.exists(child))
+        with open(child) as f:
+            pid = int(f.read())
+        self.addCleanup(self.kill, pid)
+        return project, runner, pid
+
+    def kill(self, pid):
+        if is_alive(pid):
+            os.kill(pid, signal.SIGKILL)
+
+    def assertStops(self, pid):
+        deadline = time.time() + 10
+        while is_alive(pid):
+            self.assertLess(time.time(), deadline, "The process is still running")
+            time.sleep(0.05)
+
+    def test_stop_reports_the_running_test(self):
+        project, runner, pid = self.start_sleeping()
+        start = time.time()
+        runner.stop()
+        self.poll_until(runner, lambda: False, 10)
+        self.assertLess(time.time() - start, runner.INTERRUPT_TIMEOUT)
+
+        self.assertTrue(runner.interrupted)
+        self.assertEqual(runner.completed_count, 2)
+        passed = project.get_node("test_sleeps.Sleeps.test_1_passes")
+        self.assertEqual(passed.status, model.TestMethod.STATUS_PASS)
+        sleeps = project.get_node("test_sleeps.Sleeps.test_2_sleeps")
+        self.assertEqual(sleeps.status, model.TestMethod.STATUS_INTERRUPTED)
+        self.assertIn("before the stop", sleeps.output)
+        never = project.get_node("test_sleeps.Sleeps.test_3_never_runs")
+        self.assertIsNone(never.status)
+
+        # The process the test started was interrupted along with it.
+        self.assertStops(pid)
+        self.assertFalse(any(worker.is_running for worker in runner.workers))
+
+    def test_stop_kills_workers_that_ignore_it(self):
+        project, runner, pid = self.start_sleeping(ignore_signals=True)
+        runner.INTERRUPT_TIMEOUT = 0.5
+        runner.TERMINATE_TIMEOUT = 0.5
+        start = time.time()
+        runner.stop()
+        self.poll_until(runner, lambda: False, 10)
+        self.assertLess(time.time() - start, 5)
+
+        sleeps = project.get_node("test_sleeps.Sleeps.test_2_sleeps")
+        self.assertEqual(sleeps.status, model.TestMethod.STATUS_INTERRUPTED)
+        self.assertEqual(runner._stop_stage, 2)
+
+        # The worker's whole process group was killed, and the worker reaped.
+        self.assertStops(pid)
+        for worker in runner.workers:
+            self.assertIsNotNone(worker.proc.returncode)
+
+
+if __name__ == "__main__":
+    unittest.main()
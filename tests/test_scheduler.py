@@ -0,0 +1,77 @@
+import unittest
+
+from libs import model
+from libs.scheduler import Scheduler, partition
+
+
+def make_project(durations, fixtures=None):
+    "Return a project of tests with the given durations, and class fixture times."
+    project = model.UnittestProject()
+    for path, duration in durations.items():
+        project.confirm_exists(path).set_result(
+            model.TestMethod.STATUS_PASS, None, None, duration
+        )
+    for path, duration in (fixtures or {}).items():
+        project.get_node(path).fixtures["setUpClass"] = duration
+    return project
+
+
+class TestPartition(unittest.TestCase):
+    def test_parts_are_contiguous_and_similar_in_size(self):
+        self.assertEqual(partition([1, 2, 3, 4, 5], 2), [[1, 2, 3], [4, 5]])
+        self.assertEqual(partition([1, 2], 4), [[1], [2]])
+        self.assertEqual(partition([], 3), [[]])
+
+
+class TestScheduler(unittest.TestCase):
+    def test_assign_gives_the_longest_parts_out_first(self):
+        parts = [(1.0, ["d"]), (3.0, ["a"]), (2.0, ["b"]), (2.0, ["c"])]
+        makespan, assigned = Scheduler.assign(parts, 2)
+        self.assertEqual(makespan, 4.0)
+        self.assertEqual(
+            sorted(sorted(worker) for worker in assigned), [["a", "d"], ["b", "c"]]
+        )
+
+    def test_balances_by_duration(self):
+        durations = {"m.A.test_slow": 3.0}
+        durations.update(("m.B.test_%d" % index, 1.0) for index in range(3))
+        scheduler = Scheduler(make_project(durations))
+        workers = scheduler.schedule(list(durations), 2)
+        self.assertEqual(
+            sorted(workers),
+            [["m.A.test_slow"], ["m.B.test_0", "m.B.test_1", "m.B.test_2"]],
+        )
+
+    def test_tests_sharing_fixtures_stay_together(self):
+        durations = {"m.A.test_%d" % index: 0.1 for index in range(4)}
+        durations.update(("m.B.test_%d" % index, 0.1) for index in range(4))
+        scheduler = Scheduler(make_project(durations, {"m.A": 0.3}))
+        workers = scheduler.schedule(list(durations), 2)
+        self.assertEqual(len(workers), 2)
+        self.assertIn(["m.A.test_%d" % index for index in range(4)], workers)
+
+    def test_groups_whose_fixtures_dominate_are_not_split(self):
+        durations = {"m.A.test_%d" % index: 0.1 for index in range(4)}
+        durations["m.B.test_0"] = 0.1
+        scheduler = Scheduler(make_project(durations, {"m.A": 5.0}))
+        workers = scheduler.schedule(list(durations), 3)
+        self.assertIn(["m.A.test_%d" % index for index in range(4)], workers)
+
+    def test_long_groups_are_split_and_keep_their_order(self):
+        paths = ["m.A.test_%d" % index for index in range(6)]
+        scheduler = Scheduler(make_project(dict.fromkeys(paths, 1.0), {"m.A": 0.1}))
+        workers = scheduler.schedule(paths, 2)
+        self.assertEqual(len(workers), 2)
+        self.assertEqual(sorted(path for worker in workers for path in worker), paths)
+        for worker in workers:
+            self.assertEqual(worker, sorted(worker))
+            self.assertEqual(len(worker), 3)
+
+    def test_a_single_worker_runs_everything_in_order(self):
+        paths = ["m.A.test_2", "m.A.test_1"]
+        scheduler = Scheduler(make_project(dict.fromkeys(paths, 1.0)))
+        self.assertEqual(scheduler.schedule(paths, 1), [paths])
+
+
+if __name__ == "__main__":
+    unittest.main()
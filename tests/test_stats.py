@@ -0,0 +1,36 @@
+import unittest
+
+from libs.stats import DurationStats, RepeatStats
+
+
+class TestDurationStats(unittest.TestCase):
+    def test_keeps_the_slowest_tests(self):
+        stats = DurationStats(size=2)
+        for path, duration in (("a", 1.0), ("b", 3.0), ("c", 2.0)):
+            stats.add(path, duration)
+        self.assertEqual(stats.slowest(), [("b", 3.0), ("c", 2.0)])
+        self.assertEqual(stats.count, 3)
+        self.assertEqual(stats.total, 6.0)
+        self.assertEqual(sum(stats.buckets), 3)
+
+    def test_repeated_tests_can_be_listed_once(self):
+        stats = DurationStats(size=5)
+        for path, duration in (("a", 1.0), ("b", 2.0), ("a", 3.0), ("a", 0.5)):
+            stats.add(path, duration)
+        self.assertEqual(
+            stats.slowest(), [("a", 3.0), ("b", 2.0), ("a", 1.0), ("a", 0.5)]
+        )
+        self.assertEqual(stats.slowest(distinct=True), [("a", 3.0), ("b", 2.0)])
+
+
+class TestRepeatStats(unittest.TestCase):
+    def test_pass_rate_and_spread(self):
+        stats = RepeatStats()
+        for passed, duration in ((True, 1.0), (False, 3.0), (True, 2.0)):
+            stats.add(passed, duration)
+        self.assertEqual((stats.runs, stats.passed, stats.failed), (3, 2, 1))
+        self.assertAlmostEqual(stats.pass_rate, 2.0 / 3)
+
+
+if __name__ == "__main__":
+    unittest.main()